@@ -0,0 +1,208 @@
+"""Banc d'essai hors ligne du chemin MQTT -> entité de l'intégration Cerbo GX.
+
+Le banc rejoue un trafic Venus synthétique à travers le vrai `MQTTManager` /
+`CerboMQTTClient` (routeur, décodage, filtres, tampon d'écritures), le client
+paho étant remplacé par le client en mémoire de `fake_paho.py`. Home Assistant
+n'est pas nécessaire : les entités sont simulées par `BenchSensor`, qui suit le
+même chemin que `CerboSensor.on_mqtt_message`.
+
+Mesures rapportées : durée du démarrage (tous les sites connectés), messages/s,
+latence de bout en bout (injection -> écriture d'état) p50/p99, temps CPU et
+retard de la boucle d'événements.
+
+Exemples :
+    python benchmarks/bench_mqtt.py --sites 20 --paths 200 --rate 20000 --duration 10
+    python benchmarks/bench_mqtt.py --rate 0 --duration 5     # débit maximal
+    python benchmarks/bench_mqtt.py --sites 50 --connect-latency 0.3 --duration 1
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(__file__))
+from fake_paho import FakeClient  # noqa: E402
+
+# Charger les modules de l'intégration sans exécuter son __init__ (qui dépend de Home Assistant)
+_PACKAGE_DIR = os.path.join(os.path.dirname(__file__), os.pardir, "custom_components", "cerbo_gx")
+_package = types.ModuleType("cerbo_gx")
+_package.__path__ = [os.path.abspath(_PACKAGE_DIR)]
+sys.modules.setdefault("cerbo_gx", _package)
+
+from cerbo_gx import mqtt_client  # noqa: E402
+from cerbo_gx.filters import FILTER_MODES, FILTER_NONE, SensorFilter  # noqa: E402
+
+mqtt_client.mqtt.Client = FakeClient
+
+# Chemins Venus typiques, complétés par des chemins numérotés jusqu'à --paths
+BASE_PATHS = [
+    "system/0/Dc/Battery/Voltage",
+    "system/0/Dc/Battery/Current",
+    "system/0/Dc/Pv/Power",
+    "system/0/Dc/System/Power",
+    "system/0/Relay/0/State",
+    "system/0/Relay/1/State",
+]
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class BenchSensor:
+    """Entité simulée : filtre éventuel puis écriture groupée, comme CerboSensor."""
+
+    def __init__(self, stats, mqtt_client, topic, sensor_filter=None):
+        self.entity_id = f"sensor.{topic.replace('/', '_').lower()}"
+        self._stats = stats
+        self._mqtt_client = mqtt_client
+        self._topic = topic
+        self._filter = sensor_filter
+        self._state = None
+
+    def on_mqtt_message(self, topic, value):
+        if value is not None and self._filter is not None:
+            value = self._filter.process(value, time.monotonic())
+        if value is not None:
+            self._state = value
+            self._mqtt_client.schedule_state_write(self)
+
+    def async_write_ha_state(self):
+        stats = self._stats
+        stats.writes += 1
+        sent = stats.sent_at.get(self._topic)
+        if sent is not None:
+            stats.latencies.append(time.perf_counter() - sent)
+
+
+class BenchStats:
+    def __init__(self):
+        self.sent = 0
+        self.writes = 0
+        self.sent_at = {}
+        self.latencies = []
+        self.loop_lags = []
+
+
+async def _probe_loop_lag(stats, interval=0.05):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        stats.loop_lags.append(max(0.0, loop.time() - start - interval))
+
+
+def _build_traffic(site_ids, paths, variants=16):
+    """Pré-génère les topics et payloads (plusieurs valeurs par chemin)."""
+    traffic = []
+    rnd = random.Random(42)
+    for id_site in site_ids:
+        for path in paths:
+            topic = f"N/{id_site}/{path}"
+            payloads = [f'{{"value": {rnd.uniform(0, 500):.2f}}}'.encode() for _ in range(variants)]
+            traffic.append((id_site, topic, payloads))
+    return traffic
+
+
+async def run(args):
+    stats = BenchStats()
+    manager = mqtt_client.MQTTManager()
+    site_ids = [f"bench{i:04d}" for i in range(args.sites)]
+    paths = (BASE_PATHS + [f"battery/{i}/Dc/0/Voltage" for i in range(args.paths)])[: args.paths]
+
+    FakeClient.connect_latency = args.connect_latency
+    startup = time.perf_counter()
+    for id_site in site_ids:
+        await manager.async_add_device(id_site, flush_interval=args.flush_interval)
+    while not all(manager.get_client(id_site).connected for id_site in site_ids):
+        await asyncio.sleep(0.001)
+    startup = time.perf_counter() - startup
+
+    sensors = []
+    for id_site in site_ids:
+        client = manager.get_client(id_site)
+        for path in paths:
+            topic = f"N/{id_site}/{path}"
+            sensor_filter = None
+            if args.filter_mode != FILTER_NONE:
+                sensor_filter = SensorFilter(args.filter_mode, threshold=args.filter_threshold, interval=args.filter_interval)
+            sensor = BenchSensor(stats, client, topic, sensor_filter)
+            client.add_subscription(topic, sensor.on_mqtt_message)
+            sensors.append(sensor)
+
+    traffic = _build_traffic(site_ids, paths)
+    fakes = {id_site: manager.get_client(id_site).client for id_site in site_ids}
+    probe = asyncio.get_running_loop().create_task(_probe_loop_lag(stats))
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    deadline = wall_start + args.duration
+    batch = args.batch
+    index = 0
+    perf_counter = time.perf_counter
+    sent_at = stats.sent_at
+    while True:
+        now = perf_counter()
+        if now >= deadline:
+            break
+        if args.rate:
+            due = int((now - wall_start) * args.rate) - stats.sent
+            if due <= 0:
+                await asyncio.sleep(0.001)
+                continue
+            count = min(due, batch)
+        else:
+            count = batch
+        for _ in range(count):
+            id_site, topic, payloads = traffic[index % len(traffic)]
+            index += 1
+            sent_at[topic] = perf_counter()
+            fakes[id_site].deliver(topic, payloads[index % len(payloads)])
+        stats.sent += count
+        await asyncio.sleep(0)
+
+    # Laisser le dernier lot d'écritures se vider
+    await asyncio.sleep(args.flush_interval + 0.05)
+    wall = perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    probe.cancel()
+    for id_site in site_ids:
+        await manager.async_remove_device(id_site)
+
+    lat = stats.latencies
+    lags = stats.loop_lags
+    print(f"sites={args.sites} chemins/site={len(paths)} entités={len(sensors)} débit cible={args.rate or 'max'} msg/s")
+    print(f"démarrage : {args.sites} sites connectés en {startup:.2f} s (connexion simulée : {args.connect_latency * 1000:.0f} ms)")
+    print(f"messages injectés : {stats.sent} en {wall:.2f} s -> {stats.sent / wall:,.0f} msg/s")
+    print(f"écritures d'état  : {stats.writes} ({stats.writes / max(stats.sent, 1):.1%} des messages)")
+    print(f"latence bout en bout : p50={percentile(lat, 0.5) * 1e6:.0f} µs  p99={percentile(lat, 0.99) * 1e6:.0f} µs")
+    print(f"CPU : {cpu:.2f} s ({cpu / wall:.0%} d'un cœur), {cpu / max(stats.sent, 1) * 1e6:.1f} µs/message")
+    if lags:
+        print(f"retard de boucle : moyen={statistics.mean(lags) * 1e3:.2f} ms  max={max(lags) * 1e3:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sites", type=int, default=10, help="nombre de sites simulés")
+    parser.add_argument("--paths", type=int, default=50, help="nombre de chemins publiés par site")
+    parser.add_argument("--rate", type=float, default=5000, help="messages/s injectés (0 = débit maximal)")
+    parser.add_argument("--duration", type=float, default=5, help="durée de la mesure (s)")
+    parser.add_argument("--batch", type=int, default=500, help="messages injectés au plus par tour de boucle")
+    parser.add_argument("--connect-latency", type=float, default=0, help="durée simulée de chaque connexion (s)")
+    parser.add_argument("--flush-interval", type=float, default=0, help="intervalle de vidage des écritures d'état (s)")
+    parser.add_argument("--filter-mode", choices=FILTER_MODES, default=FILTER_NONE, help="filtre appliqué à chaque capteur")
+    parser.add_argument("--filter-threshold", type=float, default=1.0)
+    parser.add_argument("--filter-interval", type=float, default=1.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
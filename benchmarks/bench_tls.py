@@ -0,0 +1,148 @@
+"""Banc d'essai du coût TLS au démarrage et à la reconnexion.
+
+Deux mesures :
+  - démarrage : création du contexte TLS pour --clients connexions, un contexte
+    par client (lecture du certificat CA à chaque fois, comme `tls_set()`)
+    contre le contexte partagé de `tls.ssl_context()` ;
+  - reconnexion : --reconnects handshakes successifs, complets contre repris
+    (session TLS conservée par `tls.ResumableContext`).
+
+Par défaut la reconnexion vise un serveur TLS local (certificat auto-signé généré
+avec `openssl`, réponse CONNACK factice) ; --host/--port visent un vrai broker.
+
+Exemples :
+    python benchmarks/bench_tls.py
+    python benchmarks/bench_tls.py --host mqtt38.victronenergy.com --port 8883 --verify
+"""
+
+import argparse
+import os
+import socket
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+
+# Charger les modules de l'intégration sans exécuter son __init__ (qui dépend de Home Assistant)
+_PACKAGE_DIR = os.path.join(os.path.dirname(__file__), os.pardir, "custom_components", "cerbo_gx")
+_package = types.ModuleType("cerbo_gx")
+_package.__path__ = [os.path.abspath(_PACKAGE_DIR)]
+sys.modules.setdefault("cerbo_gx", _package)
+
+from cerbo_gx import tls  # noqa: E402
+
+# Paquet CONNACK MQTT 3.1.1 (session absente, code 0)
+CONNACK = b"\x20\x02\x00\x00"
+
+
+def _generate_certificate(directory):
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost",
+         "-keyout", keyfile, "-out", certfile],
+        check=True,
+        capture_output=True,
+    )
+    return certfile, keyfile
+
+
+class LocalTLSServer(threading.Thread):
+    """Serveur TLS minimal : handshake, CONNACK, puis attente de la fermeture du client."""
+
+    def __init__(self, certfile, keyfile):
+        super().__init__(daemon=True)
+        self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.context.load_cert_chain(certfile, keyfile)
+        self.sock = socket.create_server(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+
+    def run(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            try:
+                with self.context.wrap_socket(conn, server_side=True) as tls_conn:
+                    tls_conn.sendall(CONNACK)
+                    while tls_conn.recv(1024):
+                        pass
+            except (OSError, ssl.SSLError):
+                pass
+
+
+def bench_startup(clients):
+    start = time.perf_counter()
+    for _ in range(clients):
+        tls._create_context(True)
+    per_client = time.perf_counter() - start
+
+    tls._contexts.clear()
+    start = time.perf_counter()
+    for _ in range(clients):
+        tls.ssl_context(True)
+    shared = time.perf_counter() - start
+
+    print(f"démarrage ({clients} clients) : un contexte par client {per_client * 1000:.1f} ms, "
+          f"contexte partagé {shared * 1000:.1f} ms")
+
+
+def _connect(host, port, context):
+    """Connexion TCP + handshake TLS + lecture du CONNACK ; retourne (durée du handshake, session reprise)."""
+    with socket.create_connection((host, port)) as raw:
+        start = time.perf_counter()
+        sock = context.wrap_socket(raw, server_hostname=host)
+        elapsed = time.perf_counter() - start
+        try:
+            sock.recv(len(CONNACK))
+            reused = context.save_session(sock) if isinstance(context, tls.ResumableContext) else False
+        finally:
+            sock.close()
+    return elapsed, reused
+
+
+def bench_reconnect(host, port, verify, reconnects):
+    shared = tls.ssl_context(verify)
+    results = {}
+    for label, context in (("complets", shared), ("repris", tls.ResumableContext(shared, host, port))):
+        durations = []
+        reused = 0
+        _connect(host, port, context)  # Première connexion : handshake complet dans les deux cas
+        for _ in range(reconnects):
+            elapsed, was_reused = _connect(host, port, context)
+            durations.append(elapsed)
+            reused += was_reused
+        results[label] = durations
+        print(f"handshakes {label:8s}: médiane {statistics.median(durations) * 1000:.2f} ms, "
+              f"moyenne {statistics.mean(durations) * 1000:.2f} ms, sessions reprises {reused}/{reconnects}")
+    saving = 1 - statistics.median(results["repris"]) / statistics.median(results["complets"])
+    print(f"gain de la reprise de session : {saving:.0%} du temps de handshake")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=100, help="nombre de clients créés au démarrage")
+    parser.add_argument("--reconnects", type=int, default=50, help="nombre de reconnexions mesurées")
+    parser.add_argument("--host", help="broker à utiliser au lieu du serveur local")
+    parser.add_argument("--port", type=int, default=8883)
+    parser.add_argument("--verify", action="store_true", help="vérifier le certificat avec la CA Victron")
+    args = parser.parse_args()
+
+    bench_startup(args.clients)
+    if args.host:
+        bench_reconnect(args.host, args.port, args.verify, args.reconnects)
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        server = LocalTLSServer(*_generate_certificate(directory))
+        server.start()
+        bench_reconnect("127.0.0.1", server.port, False, args.reconnects)
+        server.sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Client paho en mémoire pour exécuter CerboMQTTClient sans broker ni réseau.
+
+Le client factice implémente le sous-ensemble de l'API `paho.mqtt.client.Client`
+utilisé par l'intégration ; les messages sont injectés avec `deliver()` et passent
+par le même `on_message` que ceux reçus d'un vrai broker.
+
+La connexion passe par une paire de sockets locale : comme avec paho, le CONNACK
+est lu par `loop_read()` depuis la boucle, et `connect_latency` simule la durée
+de la partie bloquante de `connect()` (DNS, TCP, TLS).
+"""
+
+import itertools
+import socket
+import time
+
+MQTT_ERR_SUCCESS = 0
+MQTT_ERR_NO_CONN = 4
+
+
+class FakeMQTTMessage:
+    __slots__ = ("topic", "payload", "qos", "retain", "mid", "timestamp")
+
+    def __init__(self, topic, payload, timestamp=0.0):
+        self.topic = topic
+        self.payload = payload
+        self.qos = 0
+        self.retain = False
+        self.mid = 0
+        self.timestamp = timestamp
+
+
+class FakeClient:
+    """Remplace `paho.mqtt.client.Client` : aucun réseau, connexion locale."""
+
+    connect_latency = 0.0
+
+    def __init__(self, client_id="", *args, **kwargs):
+        self.client_id = client_id
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+        self.on_subscribe = None
+        self.on_socket_open = None
+        self.on_socket_close = None
+        self.on_socket_register_write = None
+        self.on_socket_unregister_write = None
+        self.connected = False
+        self._sock = None
+        self._peer = None
+        self.subscribe_packets = 0
+        self.published = 0
+        self.subscriptions = set()
+        self._mid = itertools.count(1)
+
+    # Configuration
+    def username_pw_set(self, username, password=None):
+        pass
+
+    def tls_set(self, *args, **kwargs):
+        pass
+
+    def tls_set_context(self, context=None):
+        pass
+
+    def tls_insecure_set(self, value):
+        pass
+
+    def reconnect_delay_set(self, min_delay=1, max_delay=120):
+        pass
+
+    # Connexion
+    def connect(self, host, port=1883, keepalive=60, *args, **kwargs):
+        if self.connect_latency:
+            time.sleep(self.connect_latency)
+        self._sock, self._peer = socket.socketpair()
+        self._sock.setblocking(False)
+        if self.on_socket_open is not None:
+            self.on_socket_open(self, None, self._sock)
+        self._peer.send(b"\x20")  # CONNACK, lu par loop_read()
+        return MQTT_ERR_SUCCESS
+
+    def reconnect(self):
+        return self.connect(None)
+
+    def disconnect(self, *args, **kwargs):
+        if self._sock is None:
+            return MQTT_ERR_NO_CONN
+        self._close(MQTT_ERR_SUCCESS)
+        return MQTT_ERR_SUCCESS
+
+    def drop(self):
+        """Simule une perte de connexion côté broker."""
+        if self._sock is not None:
+            self._close(MQTT_ERR_NO_CONN)
+
+    def _close(self, rc):
+        sock, self._sock = self._sock, None
+        if self.on_socket_close is not None:
+            self.on_socket_close(self, None, sock)
+        sock.close()
+        self._peer.close()
+        self.connected = False
+        if self.on_disconnect is not None:
+            self.on_disconnect(self, None, rc)
+
+    def is_connected(self):
+        return self.connected
+
+    def socket(self):
+        return self._sock
+
+    def loop_read(self, max_packets=1):
+        if self._sock is None:
+            return MQTT_ERR_NO_CONN
+        try:
+            data = self._sock.recv(64)
+        except BlockingIOError:
+            return MQTT_ERR_SUCCESS
+        if not data:
+            self._close(MQTT_ERR_NO_CONN)
+            return MQTT_ERR_NO_CONN
+        if not self.connected:
+            self.connected = True
+            if self.on_connect is not None:
+                self.on_connect(self, None, {"session present": 0}, 0)
+        return MQTT_ERR_SUCCESS
+
+    def loop_write(self, max_packets=1):
+        return MQTT_ERR_SUCCESS
+
+    def loop_misc(self):
+        return MQTT_ERR_SUCCESS if self.connected else MQTT_ERR_NO_CONN
+
+    # Messages
+    def subscribe(self, topic, qos=0, *args, **kwargs):
+        self.subscribe_packets += 1
+        topics = topic if isinstance(topic, list) else [(topic, qos)]
+        for name, _ in topics:
+            self.subscriptions.add(name)
+        return MQTT_ERR_SUCCESS, next(self._mid)
+
+    def unsubscribe(self, topic, *args, **kwargs):
+        self.subscribe_packets += 1
+        for name in topic if isinstance(topic, list) else [topic]:
+            self.subscriptions.discard(name)
+        return MQTT_ERR_SUCCESS, next(self._mid)
+
+    def publish(self, topic, payload=None, qos=0, retain=False, *args, **kwargs):
+        self.published += 1
+        return _FakeMessageInfo(next(self._mid))
+
+    def deliver(self, topic, payload, timestamp=0.0):
+        """Injecte un message comme s'il venait du broker."""
+        self.on_message(self, None, FakeMQTTMessage(topic, payload, timestamp))
+
+
+class _FakeMessageInfo:
+    __slots__ = ("mid", "rc")
+
+    def __init__(self, mid):
+        self.mid = mid
+        self.rc = MQTT_ERR_SUCCESS
+
+    def is_published(self):
+        return True
@@ -1,56 +1,185 @@
 import logging
-from homeassistant.core import HomeAssistant
+import time
+from functools import partial
+import voluptuous as vol
+from homeassistant.core import Event, HomeAssistant
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.exceptions import ConfigEntryNotReady
+from homeassistant.helpers import entity_registry as er
 from homeassistant.helpers.typing import ConfigType
-from homeassistant.const import Platform
-from .mqtt_client import MQTTManager
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP, Platform
+from .endpoints import lan_endpoint, modbus_endpoint, vrm_endpoint
+from .transport import TRANSPORT_HA_MQTT, TRANSPORT_MODBUS, TRANSPORT_MQTT
+from .const import (
+    CONF_CONNECTION_MODE,
+    CONF_FALLBACK_VRM,
+    CONF_HOST,
+    CONF_PORT,
+    CONF_TLS,
+    CONNECTION_HA_MQTT,
+    CONNECTION_LAN,
+    CONNECTION_MODBUS,
+    CONF_DISCOVERY,
+    CONF_FLUSH_INTERVAL,
+    CONF_RECORD_TRAFFIC,
+    DEFAULT_DISCOVERY,
+    DEFAULT_FLUSH_INTERVAL,
+    DEFAULT_RECORD_TRAFFIC,
+    CONF_INGEST_WORKERS,
+    DEFAULT_INGEST_WORKERS,
+    MAX_INGEST_WORKERS,
+    DATA_MANAGER,
+    SETUP_TIME_BUDGET,
+)
+from .descriptors import DISCOVERY_DESCRIPTIONS
+from .discovery import SiteDiscovery
+from .registry import RegistryTracker
+from .snapshot import SiteSnapshot
+from .services import async_register_services
 
 DOMAIN = "cerbo_gx"
 PLATFORMS = [Platform.SENSOR, Platform.SWITCH]
 _LOGGER = logging.getLogger(__name__)
 
-# Instancier le gestionnaire de clients MQTT
-mqtt_manager = MQTTManager()
+CONFIG_SCHEMA = vol.Schema(
+    {
+        vol.Optional(DOMAIN): vol.Schema({
+            vol.Optional(CONF_INGEST_WORKERS, default=DEFAULT_INGEST_WORKERS): vol.All(
+                vol.Coerce(int), vol.Range(min=0, max=MAX_INGEST_WORKERS)
+            ),
+        }),
+    },
+    extra=vol.ALLOW_EXTRA,
+)
+
+def _create_manager(workers):
+    """Importe le client MQTT (paho, ssl...) et crée le gestionnaire ; exécuté hors de la boucle.
+
+    Les processus d'ingestion éventuels sont lancés ici.
+    """
+    from .mqtt_client import MQTTManager
+
+    return MQTTManager(workers=workers)
 
 async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
     """Configurer l'intégration Cerbo GX."""
     hass.data.setdefault(DOMAIN, {})
+    # Un gestionnaire de clients MQTT par instance de Home Assistant ; l'import de
+    # paho et la création du gestionnaire se font dans l'exécuteur
+    if DATA_MANAGER not in hass.data:
+        workers = config.get(DOMAIN, {}).get(CONF_INGEST_WORKERS, DEFAULT_INGEST_WORKERS)
+        manager = hass.data[DATA_MANAGER] = await hass.async_add_executor_job(_create_manager, workers)
+        if workers:
+            _LOGGER.info("Sites répartis entre %d processus d'ingestion", workers)
+
+            async def async_shutdown(event: Event) -> None:
+                await manager.async_shutdown()
+
+            hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_shutdown)
+    async_register_services(hass, hass.data[DATA_MANAGER])
     return True
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Configurer une entrée de configuration pour Cerbo GX."""
+    started = time.perf_counter()
+    mqtt_manager = hass.data[DATA_MANAGER]
     hass.data[DOMAIN][entry.entry_id] = {}
 
     # Récupérer les informations de configuration
     device_name = entry.data["device_name"]
     id_site = entry.data["cerbo_id"]
-    username = entry.data["username"]
-    password = entry.data["password"]
+    username = entry.data.get("username")
+    password = entry.data.get("password")
+    endpoints = _get_endpoints(entry)
+    transport = TRANSPORT_MODBUS if entry.data.get(CONF_CONNECTION_MODE) == CONNECTION_MODBUS else TRANSPORT_MQTT
+    factory = None
+    if entry.data.get(CONF_CONNECTION_MODE) == CONNECTION_HA_MQTT:
+        # Le site passe par l'intégration MQTT de Home Assistant : elle doit être prête
+        from homeassistant.components import mqtt
+        from .ha_mqtt import HAMQTTSiteClient
+
+        if not await mqtt.async_wait_for_mqtt_client(hass):
+            raise ConfigEntryNotReady("L'intégration MQTT de Home Assistant n'est pas disponible")
+        transport = TRANSPORT_HA_MQTT
+        factory = partial(HAMQTTSiteClient, hass)
+    flush_interval = entry.options.get(CONF_FLUSH_INTERVAL, DEFAULT_FLUSH_INTERVAL)
+    record_path = None
+    if entry.options.get(CONF_RECORD_TRAFFIC, DEFAULT_RECORD_TRAFFIC):
+        record_path = hass.config.path(f"cerbo_gx_{id_site}.traffic")
 
-    # Vérifier si un client MQTT existe déjà pour ce site
-    existing_client = mqtt_manager.get_client(id_site)
-    if existing_client:
-        _LOGGER.warning(f"Le client MQTT pour le site {id_site} existe déjà. Suppression et recréation.")
-        # Si un client existe, le supprimer avant de le recréer
-        mqtt_manager.remove_device(id_site)
+    # Dernières valeurs connues du site : les entités les affichent sans attendre la connexion
+    snapshot = SiteSnapshot(hass, id_site)
+    await snapshot.async_load()
+    hass.data[DOMAIN][entry.entry_id]["snapshot"] = snapshot
 
-    # Ajouter un client MQTT via le gestionnaire
+    # Ajouter un client MQTT via le gestionnaire ; la connexion s'établit en arrière-plan,
+    # en parallèle des autres sites, et un client identique déjà présent est réutilisé
     try:
-        # Ajouter le client avec l'ID du site et les informations de connexion
-        mqtt_manager.add_device(id_site, client_id=device_name, username=username, password=password)
-        _LOGGER.info("Connexion au serveur MQTT réussie pour %s", device_name)
+        mqtt_client = await mqtt_manager.async_add_device(
+            id_site,
+            client_id=device_name,
+            username=username,
+            password=password,
+            flush_interval=flush_interval,
+            record_path=record_path,
+            endpoints=endpoints,
+            transport=transport,
+            factory=factory,
+        )
+        _LOGGER.info("Client MQTT démarré pour %s", device_name)
     except Exception as e:
-        _LOGGER.error("Échec de la connexion au serveur MQTT pour %s : %s", device_name, str(e))
+        _LOGGER.error("Échec du démarrage du client MQTT pour %s : %s", device_name, str(e))
         return False
 
     # Stocker le client MQTT dans l'intégration sous l'entry_id
-    hass.data[DOMAIN][entry.entry_id]["mqtt_client"] = mqtt_manager.get_client(id_site)
+    hass.data[DOMAIN][entry.entry_id]["mqtt_client"] = mqtt_client
+
+    # Indexer l'arbre du site pour créer les entités des chemins réellement publiés
+    if entry.options.get(CONF_DISCOVERY, DEFAULT_DISCOVERY):
+        discovery = SiteDiscovery(mqtt_client, DISCOVERY_DESCRIPTIONS)
+        discovery.restore(snapshot.items())
+        discovery.start()
+        hass.data[DOMAIN][entry.entry_id]["discovery"] = discovery
+
+    # Recréer (et réabonner) sans attendre les entités réactivées dans le registre
+    tracker = RegistryTracker(hass, entry.entry_id)
+    hass.data[DOMAIN][entry.entry_id]["registry_tracker"] = tracker
+    entry.async_on_unload(hass.bus.async_listen(er.EVENT_ENTITY_REGISTRY_UPDATED, tracker.async_registry_updated))
 
     # Configurer les entités associées via la plateforme "sensor"
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
+    # Recharger l'entrée lorsque ses options sont modifiées
+    entry.async_on_unload(entry.add_update_listener(async_reload_entry))
+
+    # La connexion se fait en arrière-plan : la mise en place elle-même doit rester brève
+    setup_time = time.perf_counter() - started
+    hass.data[DOMAIN][entry.entry_id]["setup_time"] = setup_time
+    if setup_time > SETUP_TIME_BUDGET:
+        _LOGGER.warning("Mise en place de %s en %.2f s (budget : %.2f s)", device_name, setup_time, SETUP_TIME_BUDGET)
+    else:
+        _LOGGER.debug("Mise en place de %s en %.3f s", device_name, setup_time)
+
     return True
 
+def _get_endpoints(entry: ConfigEntry) -> list:
+    """Brokers MQTT (ou serveur Modbus-TCP) de l'entrée, par ordre de préférence."""
+    id_site = entry.data["cerbo_id"]
+    if entry.data.get(CONF_CONNECTION_MODE) == CONNECTION_MODBUS:
+        return [modbus_endpoint(entry.data[CONF_HOST], entry.data.get(CONF_PORT))]
+    if entry.data.get(CONF_CONNECTION_MODE) == CONNECTION_HA_MQTT:
+        return None  # Broker de l'intégration MQTT de Home Assistant
+    if entry.data.get(CONF_CONNECTION_MODE) != CONNECTION_LAN:
+        return [vrm_endpoint(id_site)]
+    endpoints = [lan_endpoint(entry.data[CONF_HOST], entry.data.get(CONF_PORT), entry.data.get(CONF_TLS, False))]
+    if entry.data.get(CONF_FALLBACK_VRM) and entry.data.get("username"):
+        endpoints.append(vrm_endpoint(id_site))
+    return endpoints
+
+async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Recharger une entrée après modification de ses options."""
+    await hass.config_entries.async_reload(entry.entry_id)
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Décharger une entrée de configuration."""
     # Décharger les plateformes associées (e.g., sensors)
@@ -58,10 +187,16 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 
     # Déconnexion et nettoyage
     if entry.entry_id in hass.data[DOMAIN]:
+        discovery = hass.data[DOMAIN][entry.entry_id].get("discovery")
+        if discovery:
+            discovery.stop()
         mqtt_client = hass.data[DOMAIN][entry.entry_id].get("mqtt_client")
         if mqtt_client:
-            # Arrêter la boucle de MQTT et se déconnecter proprement
-            mqtt_client.disconnect()
+            # Arrêter le client (tâches et socket) et se déconnecter proprement
+            await hass.data[DATA_MANAGER].async_remove_device(mqtt_client.id_site)
+        snapshot = hass.data[DOMAIN][entry.entry_id].get("snapshot")
+        if snapshot:
+            await snapshot.async_save()
         del hass.data[DOMAIN][entry.entry_id]
 
     return True
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import logging
+from functools import lru_cache
+
+_LOGGER = logging.getLogger(__name__)
+
+# Délai (s) d'attente de l'écho `N/...` confirmant une écriture
+COMMAND_TIMEOUT = 5.0
+
+
+def relay_path(relay_index):
+    """Chemin Venus de l'état d'un relais du GX."""
+    return f"system/0/Relay/{relay_index}/State"
+
+
+@lru_cache(maxsize=64)
+def serialize_value(value):
+    """Payload d'écriture Venus, sérialisé une seule fois par valeur."""
+    return json.dumps({"value": value}).encode()
+
+
+class CommandTracker:
+    """Écritures `W/{id_site}/...` d'un site, suivies jusqu'à leur écho `N/{id_site}/...`.
+
+    Chaque chemin est écouté une fois pour toutes, dès que l'entité qui le
+    commande s'abonne (`watch()`) ou au plus tard à la première écriture ; la
+    dernière valeur publiée par Venus y est mémorisée. Une écriture est confirmée lorsque l'écho
+    porte la valeur demandée, ou aussitôt si c'est déjà la valeur connue (Venus
+    ne republie pas une valeur inchangée). Sans écho après `timeout` secondes,
+    elle est déclarée en échec.
+    """
+
+    def __init__(self, mqtt_client, timeout=COMMAND_TIMEOUT):
+        self._client = mqtt_client
+        self.timeout = timeout
+        self._prefix = f"N/{mqtt_client.id_site}/"
+        self._write_prefix = f"W/{mqtt_client.id_site}/"
+        self._watched = set()
+        self._values = {}  # chemin -> dernière valeur publiée par Venus
+        self._pending = {}  # chemin -> [(valeur attendue, instant d'envoi, future), ...]
+
+    def last_value(self, path):
+        """Dernière valeur confirmée par Venus pour un chemin (None si inconnue)."""
+        return self._values.get(path)
+
+    def pending_value(self, path):
+        """Valeur de la dernière écriture en attente sur ce chemin, ou None."""
+        pending = self._pending.get(path)
+        return pending[-1][0] if pending else None
+
+    async def async_write(self, path, value, timeout=None):
+        """Écrit une valeur et attend sa confirmation ; retourne la durée de l'aller-retour (s).
+
+        Lève asyncio.TimeoutError si l'écho n'arrive pas à temps.
+        """
+        loop = asyncio.get_running_loop()
+        self.watch(path)
+        future = loop.create_future()
+        command = (value, loop.time(), future)
+        self._pending.setdefault(path, []).append(command)
+        self._client.publish(self._write_prefix + path, serialize_value(value))
+        if self._values.get(path) == value:
+            self._confirm(path, value, measured=False)  # Déjà la valeur courante : aucun écho à attendre
+        try:
+            return await asyncio.wait_for(future, timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self._client.metrics.command_timeouts += 1
+            _LOGGER.warning(f"Site {self._client.id_site} : aucune confirmation de l'écriture {path} = {value}")
+            raise
+        finally:
+            pending = self._pending.get(path)
+            if pending is not None and command in pending:
+                pending.remove(command)
+                if not pending:
+                    del self._pending[path]
+
+    def watch(self, path):
+        """Écoute un chemin, pour connaître sa valeur courante avant la première écriture."""
+        if path not in self._watched:
+            self._watched.add(path)
+            self._client.add_subscription(self._prefix + path, self._on_echo)
+
+    def close(self):
+        """Cesse d'écouter les chemins et abandonne les écritures en attente."""
+        for path in self._watched:
+            self._client.remove_subscription(self._prefix + path, self._on_echo)
+        self._watched.clear()
+        for pending in self._pending.values():
+            for _, _, future in pending:
+                if not future.done():
+                    future.set_exception(ConnectionError("client MQTT arrêté"))
+        self._pending.clear()
+
+    def _on_echo(self, topic, value):
+        path = topic[len(self._prefix):]
+        self._values[path] = value
+        self._confirm(path, value)
+
+    def _confirm(self, path, value, measured=True):
+        pending = self._pending.get(path)
+        if not pending:
+            return
+        now = asyncio.get_running_loop().time()
+        for expected, sent_at, future in pending:
+            if expected == value and not future.done():
+                latency = now - sent_at
+                if measured:
+                    self._client.metrics.command_rtt.observe(latency)
+                future.set_result(latency)
@@ -1,13 +1,50 @@
 from homeassistant import config_entries
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 import voluptuous as vol
 from homeassistant.helpers import config_validation as cv
 from . import DOMAIN
+from .const import (
+    CONF_CONNECTION_MODE,
+    CONF_FALLBACK_VRM,
+    CONF_HOST,
+    CONF_PORT,
+    CONF_TLS,
+    CONNECTION_HA_MQTT,
+    CONNECTION_LAN,
+    CONNECTION_MODBUS,
+    CONNECTION_MODES,
+    CONNECTION_VRM,
+    CONF_DISCOVERY,
+    CONF_FLUSH_INTERVAL,
+    CONF_RECORD_TRAFFIC,
+    DEFAULT_DISCOVERY,
+    DEFAULT_FLUSH_INTERVAL,
+    DEFAULT_RECORD_TRAFFIC,
+)
+from .filters import (
+    CONF_FILTER_HEARTBEAT,
+    CONF_FILTER_INTERVAL,
+    CONF_FILTER_MODE,
+    CONF_FILTER_THRESHOLD,
+    DEFAULT_FILTER_HEARTBEAT,
+    DEFAULT_FILTER_INTERVAL,
+    DEFAULT_FILTER_THRESHOLD,
+    FILTER_MODES,
+    FILTER_NONE,
+    FILTER_SENSOR_TYPES,
+)
+from .history import CONF_HISTORY_WINDOW, DEFAULT_HISTORY_WINDOW
 
 
 class CerboGXConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     """Gérer un flux de configuration pour Cerbo GX."""
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        """Retourner le flux d'options de l'intégration."""
+        return CerboGXOptionsFlow()
+
     async def async_step_user(self, user_input=None):
         """Gérer la première étape de l'ajout de l'intégration."""
         if user_input is None:
@@ -15,6 +52,7 @@ class CerboGXConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             data_schema = vol.Schema({
                 vol.Required("device_name"): cv.string,
                 vol.Required("cerbo_id"): cv.string,
+                vol.Required(CONF_CONNECTION_MODE, default=CONNECTION_VRM): vol.In(CONNECTION_MODES),
             })
 
             return self.async_show_form(
@@ -25,10 +63,60 @@ class CerboGXConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         # Stocker les informations pour l'étape suivante
         self.context["device_name"] = user_input["device_name"]
         self.context["cerbo_id"] = user_input["cerbo_id"]
+        self.context[CONF_CONNECTION_MODE] = user_input[CONF_CONNECTION_MODE]
 
         # Passer à l'étape suivante
+        if user_input[CONF_CONNECTION_MODE] == CONNECTION_LAN:
+            return await self.async_step_lan()
+        if user_input[CONF_CONNECTION_MODE] == CONNECTION_MODBUS:
+            return await self.async_step_modbus()
+        if user_input[CONF_CONNECTION_MODE] == CONNECTION_HA_MQTT:
+            # Broker et identifiants sont ceux de l'intégration MQTT de Home Assistant
+            return self._create_entry({})
         return await self.async_step_credentials()
 
+    async def async_step_lan(self, user_input=None):
+        """Gérer l'étape de connexion directe au broker MQTT local du GX."""
+        if user_input is None:
+            return self.async_show_form(
+                step_id="lan",
+                data_schema=vol.Schema({
+                    vol.Required(CONF_HOST): cv.string,
+                    vol.Optional(CONF_PORT): cv.port,
+                    vol.Required(CONF_TLS, default=False): cv.boolean,
+                    vol.Required(CONF_FALLBACK_VRM, default=True): cv.boolean,
+                }),
+                description_placeholders={
+                    "device_name": self.context.get("device_name"),
+                    "cerbo_id": self.context.get("cerbo_id"),
+                }
+            )
+
+        self.context["lan"] = user_input
+
+        # Les identifiants VRM ne sont nécessaires que pour le repli
+        if user_input[CONF_FALLBACK_VRM]:
+            return await self.async_step_credentials()
+        return self._create_entry({})
+
+    async def async_step_modbus(self, user_input=None):
+        """Gérer l'étape de scrutation Modbus-TCP du GX (sans MQTT ni identifiants VRM)."""
+        if user_input is None:
+            return self.async_show_form(
+                step_id="modbus",
+                data_schema=vol.Schema({
+                    vol.Required(CONF_HOST): cv.string,
+                    vol.Optional(CONF_PORT): cv.port,
+                }),
+                description_placeholders={
+                    "device_name": self.context.get("device_name"),
+                    "cerbo_id": self.context.get("cerbo_id"),
+                }
+            )
+
+        self.context["modbus"] = user_input
+        return self._create_entry({})
+
     async def async_step_credentials(self, user_input=None):
         """Gérer l'étape où l'utilisateur entre ses informations de connexion."""
         if user_input is None:
@@ -45,19 +133,76 @@ class CerboGXConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 }
             )
 
+        return self._create_entry({
+            "username": user_input["username"],
+            "password": user_input["password"],
+        })
+
+    def _create_entry(self, credentials):
+        """Enregistrer directement l'entrée sans tentative de connexion."""
         # Récupérer les informations des étapes précédentes
         device_name = self.context.get("device_name")
-        cerbo_id = self.context.get("cerbo_id")
-        username = user_input["username"]
-        password = user_input["password"]
+        data = {
+            "device_name": device_name,
+            "cerbo_id": self.context.get("cerbo_id"),
+            CONF_CONNECTION_MODE: self.context.get(CONF_CONNECTION_MODE, CONNECTION_VRM),
+            **credentials,
+        }
+        if data[CONF_CONNECTION_MODE] == CONNECTION_LAN:
+            data.update(self.context["lan"])
+        elif data[CONF_CONNECTION_MODE] == CONNECTION_MODBUS:
+            data.update(self.context["modbus"])
 
-        # Enregistrer directement l'entrée sans tentative de connexion
         return self.async_create_entry(
             title=device_name,
-            data={
-                "device_name": device_name,
-                "cerbo_id": cerbo_id,
-                "username": username,
-                "password": password,
-            }
+            data=data,
+        )
+
+
+class CerboGXOptionsFlow(config_entries.OptionsFlow):
+    """Gérer les options d'une entrée Cerbo GX (l'entrée est fournie par `self.config_entry`)."""
+
+    async def async_step_init(self, user_input=None):
+        """Afficher et enregistrer les options."""
+        if user_input is not None:
+            return self.async_create_entry(title="", data=user_input)
+
+        options = self.config_entry.options
+        schema = {
+            vol.Optional(
+                CONF_FLUSH_INTERVAL,
+                default=options.get(CONF_FLUSH_INTERVAL, DEFAULT_FLUSH_INTERVAL),
+            ): vol.All(vol.Coerce(float), vol.Range(min=0, max=60)),
+            vol.Optional(
+                CONF_DISCOVERY,
+                default=options.get(CONF_DISCOVERY, DEFAULT_DISCOVERY),
+            ): cv.boolean,
+            vol.Optional(
+                CONF_RECORD_TRAFFIC,
+                default=options.get(CONF_RECORD_TRAFFIC, DEFAULT_RECORD_TRAFFIC),
+            ): cv.boolean,
+        }
+        # Filtre de chaque type de capteur : mode, seuil et intervalle/fenêtre
+        for sensor_type in FILTER_SENSOR_TYPES:
+            mode_key = CONF_FILTER_MODE.format(sensor_type)
+            threshold_key = CONF_FILTER_THRESHOLD.format(sensor_type)
+            interval_key = CONF_FILTER_INTERVAL.format(sensor_type)
+            schema[vol.Optional(mode_key, default=options.get(mode_key, FILTER_NONE))] = vol.In(FILTER_MODES)
+            schema[vol.Optional(threshold_key, default=options.get(threshold_key, DEFAULT_FILTER_THRESHOLD))] = vol.All(
+                vol.Coerce(float), vol.Range(min=0)
+            )
+            schema[vol.Optional(interval_key, default=options.get(interval_key, DEFAULT_FILTER_INTERVAL))] = vol.All(
+                vol.Coerce(float), vol.Range(min=0)
+            )
+        schema[vol.Optional(CONF_FILTER_HEARTBEAT, default=options.get(CONF_FILTER_HEARTBEAT, DEFAULT_FILTER_HEARTBEAT))] = vol.All(
+            vol.Coerce(float), vol.Range(min=0)
+        )
+        # Fenêtre (minutes) des statistiques glissantes des tensions, courants et puissances
+        schema[vol.Optional(CONF_HISTORY_WINDOW, default=options.get(CONF_HISTORY_WINDOW, DEFAULT_HISTORY_WINDOW))] = vol.All(
+            vol.Coerce(float), vol.Range(min=0, max=1440)
+        )
+
+        return self.async_show_form(
+            step_id="init",
+            data_schema=vol.Schema(schema),
         )
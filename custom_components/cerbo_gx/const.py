@@ -4,4 +4,37 @@ DOMAIN = "cerbo_gx"
 CONF_DEVICE_NAME = "device_name"
 CONF_CERBO_ID = "cerbo_id"
 CONF_USERNAME = "username"
-CONF_PASSWORD = "password"
\ No newline at end of file
+CONF_PASSWORD = "password"
+# Mode de connexion : broker VRM (cloud), broker MQTT local du GX, scrutation
+# Modbus-TCP du GX (installations où MQTT est désactivé), ou broker de Home
+# Assistant (intégration MQTT) vers lequel le GX ou VRM est déjà relayé
+CONF_CONNECTION_MODE = "connection_mode"
+CONNECTION_VRM = "vrm"
+CONNECTION_LAN = "lan"
+CONNECTION_MODBUS = "modbus"
+CONNECTION_HA_MQTT = "ha_mqtt"
+CONNECTION_MODES = [CONNECTION_VRM, CONNECTION_LAN, CONNECTION_MODBUS, CONNECTION_HA_MQTT]
+CONF_HOST = "host"
+CONF_PORT = "port"
+CONF_TLS = "tls"
+# Repli sur VRM lorsque le broker local est injoignable
+CONF_FALLBACK_VRM = "fallback_vrm"
+# Options de l'intégration
+CONF_FLUSH_INTERVAL = "flush_interval"
+# Intervalle (s) de vidage des écritures d'état ; 0 = au prochain tour de boucle
+DEFAULT_FLUSH_INTERVAL = 0
+CONF_DISCOVERY = "discovery"
+# Découverte automatique des valeurs du site (batteries, MPPT, onduleurs, cuves...)
+DEFAULT_DISCOVERY = True
+CONF_RECORD_TRAFFIC = "record_traffic"
+# Enregistrement du trafic MQTT brut du site (journal binaire, voir traffic_log.py)
+DEFAULT_RECORD_TRAFFIC = False
+# Configuration YAML : nombre de processus d'ingestion entre lesquels répartir les sites
+# (0 = tout dans le processus de Home Assistant), pour les parcs de plusieurs centaines de sites
+CONF_INGEST_WORKERS = "ingest_workers"
+DEFAULT_INGEST_WORKERS = 0
+MAX_INGEST_WORKERS = 32
+# Gestionnaire des clients MQTT, un par instance de Home Assistant (clé de hass.data)
+DATA_MANAGER = f"{DOMAIN}_manager"
+# Durée (s) au-delà de laquelle la mise en place d'une entrée est signalée comme lente
+SETUP_TIME_BUDGET = 0.5
@@ -0,0 +1,52 @@
+import json
+import logging
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:  # orjson est fourni par Home Assistant, mais reste optionnel
+    orjson = None
+
+_LOGGER = logging.getLogger(__name__)
+
+# Types scalaires acceptés comme valeur directe dans {"value": ...}
+SCALAR_TYPES = (int, float, str, bool)
+
+if orjson is not None:
+    loads = orjson.loads
+    DecodeError = orjson.JSONDecodeError
+else:
+    loads = json.loads
+    DecodeError = json.JSONDecodeError
+
+
+def decode_payload(payload):
+    """Décode un payload Venus (JSON) ; retourne None pour un payload vide."""
+    if not payload:
+        return None
+    return loads(payload)
+
+
+@lru_cache(maxsize=None)
+def compile_value_path(value_key=""):
+    """Compile un extracteur de valeur pour un payload Venus décodé.
+
+    Les extracteurs sont partagés : deux abonnés utilisant la même clé reçoivent
+    la même fonction, ce qui permet au client de n'extraire la valeur qu'une fois.
+    """
+
+    def extract(payload):
+        if not isinstance(payload, dict):
+            return None
+        value = payload.get("value")
+        # Si "value" n'est pas une liste, mais une valeur directe
+        if isinstance(value, SCALAR_TYPES):
+            return value
+        # Vérifie si "value" est une liste avec des données
+        if isinstance(value, list) and value:
+            sensor_data = value[0]
+            if isinstance(sensor_data, dict):
+                return sensor_data.get(value_key)
+        return None
+
+    return extract
@@ -0,0 +1,72 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from homeassistant.components.sensor import SensorDeviceClass, SensorStateClass
+from .const import DOMAIN
+
+
+@dataclass(frozen=True)
+class CerboSensorDescription:
+    """Description d'une valeur Venus exposée comme capteur.
+
+    `topic` est relatif au site (`N/{id_site}/`) et peut contenir un joker `+`
+    pour l'instance du service ; `name` peut alors utiliser `{instance}`.
+    Pour les capteurs fixes, `key` sert de suffixe à l'identifiant unique.
+    """
+
+    key: str
+    topic: str
+    name: str
+    device_class: str = None
+    unit: str = None
+    precision: int = None
+    state_class: str = SensorStateClass.MEASUREMENT
+    value_key: str = ""
+
+    def instance(self, relative_topic):
+        """Retourne l'instance (niveau `+`) d'un topic relatif correspondant à la description."""
+        for pattern, level in zip(self.topic.split("/"), relative_topic.split("/")):
+            if pattern == "+":
+                return level
+        return ""
+
+
+@lru_cache(maxsize=None)
+def site_device_info(id_site, device_name):
+    """Informations de l'appareil d'un site, partagées par toutes ses entités (à ne pas modifier)."""
+    return {
+        "identifiers": {(DOMAIN, id_site)},
+        "name": device_name,
+        "manufacturer": "Victron Energy",
+        "model": "Cerbo GX",
+    }
+
+
+# Capteurs créés pour chaque site ; ajouter une valeur revient à ajouter une ligne
+SENSOR_DESCRIPTIONS = (
+    CerboSensorDescription("voltage", "system/0/Dc/Battery/Voltage", "Voltage", SensorDeviceClass.VOLTAGE, "V", 2, state_class=None),
+    CerboSensorDescription("solaire", "system/0/Dc/Pv/Power", "Power solaire", SensorDeviceClass.POWER, "W", 2, state_class=None),
+    CerboSensorDescription("power", "system/0/Dc/System/Power", "Power", SensorDeviceClass.POWER, "W", 2, state_class=None),
+    CerboSensorDescription("amperage", "system/0/Dc/Battery/Current", "Amperage", SensorDeviceClass.CURRENT, "A", 2, state_class=None),
+    CerboSensorDescription("relay_state", "system/0/Relay/0/State", "Relay State", "relay", "", state_class=None),
+    CerboSensorDescription("relay_state_2", "system/0/Relay/1/State", "Relay State 2", "relay", "", state_class=None),
+)
+
+# Valeurs découvertes automatiquement dans l'arbre du site (voir discovery.py)
+DISCOVERY_DESCRIPTIONS = (
+    CerboSensorDescription("battery_voltage", "battery/+/Dc/0/Voltage", "Battery {instance} Voltage", SensorDeviceClass.VOLTAGE, "V", 2),
+    CerboSensorDescription("battery_current", "battery/+/Dc/0/Current", "Battery {instance} Current", SensorDeviceClass.CURRENT, "A", 2),
+    CerboSensorDescription("battery_power", "battery/+/Dc/0/Power", "Battery {instance} Power", SensorDeviceClass.POWER, "W", 0),
+    CerboSensorDescription("battery_soc", "battery/+/Soc", "Battery {instance} SOC", SensorDeviceClass.BATTERY, "%", 1),
+    CerboSensorDescription("battery_temperature", "battery/+/Dc/0/Temperature", "Battery {instance} Temperature", SensorDeviceClass.TEMPERATURE, "°C", 1),
+    CerboSensorDescription("solarcharger_pv_voltage", "solarcharger/+/Pv/V", "MPPT {instance} PV Voltage", SensorDeviceClass.VOLTAGE, "V", 2),
+    CerboSensorDescription("solarcharger_power", "solarcharger/+/Yield/Power", "MPPT {instance} Power", SensorDeviceClass.POWER, "W", 0),
+    CerboSensorDescription("solarcharger_current", "solarcharger/+/Dc/0/Current", "MPPT {instance} Current", SensorDeviceClass.CURRENT, "A", 2),
+    CerboSensorDescription("vebus_ac_in_power", "vebus/+/Ac/ActiveIn/L1/P", "Inverter {instance} AC In Power", SensorDeviceClass.POWER, "W", 0),
+    CerboSensorDescription("vebus_ac_out_power", "vebus/+/Ac/Out/L1/P", "Inverter {instance} AC Out Power", SensorDeviceClass.POWER, "W", 0),
+    CerboSensorDescription("vebus_ac_out_voltage", "vebus/+/Ac/Out/L1/V", "Inverter {instance} AC Out Voltage", SensorDeviceClass.VOLTAGE, "V", 1),
+    CerboSensorDescription("vebus_dc_voltage", "vebus/+/Dc/0/Voltage", "Inverter {instance} DC Voltage", SensorDeviceClass.VOLTAGE, "V", 2),
+    CerboSensorDescription("tank_level", "tank/+/Level", "Tank {instance} Level", None, "%", 0),
+    CerboSensorDescription("tank_remaining", "tank/+/Remaining", "Tank {instance} Remaining", SensorDeviceClass.VOLUME_STORAGE, "m³", 3),
+    CerboSensorDescription("temperature", "temperature/+/Temperature", "Temperature {instance}", SensorDeviceClass.TEMPERATURE, "°C", 1),
+    CerboSensorDescription("system_soc", "system/0/Dc/Battery/Soc", "Battery SOC", SensorDeviceClass.BATTERY, "%", 1),
+)
@@ -0,0 +1,35 @@
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from .const import CONF_PASSWORD, CONF_USERNAME, DOMAIN
+
+TO_REDACT = {CONF_USERNAME, CONF_PASSWORD}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict:
+    """Diagnostics téléchargeables d'une entrée : état de la connexion et métriques du site."""
+    entry_data = hass.data[DOMAIN].get(entry.entry_id, {})
+    mqtt_client = entry_data.get("mqtt_client")
+    diagnostics = {
+        "entry": {
+            "data": async_redact_data(dict(entry.data), TO_REDACT),
+            "options": dict(entry.options),
+            "setup_time": entry_data.get("setup_time"),
+        },
+    }
+    if mqtt_client is None:
+        return diagnostics
+
+    diagnostics.update(mqtt_client.diagnostics())
+
+    snapshot = entry_data.get("snapshot")
+    if snapshot is not None:
+        diagnostics["snapshot"] = snapshot.diagnostics()
+
+    discovery = entry_data.get("discovery")
+    if discovery is not None:
+        diagnostics["discovery"] = {
+            "known_paths": len(discovery.index),
+            "discovered": sorted(discovery.discovered),
+        }
+    return diagnostics
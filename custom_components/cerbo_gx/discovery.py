@@ -0,0 +1,107 @@
+import logging
+from .decoder import DecodeError, compile_value_path, decode_payload
+from .topic_router import TopicRouter
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class SiteDiscovery:
+    """Découverte de l'arbre de topics d'un site et création paresseuse des entités.
+
+    Seuls les motifs de la table des descriptions sont souscrits, et non
+    l'arbre entier du site. Chaque topic reçu est indexé à sa première
+    apparition ; les messages suivants sur un topic connu se résument à une
+    recherche dans l'index, sans décodage. Une entité n'est proposée que
+    lorsqu'un chemin décrit publie une valeur.
+
+    Les motifs ne restent souscrits que pendant une publication complète de
+    l'arbre (après chaque connexion) : ensuite, seuls les topics des entités
+    activées sont transmis par le broker.
+    """
+
+    def __init__(self, mqtt_client, descriptions):
+        self._client = mqtt_client
+        self._prefix = f"N/{mqtt_client.id_site}/"
+        self._router = TopicRouter()
+        for description in descriptions:
+            self._router.add(self._prefix + description.topic, description)
+        self._topics = self._router.patterns()
+        self._extract = compile_value_path()
+        self.index = {}  # topic -> description (ou None) pour chaque chemin connu du site
+        self.discovered = {}  # topic -> (description, première valeur) des chemins ayant donné lieu à une entité
+        self._listener = None
+        self._scanning = False
+
+    def start(self):
+        """Indexe les messages du site à chaque publication complète (abonnements groupés en un seul SUBSCRIBE)."""
+        self._client.add_sync_listener(self._on_sync)
+        # Site déjà synchronisé (client réutilisé) : l'arbre sera parcouru à la prochaine publication complète
+        self._scan(not self._client.full_sync_done)
+
+    def stop(self):
+        """Arrête l'indexation."""
+        self._client.remove_sync_listener(self._on_sync)
+        self._scan(False)
+        self._listener = None
+
+    def _on_sync(self, full_sync_done):
+        self._scan(not full_sync_done)
+
+    def _scan(self, active):
+        """Souscrit les motifs pendant une publication complète, et les retire ensuite."""
+        if active == self._scanning:
+            return
+        self._scanning = active
+        for topic in self._topics:
+            if active:
+                self._client.add_subscription(topic, self._on_message, raw=True)
+            else:
+                self._client.remove_subscription(topic, self._on_message)
+        _LOGGER.debug("Site %s : découverte %s", self._client.id_site, "en cours" if active else "terminée")
+
+    def restore(self, items):
+        """Reprend les chemins d'un instantané (snapshot.py) : leurs entités sont créées sans attendre le site."""
+        for topic, value in items:
+            descriptions = self._router.match(topic)
+            if descriptions and topic not in self.discovered:
+                self.discovered[topic] = (descriptions[0], value)
+
+    def set_listener(self, listener):
+        """Définit le callback `listener(topic, description, valeur)` appelé pour chaque nouveau chemin.
+
+        Les chemins déjà découverts avant l'appel sont transmis immédiatement.
+        """
+        self._listener = listener
+        for topic, (description, value) in self.discovered.items():
+            listener(topic, description, value)
+
+    def relative_topic(self, topic):
+        """Retire le préfixe `N/{id_site}/` d'un topic du site."""
+        return topic[len(self._prefix):]
+
+    def _on_message(self, topic, raw):
+        if not raw:
+            # Payload vide : le chemin a disparu de l'arbre
+            self.index.pop(topic, None)
+            return
+        if topic in self.index:
+            return
+
+        descriptions = self._router.match(topic)
+        if not descriptions:
+            self.index[topic] = None
+            return
+        try:
+            value = self._extract(decode_payload(raw))
+        except DecodeError:
+            return
+        if value is None:
+            return  # Chemin présent mais invalide : réexaminé à la prochaine valeur
+        description = self.index[topic] = descriptions[0]
+
+        if topic in self.discovered:
+            return
+        self.discovered[topic] = (description, value)
+        _LOGGER.debug("Nouveau chemin découvert pour le site %s : %s", self._client.id_site, topic)
+        if self._listener is not None:
+            self._listener(topic, description, value)
@@ -0,0 +1,36 @@
+from collections import namedtuple
+
+# Ports du broker MQTT local du GX et du broker VRM
+VRM_PORT = 8883
+LAN_PORT = 1883
+LAN_TLS_PORT = 8883
+# Port du serveur Modbus-TCP du GX
+MODBUS_PORT = 502
+
+# Broker joignable par un client : `verify` active la vérification du certificat
+# (CA Victron), `auth` l'envoi des identifiants VRM
+BrokerEndpoint = namedtuple("BrokerEndpoint", ["name", "host", "port", "tls", "verify", "auth"])
+
+
+def vrm_broker_host(id_site):
+    """Générer l'URL du courtier MQTT VRM basé sur l'ID du site."""
+    sum = 0
+    for character in id_site.lower().strip():
+        sum += ord(character)
+    broker_index = sum % 128
+    return f"mqtt{broker_index}.victronenergy.com"
+
+
+def vrm_endpoint(id_site):
+    """Broker VRM (cloud) du site."""
+    return BrokerEndpoint("vrm", vrm_broker_host(id_site), VRM_PORT, True, True, True)
+
+
+def lan_endpoint(host, port=None, tls=False):
+    """Broker local du GX ; en TLS, son certificat est auto-signé et n'est pas vérifié."""
+    return BrokerEndpoint("lan", host, port or (LAN_TLS_PORT if tls else LAN_PORT), tls, False, False)
+
+
+def modbus_endpoint(host, port=None):
+    """Serveur Modbus-TCP du GX (transport sans MQTT)."""
+    return BrokerEndpoint("modbus", host, port or MODBUS_PORT, False, False, False)
@@ -0,0 +1,52 @@
+# Intervalle (s) de publication des capteurs d'énergie
+ENERGY_PUBLISH_INTERVAL = 60
+# Au-delà de cet écart (s) entre deux points, l'intervalle est considéré comme manquant et n'est pas intégré
+MAX_GAP = 300
+
+_JOULES_PER_KWH = 3.6e6
+
+
+class EnergyIntegrator:
+    """Intégration d'une puissance (W) en énergie (kWh) par la méthode des trapèzes.
+
+    Les échantillons bruts sont intégrés au fil de l'eau. Comme Venus ne republie
+    pas une valeur inchangée, `hold()` prolonge périodiquement la dernière
+    puissance reçue jusqu'à l'instant présent. Un écart supérieur à `max_gap`
+    (ou un appel à `pause()`, par exemple pendant une déconnexion) interrompt
+    l'intégration jusqu'au point suivant. Les puissances négatives comptent
+    pour zéro : le total ne peut que croître.
+    """
+
+    __slots__ = ("total", "max_gap", "_last_time", "_last_power")
+
+    def __init__(self, total=0.0, max_gap=MAX_GAP):
+        self.total = total  # kWh
+        self.max_gap = max_gap
+        self._last_time = None
+        self._last_power = 0.0
+
+    def add(self, now, power):
+        """Ajoute un échantillon de puissance (W) reçu à l'instant `now` (s, horloge monotone)."""
+        power = power if power > 0 else 0.0
+        last_time = self._last_time
+        if last_time is not None:
+            elapsed = now - last_time
+            if 0 < elapsed <= self.max_gap:
+                self.total += (self._last_power + power) * elapsed / (2 * _JOULES_PER_KWH)
+        self._last_time = now
+        self._last_power = power
+
+    def hold(self, now):
+        """Intègre jusqu'à `now` en supposant la dernière puissance inchangée."""
+        last_time = self._last_time
+        if last_time is None or now <= last_time:
+            return
+        if now - last_time <= self.max_gap:
+            self.total += self._last_power * (now - last_time) / _JOULES_PER_KWH
+            self._last_time = now
+        else:
+            self.pause()
+
+    def pause(self):
+        """Interrompt l'intégration : le prochain échantillon démarre un nouveau segment."""
+        self._last_time = None
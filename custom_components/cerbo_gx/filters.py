@@ -0,0 +1,183 @@
+import logging
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+# Modes de filtrage disponibles pour un capteur
+FILTER_NONE = "none"
+FILTER_ABSOLUTE = "absolute"  # Bande morte absolue (dans l'unité du capteur)
+FILTER_PERCENT = "percent"  # Bande morte relative (% de la dernière valeur publiée)
+FILTER_INTERVAL = "interval"  # Au plus une publication toutes les `interval` secondes
+FILTER_AVERAGE = "average"  # Moyenne des échantillons sur une fenêtre de `interval` secondes
+FILTER_MODES = [FILTER_NONE, FILTER_ABSOLUTE, FILTER_PERCENT, FILTER_INTERVAL, FILTER_AVERAGE]
+
+# Types de capteurs filtrables (classe de périphérique) et clés d'options associées
+FILTER_SENSOR_TYPES = ["voltage", "current", "power"]
+CONF_FILTER_MODE = "{}_filter_mode"
+CONF_FILTER_THRESHOLD = "{}_filter_threshold"
+CONF_FILTER_INTERVAL = "{}_filter_interval"
+CONF_FILTER_HEARTBEAT = "filter_heartbeat"
+
+DEFAULT_FILTER_THRESHOLD = 0.0
+DEFAULT_FILTER_INTERVAL = 10.0
+DEFAULT_FILTER_HEARTBEAT = 300.0
+# Période (s) de vérification des échéances des filtres (fin de fenêtre, heartbeat) :
+# Venus ne republie pas une valeur inchangée, les échantillons ne suffisent donc pas
+FILTER_TICK_INTERVAL = 1.0
+
+
+class SensorFilter:
+    """Filtre appliqué aux valeurs d'un capteur avant l'écriture de son état.
+
+    `process()` retourne la valeur à publier, ou None si l'échantillon est
+    absorbé. Quel que soit le mode, une valeur est publiée dès que le dernier
+    envoi date de plus de `heartbeat` secondes (0 = désactivé). `flush()`,
+    appelé toutes les FILTER_TICK_INTERVAL secondes par le FilterTicker du
+    site, applique ces échéances sans attendre d'échantillon.
+    """
+
+    __slots__ = ("mode", "threshold", "interval", "heartbeat", "_last_value", "_last_time", "_latest", "_sum", "_count", "_window_start")
+
+    def __init__(self, mode, threshold=DEFAULT_FILTER_THRESHOLD, interval=DEFAULT_FILTER_INTERVAL, heartbeat=DEFAULT_FILTER_HEARTBEAT):
+        self.mode = mode
+        self.threshold = threshold
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self._last_value = None
+        self._last_time = None
+        self._latest = None  # Dernier échantillon reçu, publié ou non
+        self._sum = 0.0
+        self._count = 0
+        self._window_start = None
+
+    def process(self, value, now):
+        """Traite un échantillon reçu à l'instant `now` (secondes, horloge monotone)."""
+        self._latest = value
+        if self._last_time is None:
+            return self._publish(value, now)
+        # Les valeurs non numériques ne sont publiées que lorsqu'elles changent
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return self._publish(value, now) if value != self._last_value else None
+        heartbeat = bool(self.heartbeat) and now - self._last_time >= self.heartbeat
+
+        mode = self.mode
+        if mode == FILTER_AVERAGE:
+            # L'échantillon entre dans la fenêtre avant toute publication, heartbeat compris
+            if self._window_start is None:
+                self._window_start = now
+            self._sum += value
+            self._count += 1
+            if heartbeat or now - self._window_start >= self.interval:
+                mean = self._sum / self._count
+                self._reset_window()
+                return self._publish(mean, now)
+        elif heartbeat:
+            return self._publish(value, now)
+        elif mode == FILTER_ABSOLUTE:
+            if self._exceeds(abs(value - self._last_value), self.threshold):
+                return self._publish(value, now)
+        elif mode == FILTER_PERCENT:
+            if self._exceeds(abs(value - self._last_value), abs(self._last_value) * self.threshold / 100):
+                return self._publish(value, now)
+        elif mode == FILTER_INTERVAL:
+            if now - self._last_time >= self.interval:
+                return self._publish(value, now)
+        else:
+            return self._publish(value, now)
+        return None
+
+    def flush(self, now):
+        """Applique les échéances atteintes sans nouvel échantillon ; retourne la valeur à publier ou None.
+
+        Une fenêtre de moyenne échue est close et sa moyenne publiée ; en mode
+        intervalle, le dernier échantillon absorbé est publié à la fin de
+        l'intervalle. Au-delà du heartbeat, le dernier échantillon reçu (ou la
+        moyenne de la fenêtre en cours) est publié, même s'il avait été absorbé
+        par la bande morte.
+        """
+        if self._last_time is None:
+            return None
+        if self.mode == FILTER_INTERVAL and now - self._last_time >= self.interval and self._latest != self._last_value:
+            return self._publish(self._latest, now)
+        if self._count and now - self._window_start >= self.interval:
+            mean = self._sum / self._count
+            self._reset_window()
+            return self._publish(mean, now)
+        if self.heartbeat and now - self._last_time >= self.heartbeat:
+            value = self._sum / self._count if self._count else self._latest
+            self._reset_window()
+            return self._publish(value, now)
+        return None
+
+    @staticmethod
+    def _exceeds(delta, threshold):
+        return delta > threshold if threshold else delta != 0
+
+    def _reset_window(self):
+        self._sum = 0.0
+        self._count = 0
+        self._window_start = None
+
+    def _publish(self, value, now):
+        self._last_value = value
+        self._last_time = now
+        return value
+
+
+class FilterTicker:
+    """Échéances des filtres des capteurs d'un site, vérifiées par une seule minuterie.
+
+    Les capteurs filtrés s'y inscrivent au lieu d'avoir chacun leur minuterie ;
+    toutes les `interval` secondes, `flush_filter(now)` est appelé sur chacun.
+    La minuterie ne tourne que tant qu'un capteur est inscrit.
+    """
+
+    def __init__(self, loop, interval=FILTER_TICK_INTERVAL):
+        self._loop = loop
+        self._interval = interval
+        self._sensors = {}
+        self._handle = None
+
+    def add(self, sensor):
+        """Inscrit un capteur dont le filtre doit être vérifié périodiquement."""
+        self._sensors[sensor] = None
+        if self._handle is None:
+            self._handle = self._loop.call_later(self._interval, self._tick)
+
+    def discard(self, sensor):
+        """Désinscrit un capteur (par exemple lors de sa suppression)."""
+        self._sensors.pop(sensor, None)
+        if not self._sensors:
+            self.cancel()
+
+    def cancel(self):
+        """Arrête la minuterie."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _tick(self):
+        self._handle = None
+        now = time.monotonic()
+        for sensor in list(self._sensors):
+            try:
+                sensor.flush_filter(now)
+            except Exception as e:
+                _LOGGER.error("Erreur lors de la vérification du filtre de %s : %s", sensor.entity_id, e)
+        if self._sensors:
+            self._handle = self._loop.call_later(self._interval, self._tick)
+
+
+def filter_from_options(options, sensor_type):
+    """Construit le filtre configuré pour un type de capteur, ou None s'il n'y en a pas."""
+    if sensor_type not in FILTER_SENSOR_TYPES:
+        return None
+    mode = options.get(CONF_FILTER_MODE.format(sensor_type), FILTER_NONE)
+    if mode == FILTER_NONE:
+        return None
+    return SensorFilter(
+        mode,
+        threshold=options.get(CONF_FILTER_THRESHOLD.format(sensor_type), DEFAULT_FILTER_THRESHOLD),
+        interval=options.get(CONF_FILTER_INTERVAL.format(sensor_type), DEFAULT_FILTER_INTERVAL),
+        heartbeat=options.get(CONF_FILTER_HEARTBEAT, DEFAULT_FILTER_HEARTBEAT),
+    )
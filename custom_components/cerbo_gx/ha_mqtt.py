@@ -0,0 +1,134 @@
+import asyncio
+import logging
+from homeassistant.components import mqtt
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.exceptions import HomeAssistantError
+from .endpoints import BrokerEndpoint
+from .mqtt_client import CerboMQTTClient
+from .topic_router import TopicRouter
+
+_LOGGER = logging.getLogger(__name__)
+
+# Pseudo-broker des sites servis par l'intégration MQTT de Home Assistant (diagnostics)
+HA_MQTT_ENDPOINT = BrokerEndpoint("ha_mqtt", "homeassistant", None, False, False, False)
+
+
+class HAMQTTConnection:
+    """Abonnements d'un site sur la connexion MQTT de Home Assistant.
+
+    Présente à CerboMQTTClient la même interface qu'une BrokerConnection, mais
+    souscrit et publie via `mqtt.async_subscribe`/`mqtt.async_publish` : aucun
+    client paho, thread ni session TLS supplémentaire, et les messages arrivent
+    directement sur la boucle d'événements. Home Assistant rappelle chaque
+    abonnement correspondant à un message ; lorsque plusieurs topics souscrits
+    du site couvrent le même message, un seul le transmet au site.
+    """
+
+    def __init__(self, hass: HomeAssistant, site):
+        self.hass = hass
+        self.site = site
+        self.sites = {site.id_site: site}
+        self.handshake_time = None
+        self.session_reused = False
+        self.connected = mqtt.is_connected(hass)
+        self._unsubscribers = {}  # topic -> désabonnement HA (None tant que la souscription est en cours)
+        self._wildcards = TopicRouter()  # Topics souscrits avec jokers, pour écarter les doublons
+        self._pending = set()  # Souscriptions en cours, attendues avant toute publication
+        self._unsub_status = mqtt.async_subscribe_connection_status(hass, self._on_status)
+
+    def stop(self):
+        self._unsub_status()
+        self.unsubscribe(list(self._unsubscribers))
+        self.sites.clear()
+
+    def subscribe(self, topics):
+        for topic in topics:
+            if topic in self._unsubscribers:
+                continue
+            self._unsubscribers[topic] = None
+            if "+" in topic or "#" in topic:
+                self._wildcards.add(topic, topic)
+            task = self.hass.async_create_task(self._async_subscribe(topic))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+        _LOGGER.debug(f"Souscription ajoutée aux topics : {list(topics)}")
+
+    async def _async_subscribe(self, topic):
+        try:
+            unsubscribe = await mqtt.async_subscribe(self.hass, topic, self._on_message, qos=0, encoding=None)
+        except HomeAssistantError as e:
+            _LOGGER.error(f"Souscription impossible au topic {topic} via l'intégration MQTT : {e}")
+            return
+        if topic in self._unsubscribers and self._unsubscribers[topic] is None:
+            self._unsubscribers[topic] = unsubscribe
+        else:
+            unsubscribe()  # Désabonné (ou resouscrit) pendant la souscription
+
+    def unsubscribe(self, topics):
+        for topic in topics:
+            if topic not in self._unsubscribers:
+                continue
+            unsubscribe = self._unsubscribers.pop(topic)
+            if "+" in topic or "#" in topic:
+                self._wildcards.remove(topic, topic)
+            if unsubscribe is not None:
+                unsubscribe()
+        _LOGGER.debug(f"Souscription supprimée pour les topics : {list(topics)}")
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.hass.async_create_task(self._async_publish(topic, payload, qos, retain))
+
+    async def _async_publish(self, topic, payload, qos, retain):
+        if self._pending:
+            # Une écriture W/ ne part qu'une fois son écho N/ souscrit, comme sur une connexion paho
+            await asyncio.wait(list(self._pending))
+        await mqtt.async_publish(self.hass, topic, payload, qos, retain)
+
+    @callback
+    def _on_message(self, msg):
+        subscribed = msg.subscribed_topic
+        if subscribed != msg.topic:
+            # Un topic exact du site, ou le premier joker correspondant, transmet le message
+            if msg.topic in self._unsubscribers:
+                return
+            owners = self._wildcards.match(msg.topic)
+            if not owners or min(owners) != subscribed:
+                return
+        self.site.on_message(msg.topic, msg.payload)
+
+    @callback
+    def _on_status(self, connected):
+        self.connected = connected
+        if connected:
+            self.site.on_connected()
+        else:
+            self.site.on_disconnected(True)
+
+
+class HAMQTTPool:
+    """Fournit à chaque site sa HAMQTTConnection (la connexion partagée est celle de Home Assistant)."""
+
+    def __init__(self, hass: HomeAssistant):
+        self.hass = hass
+
+    def acquire(self, site, endpoint, failures=0):
+        connection = HAMQTTConnection(self.hass, site)
+        connection.subscribe(site.subscribed_topics())
+        return connection
+
+    def release(self, site, connection):
+        connection.stop()
+
+
+class HAMQTTSiteClient(CerboMQTTClient):
+    """Client d'un site passant par l'intégration MQTT de Home Assistant.
+
+    Pour les installations qui relaient déjà le broker du GX ou de VRM vers le
+    broker de Home Assistant. Le routage, le décodage, les keep-alive Venus et
+    les métriques sont ceux de CerboMQTTClient ; seule la connexion change.
+    Ce client s'exécute toujours dans le processus de Home Assistant, même si
+    des processus d'ingestion sont configurés.
+    """
+
+    def __init__(self, hass, id_site, client_id=None, username=None, password=None, flush_interval=0, record_path=None, endpoints=None, pool=None):
+        super().__init__(id_site, client_id, flush_interval=flush_interval, record_path=record_path, endpoints=[HA_MQTT_ENDPOINT], pool=HAMQTTPool(hass))
@@ -0,0 +1,145 @@
+import math
+from array import array
+
+# Historique glissant des capteurs : durée de la fenêtre (minutes, 0 = désactivé)
+CONF_HISTORY_WINDOW = "history_window"
+DEFAULT_HISTORY_WINDOW = 0
+# Types de capteurs (classe de périphérique) pouvant tenir un historique
+HISTORY_SENSOR_TYPES = ["voltage", "current", "power"]
+# Nombre d'échantillons conservés au plus : 2 × 8 octets chacun, soit ~9,4 Kio par capteur
+HISTORY_CAPACITY = 600
+
+
+class RollingWindow:
+    """Historique `(horodatage, valeur)` des `window` dernières secondes, dans un tampon circulaire.
+
+    Les deux tableaux `array('d')` sont alloués une fois pour toutes : la mémoire
+    est fixe quel que soit le débit. Pour que la capacité couvre toute la
+    fenêtre, au plus un échantillon est conservé par `window / capacity`
+    secondes. Somme et somme des carrés sont tenues à jour à chaque ajout et
+    expiration ; min et max ne sont recalculés que si un extrême expire.
+    """
+
+    __slots__ = (
+        "window",
+        "capacity",
+        "resolution",
+        "_times",
+        "_values",
+        "_head",
+        "_count",
+        "_sum",
+        "_sumsq",
+        "_min",
+        "_max",
+        "_dirty",
+    )
+
+    def __init__(self, window, capacity=HISTORY_CAPACITY):
+        self.window = window
+        self.capacity = capacity
+        self.resolution = window / capacity
+        self._times = array("d", [0.0]) * capacity
+        self._values = array("d", [0.0]) * capacity
+        self._head = 0  # Prochain emplacement écrit
+        self._count = 0
+        self._sum = 0.0
+        self._sumsq = 0.0
+        self._min = math.inf
+        self._max = -math.inf
+        self._dirty = False
+
+    def __len__(self):
+        return self._count
+
+    def add(self, now, value):
+        """Ajoute un échantillon (horloge monotone) ; retourne False s'il est ignoré (trop rapproché)."""
+        capacity = self.capacity
+        if self._count and now - self._times[self._head - 1] < self.resolution:
+            return False
+        self._expire(now)
+        if self._count == capacity:
+            self._evict()
+        head = self._head
+        self._times[head] = now
+        self._values[head] = value
+        self._head = (head + 1) % capacity
+        self._count += 1
+        self._sum += value
+        self._sumsq += value * value
+        if value < self._min:
+            self._min = value
+        if value > self._max:
+            self._max = value
+        return True
+
+    def stats(self, now):
+        """Statistiques de la fenêtre à l'instant `now`, ou None si elle est vide."""
+        self._expire(now)
+        count = self._count
+        if not count:
+            return None
+        if self._dirty:
+            self._rescan()
+        mean = self._sum / count
+        variance = max(0.0, self._sumsq / count - mean * mean)
+        return {
+            "min": self._min,
+            "max": self._max,
+            "mean": mean,
+            "stddev": math.sqrt(variance),
+            "samples": count,
+        }
+
+    def values(self):
+        """Valeurs de la fenêtre, de la plus ancienne à la plus récente."""
+        return self._live(self._values)
+
+    def _expire(self, now):
+        limit = now - self.window
+        times = self._times
+        while self._count and times[(self._head - self._count) % self.capacity] < limit:
+            self._evict()
+
+    def _evict(self):
+        value = self._values[(self._head - self._count) % self.capacity]
+        self._count -= 1
+        self._sum -= value
+        self._sumsq -= value * value
+        if value <= self._min or value >= self._max:
+            self._dirty = True
+        if not self._count:
+            self._reset_totals()
+
+    def _rescan(self):
+        """Recalcule extrêmes et sommes sur la fenêtre (élimine aussi la dérive des sommes)."""
+        values = self.values()
+        self._min = min(values)
+        self._max = max(values)
+        self._sum = math.fsum(values)
+        self._sumsq = math.fsum(value * value for value in values)
+        self._dirty = False
+
+    def _reset_totals(self):
+        self._sum = 0.0
+        self._sumsq = 0.0
+        self._min = math.inf
+        self._max = -math.inf
+        self._dirty = False
+
+    def _live(self, data):
+        start = (self._head - self._count) % self.capacity
+        end = start + self._count
+        if end <= self.capacity:
+            return data[start:end]
+        return data[start:] + data[:end - self.capacity]
+
+
+def history_from_options(options, sensor_type):
+    """Construit l'historique configuré pour un type de capteur, ou None s'il est désactivé."""
+    if sensor_type not in HISTORY_SENSOR_TYPES:
+        return None
+    window = options.get(CONF_HISTORY_WINDOW, DEFAULT_HISTORY_WINDOW)
+    if not window:
+        return None
+    return RollingWindow(window * 60)
@@ -0,0 +1,136 @@
+import time
+
+# Une mesure de durée sur SAMPLE_EVERY messages (puissance de 2) : les compteurs,
+# eux, sont tenus pour chaque message
+SAMPLE_EVERY = 16
+_SAMPLE_MASK = SAMPLE_EVERY - 1
+# Fenêtre (s) sur laquelle est calculé le débit de messages
+RATE_WINDOW = 10.0
+
+
+class Histogram:
+    """Histogramme de durées à seaux exponentiels (puissances de 2 en microsecondes).
+
+    `observe()` ne fait qu'incrémenter un seau : le coût est constant et la
+    mémoire fixe. Les percentiles sont donnés à la borne supérieure du seau.
+    """
+
+    __slots__ = ("counts", "count", "total", "max", "last")
+
+    BUCKETS = 32  # Jusqu'à 2^31 µs, soit environ 36 minutes
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = None
+
+    def observe(self, seconds):
+        index = int(seconds * 1e6).bit_length()
+        self.counts[index if index < self.BUCKETS else self.BUCKETS - 1] += 1
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction):
+        """Durée (s) sous laquelle se trouve la fraction `fraction` des observations."""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min((1 << index) / 1e6, self.max)
+        return self.max
+
+    def as_dict(self):
+        """Résumé en millisecondes."""
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 4),
+            "p50_ms": round(self.percentile(0.5) * 1000, 4),
+            "p99_ms": round(self.percentile(0.99) * 1000, 4),
+            "max_ms": round(self.max * 1000, 4),
+            "last_ms": round(self.last * 1000, 4),
+        }
+
+
+class SiteMetrics:
+    """Compteurs et histogrammes du chemin MQTT d'un site."""
+
+    __slots__ = (
+        "messages",
+        "bytes",
+        "unrouted",
+        "decode_errors",
+        "reconnects",
+        "command_timeouts",
+        "decode_time",
+        "dispatch_time",
+        "keepalive_rtt",
+        "command_rtt",
+        "poll_time",
+        "loop_lag",
+        "message_rate",
+        "_window_start",
+        "_window_messages",
+    )
+
+    def __init__(self, loop_lag=None):
+        self.messages = 0
+        self.bytes = 0
+        self.unrouted = 0  # Messages sans aucun abonné
+        self.decode_errors = 0
+        self.reconnects = 0
+        self.command_timeouts = 0  # Écritures restées sans confirmation
+        self.decode_time = Histogram()
+        self.dispatch_time = Histogram()  # Décodage compris, jusqu'aux callbacks des entités
+        self.keepalive_rtt = Histogram()  # Keep-alive -> full_publish_completed
+        self.command_rtt = Histogram()  # Écriture W/ -> écho N/ portant la valeur demandée
+        self.poll_time = Histogram()  # Scrutation complète des registres (transport Modbus-TCP)
+        self.loop_lag = loop_lag  # Histogramme partagé, tenu par le MQTTManager
+        self.message_rate = None
+        self._window_start = None
+        self._window_messages = 0
+
+    @staticmethod
+    def sampled(count):
+        """Indique si le message numéro `count` doit être chronométré."""
+        return not count & _SAMPLE_MASK
+
+    def update_rate(self, now=None):
+        """Met à jour le débit de messages (appelé périodiquement par le moteur d'E/S)."""
+        if now is None:
+            now = time.monotonic()
+        if self._window_start is None:
+            self._window_start = now
+            self._window_messages = self.messages
+            return
+        elapsed = now - self._window_start
+        if elapsed >= RATE_WINDOW:
+            self.message_rate = (self.messages - self._window_messages) / elapsed
+            self._window_start = now
+            self._window_messages = self.messages
+
+    def as_dict(self):
+        return {
+            "messages": self.messages,
+            "bytes": self.bytes,
+            "message_rate": None if self.message_rate is None else round(self.message_rate, 2),
+            "unrouted": self.unrouted,
+            "decode_errors": self.decode_errors,
+            "reconnects": self.reconnects,
+            "command_timeouts": self.command_timeouts,
+            "decode_time": self.decode_time.as_dict(),
+            "dispatch_time": self.dispatch_time.as_dict(),
+            "keepalive_rtt": self.keepalive_rtt.as_dict(),
+            "command_rtt": self.command_rtt.as_dict(),
+            "poll_time": self.poll_time.as_dict(),
+            "loop_lag": self.loop_lag.as_dict() if self.loop_lag is not None else None,
+        }
@@ -0,0 +1,432 @@
+import asyncio
+import logging
+import struct
+import time
+from collections import namedtuple
+from .commands import serialize_value
+from .decoder import DecodeError, compile_value_path, decode_payload
+from .state_writer import StateWriteBuffer
+from .transport import SiteTransport, reconnect_delay
+
+_LOGGER = logging.getLogger(__name__)
+
+# Unité Modbus du service com.victronenergy.system sur le GX
+SYSTEM_UNIT = 100
+# Registres lus au plus par requête (limite du protocole pour la fonction 3)
+MAX_READ_REGISTERS = 125
+# Registres non souscrits lus au plus entre deux registres utiles d'un même bloc :
+# une lecture un peu plus longue coûte moins qu'un aller-retour de plus
+MAX_READ_GAP = 8
+# Intervalle de scrutation adaptatif (s) : resserré quand les valeurs changent, élargi sinon
+POLL_INTERVAL_MIN = 1.0
+POLL_INTERVAL_MAX = 30.0
+POLL_INTERVAL_GROWTH = 1.5
+# Délai d'attente (s) d'une réponse, et de l'ouverture de la connexion
+REQUEST_TIMEOUT = 5.0
+
+READ_HOLDING_REGISTERS = 3
+WRITE_SINGLE_REGISTER = 6
+# Code d'exception Modbus : adresse hors de la table du périphérique
+ILLEGAL_DATA_ADDRESS = 2
+
+_MISSING = object()
+
+# Registre 16 bits d'un chemin Venus : valeur = registre (signé ou non) / scale
+ModbusRegister = namedtuple("ModbusRegister", ["unit", "address", "signed", "scale", "writable"])
+
+# Chemins Venus (relatifs au site) servis par le transport Modbus-TCP, d'après la
+# liste des registres publiée par Victron (CCGX-Modbus-TCP-register-list)
+MODBUS_REGISTERS = {
+    "system/0/Relay/0/State": ModbusRegister(SYSTEM_UNIT, 806, False, 1, True),
+    "system/0/Relay/1/State": ModbusRegister(SYSTEM_UNIT, 807, False, 1, True),
+    "system/0/Dc/Battery/Voltage": ModbusRegister(SYSTEM_UNIT, 840, False, 10, False),
+    "system/0/Dc/Battery/Current": ModbusRegister(SYSTEM_UNIT, 841, True, 10, False),
+    "system/0/Dc/Battery/Power": ModbusRegister(SYSTEM_UNIT, 842, True, 1, False),
+    "system/0/Dc/Battery/Soc": ModbusRegister(SYSTEM_UNIT, 843, False, 1, False),
+    "system/0/Dc/Pv/Power": ModbusRegister(SYSTEM_UNIT, 850, False, 1, False),
+    "system/0/Dc/System/Power": ModbusRegister(SYSTEM_UNIT, 860, True, 1, False),
+}
+
+
+class ModbusError(Exception):
+    """Réponse d'exception d'un périphérique Modbus."""
+
+    def __init__(self, function, code):
+        super().__init__(f"exception Modbus {code} (fonction {function})")
+        self.function = function
+        self.code = code
+
+
+def plan_reads(addresses, max_gap=MAX_READ_GAP, max_count=MAX_READ_REGISTERS):
+    """Regroupe des registres `(unité, adresse)` en lectures contiguës `(unité, début, nombre)`.
+
+    Deux registres d'une même unité partagent une lecture s'ils sont séparés
+    d'au plus `max_gap` registres et que le bloc ne dépasse pas `max_count`.
+    """
+    blocks = []
+    for unit, address in sorted(set(addresses)):
+        if blocks:
+            last_unit, start, count = blocks[-1]
+            if last_unit == unit and address - (start + count) <= max_gap and address - start < max_count:
+                blocks[-1] = (unit, start, address - start + 1)
+                continue
+        blocks.append((unit, address, 1))
+    return blocks
+
+
+def decode_register(register, raw):
+    """Valeur d'un registre lu ; entière si le registre n'a pas de facteur d'échelle."""
+    if register.signed and raw & 0x8000:
+        raw -= 0x10000
+    return raw / register.scale if register.scale != 1 else raw
+
+
+def encode_register(register, value):
+    """Mot de 16 bits à écrire pour une valeur."""
+    return round(value * register.scale) & 0xFFFF
+
+
+class ModbusTCPConnection:
+    """Connexion Modbus-TCP minimale : lecture (3) et écriture (6) de registres.
+
+    Les requêtes sont envoyées l'une après l'autre, chacune attendant sa réponse
+    (le serveur Modbus du GX ne traite pas de requêtes en parallèle). Une requête
+    restée sans réponse dans le délai ferme la connexion.
+    """
+
+    def __init__(self, host, port, timeout=REQUEST_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._reader = None
+        self._writer = None
+        self._transaction = 0
+        self._lock = asyncio.Lock()
+
+    @property
+    def connected(self):
+        return self._writer is not None
+
+    async def async_connect(self):
+        self._reader, self._writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def read_registers(self, unit, address, count):
+        """Lit `count` registres de maintien à partir de `address` ; retourne un tuple d'entiers."""
+        response = await self._request(unit, struct.pack(">BHH", READ_HOLDING_REGISTERS, address, count))
+        if len(response) != 2 + 2 * count or response[1] != 2 * count:
+            raise ConnectionError(f"réponse Modbus de longueur inattendue ({len(response)} octets)")
+        return struct.unpack(f">{count}H", response[2:])
+
+    async def write_register(self, unit, address, value):
+        """Écrit un registre de maintien."""
+        await self._request(unit, struct.pack(">BHH", WRITE_SINGLE_REGISTER, address, value))
+
+    async def _request(self, unit, pdu):
+        async with self._lock:
+            if self._writer is None:
+                raise ConnectionError("connexion Modbus fermée")
+            self._transaction = (self._transaction + 1) & 0xFFFF
+            transaction = self._transaction
+            self._writer.write(struct.pack(">HHHB", transaction, 0, len(pdu) + 1, unit) + pdu)
+            await self._writer.drain()
+            try:
+                return await asyncio.wait_for(self._read_response(transaction, pdu[0]), self.timeout)
+            except asyncio.TimeoutError:
+                # Une réponse a pu être lue en partie : le flux n'est plus aligné sur les trames
+                self.close()
+                raise
+
+    async def _read_response(self, transaction, function):
+        while True:
+            header = await self._reader.readexactly(7)
+            received, protocol, length, _ = struct.unpack(">HHHB", header)
+            response = await self._reader.readexactly(length - 1)
+            if received == transaction and protocol == 0:
+                break
+            # Réponse d'une autre transaction (répétée ou tardive côté serveur) : ignorée
+            _LOGGER.debug("Réponse Modbus ignorée (transaction %s, attendue %s)", received, transaction)
+        if response[0] == function | 0x80:
+            raise ModbusError(function, response[1])
+        return response
+
+
+class ModbusSiteClient(SiteTransport):
+    """Client d'un site par scrutation Modbus-TCP du GX, pour les installations sans MQTT.
+
+    Seuls les topics présents dans MODBUS_REGISTERS sont servis ; les autres
+    (découverte par jokers notamment) sont ignorés. Les registres souscrits
+    sont regroupés en aussi peu de lectures que possible (voir plan_reads) et
+    scrutés à intervalle adaptatif, entre POLL_INTERVAL_MIN et POLL_INTERVAL_MAX.
+    Seules les valeurs modifiées sont distribuées ; un nouvel abonné reçoit
+    aussitôt la dernière valeur lue. Une écriture `W/...` est suivie d'une
+    lecture immédiate, dont l'écho confirme la commande.
+    """
+
+    def __init__(self, id_site, client_id=None, username=None, password=None, flush_interval=0, record_path=None, endpoints=None, pool=None):
+        super().__init__(id_site, flush_interval)
+        if not endpoints:
+            raise ValueError(f"Site {id_site} : le transport Modbus-TCP requiert l'adresse du GX")
+        self.endpoint = endpoints[0]
+        self._prefix = f"N/{id_site}/"
+        self._write_prefix = f"W/{id_site}/"
+        self._connection = ModbusTCPConnection(self.endpoint.host, self.endpoint.port)
+        self._callbacks = {}  # topic -> [(callback, extracteur ou None si brut), ...]
+        self._registers = {}  # topic souscrit -> registre
+        self._unmapped = set()  # Topics souscrits sans registre Modbus
+        self._values = {}  # topic -> dernière valeur lue
+        self._plan = None  # Lectures à effectuer, recalculées après un changement d'abonnement
+        self._max_gap = MAX_READ_GAP
+        self.poll_interval = POLL_INTERVAL_MIN
+        self._poll_now = asyncio.Event()
+        self._task = None
+        self._writes = set()  # Écritures de registre en cours (références gardées jusqu'à leur fin)
+        self._loop = None
+        self._running = False
+        self._waiting_since = None
+
+    async def async_start(self):
+        """Démarre la scrutation en arrière-plan."""
+        if self._running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._running = True
+        self._waiting_since = self._loop.time()
+        self.state_writer = StateWriteBuffer(self._loop, self.flush_interval)
+        self._task = self._loop.create_task(self._poll_loop())
+
+    async def async_stop(self):
+        """Arrête la scrutation et ferme la connexion."""
+        if not self._running:
+            return
+        self._running = False
+        self.state_writer.cancel()
+        self.commands.close()
+        task, self._task = self._task, None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        writes = list(self._writes)
+        for write in writes:
+            write.cancel()
+        await asyncio.gather(*writes, return_exceptions=True)
+        self._connection.close()
+        self._connected = False
+
+    def subscribed_topics(self):
+        """Topics souscrits servis par un registre Modbus."""
+        return sorted(self._registers)
+
+    def add_subscription(self, topic, callback, value_key="", raw=False):
+        """Ajoute un callback pour un topic ; sans registre Modbus, le topic n'est jamais servi."""
+        entry = (callback, None if raw else compile_value_path(value_key))
+        callbacks = self._callbacks.setdefault(topic, [])
+        callbacks.append(entry)
+        if len(callbacks) == 1:
+            register = MODBUS_REGISTERS.get(topic[len(self._prefix):]) if topic.startswith(self._prefix) else None
+            if register is None:
+                self._unmapped.add(topic)
+                _LOGGER.debug("Topic %s sans registre Modbus : ignoré", topic)
+            else:
+                self._registers[topic] = register
+                self._plan = None
+                self._poll_now.set()
+        if topic in self._values and self._running:
+            self._loop.call_soon(self._deliver_entry, topic, entry, self._values[topic])
+
+    def remove_subscription(self, topic, callback):
+        """Supprime le callback d'un topic ; son registre n'est plus lu après le dernier abonné."""
+        callbacks = self._callbacks.get(topic, [])
+        for entry in callbacks:
+            if entry[0] == callback:
+                callbacks.remove(entry)
+                break
+        else:
+            _LOGGER.error(f"Callback non trouvé pour le topic : {topic}")
+            return
+        if not callbacks:
+            del self._callbacks[topic]
+            self._unmapped.discard(topic)
+            self._values.pop(topic, None)
+            if self._registers.pop(topic, None) is not None:
+                self._plan = None
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """Traduit une écriture `W/{id_site}/...` en écriture du registre correspondant."""
+        register = MODBUS_REGISTERS.get(topic[len(self._write_prefix):]) if topic.startswith(self._write_prefix) else None
+        if register is None or not register.writable:
+            _LOGGER.error(f"Publication impossible sur le topic {topic} : aucun registre Modbus inscriptible")
+            return
+        if not self._running:
+            _LOGGER.error(f"Publication impossible sur le topic {topic} : client arrêté")
+            return
+        try:
+            value = compile_value_path()(decode_payload(payload))
+        except DecodeError as e:
+            _LOGGER.error(f"Valeur invalide pour le topic {topic} : {e}")
+            return
+        if not isinstance(value, (int, float)):
+            _LOGGER.error(f"Valeur non numérique pour le topic {topic} : {payload}")
+            return
+        task = self._loop.create_task(self._async_write(topic, register, value))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def _async_write(self, topic, register, value):
+        try:
+            await self._connection.write_register(register.unit, register.address, encode_register(register, value))
+        except (OSError, EOFError, asyncio.TimeoutError, ModbusError) as e:
+            _LOGGER.error(f"Erreur lors de l'écriture Modbus sur le topic {topic}: {e}")
+            return
+        _LOGGER.info(f"Registre {register.unit}/{register.address} écrit pour le topic {topic} : {value}")
+        self._poll_now.set()  # L'écho de la nouvelle valeur confirme la commande
+
+    def dispatch(self, topic, raw, timed=False):
+        """Distribue un payload Venus brut aux abonnés d'un topic (rejeu du trafic)."""
+        callbacks = self._callbacks.get(topic)
+        if not callbacks:
+            self.metrics.unrouted += 1
+            return
+        try:
+            payload = decode_payload(raw)
+        except DecodeError as e:
+            self.metrics.decode_errors += 1
+            _LOGGER.error(f"Erreur de décodage du message JSON sur le topic {topic}: {e}")
+            return
+        for callback, extract in list(callbacks):
+            self._call(callback, topic, raw if extract is None else extract(payload))
+
+    def _deliver(self, topic, value):
+        raw = None
+        for callback, extract in list(self._callbacks.get(topic, ())):
+            if extract is None:
+                if raw is None:
+                    raw = serialize_value(value)
+                self._call(callback, topic, raw)
+            else:
+                self._call(callback, topic, value)
+
+    def _deliver_entry(self, topic, entry, value):
+        callback, extract = entry
+        if entry in self._callbacks.get(topic, ()):
+            self._call(callback, topic, serialize_value(value) if extract is None else value)
+
+    @staticmethod
+    def _call(callback, topic, value):
+        try:
+            callback(topic, value)
+        except Exception as e:
+            _LOGGER.error("Erreur lors du traitement du message sur %s : %s", topic, e)
+
+    async def _poll_loop(self):
+        failures = 0
+        while self._running:
+            if not self._connection.connected:
+                try:
+                    await self._connection.async_connect()
+                except (OSError, asyncio.TimeoutError) as e:
+                    delay = reconnect_delay(failures)
+                    failures += 1
+                    _LOGGER.warning(f"Site {self.id_site} : connexion Modbus à {self.endpoint.host}:{self.endpoint.port} impossible ({e}), nouvel essai dans {delay:.0f} s")
+                    await asyncio.sleep(delay)
+                    continue
+                if failures or self.metrics.messages:
+                    self.metrics.reconnects += 1
+                failures = 0
+                self._connected = True
+                _LOGGER.info(f"Site {self.id_site} connecté via Modbus-TCP ({self.endpoint.host})")
+
+            self._poll_now.clear()
+            start = time.perf_counter()
+            try:
+                changed = await self._poll()
+            except (OSError, EOFError, asyncio.TimeoutError) as e:
+                _LOGGER.warning(f"Site {self.id_site} : connexion Modbus perdue ({e})")
+                self._on_connection_lost()
+                continue
+            elapsed = time.perf_counter() - start
+            self.metrics.poll_time.observe(elapsed)
+            self.poll_interval = self._next_interval(changed, elapsed)
+            try:
+                await asyncio.wait_for(self._poll_now.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _on_connection_lost(self):
+        self._connection.close()
+        self._connected = False
+        self.full_sync_done = False
+        self._waiting_since = self._loop.time()
+
+    def _next_interval(self, changed, elapsed):
+        """Resserre l'intervalle quand des valeurs ont changé, l'élargit sinon.
+
+        L'intervalle reste au moins le double de la durée de scrutation, pour ne
+        pas occuper le serveur Modbus du GX en permanence.
+        """
+        if changed:
+            interval = max(POLL_INTERVAL_MIN, self.poll_interval / POLL_INTERVAL_GROWTH)
+        else:
+            interval = min(POLL_INTERVAL_MAX, self.poll_interval * POLL_INTERVAL_GROWTH)
+        return max(interval, 2 * elapsed)
+
+    async def _poll(self):
+        """Lit les registres souscrits et distribue les valeurs modifiées ; retourne leur nombre."""
+        if self._plan is None:
+            self._plan = plan_reads(((r.unit, r.address) for r in self._registers.values()), self._max_gap)
+        plan = self._plan
+        registers = list(self._registers.items())
+        changed = 0
+        for unit, start, count in plan:
+            try:
+                words = await self._connection.read_registers(unit, start, count)
+            except ModbusError as e:
+                if e.code == ILLEGAL_DATA_ADDRESS and self._max_gap:
+                    # Un registre intermédiaire n'existe pas sur ce GX : ne plus lire que des registres utiles
+                    _LOGGER.warning(f"Site {self.id_site} : lecture {unit}/{start}+{count} refusée, blocs limités aux registres souscrits")
+                    self._max_gap = 0
+                    self._plan = None
+                    return changed
+                _LOGGER.error(f"Site {self.id_site} : lecture Modbus {unit}/{start}+{count} en erreur : {e}")
+                continue
+            self.metrics.messages += 1
+            self.metrics.bytes += 2 * count
+            for topic, register in registers:
+                offset = register.address - start
+                if register.unit != unit or not 0 <= offset < count:
+                    continue
+                value = decode_register(register, words[offset])
+                if self._values.get(topic, _MISSING) != value:
+                    self._values[topic] = value
+                    changed += 1
+                    self._deliver(topic, value)
+        if plan and self._waiting_since is not None:
+            self.time_to_first_value = self._loop.time() - self._waiting_since
+            self._waiting_since = None
+            _LOGGER.info(f"Site {self.id_site} : première valeur reçue en {self.time_to_first_value:.2f} s")
+        self.full_sync_done = True
+        return changed
+
+    def diagnostics(self):
+        """État du client et de ses métriques, pour le téléchargement des diagnostics."""
+        return {
+            "client": {
+                "endpoint": self.endpoint._asdict(),
+                "connected": self._connected,
+                "full_sync_done": self.full_sync_done,
+                "time_to_first_value": self.time_to_first_value,
+                "subscribed_topics": self.subscribed_topics(),
+                "unmapped_topics": sorted(self._unmapped),
+                "subscriptions": sum(len(callbacks) for callbacks in self._callbacks.values()),
+                "reads": [list(block) for block in self._plan or ()],
+                "poll_interval": self.poll_interval,
+            },
+            "metrics": self.metrics.as_dict(),
+        }
+
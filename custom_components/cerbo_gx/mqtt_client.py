@@ -1,166 +1,871 @@
 import paho.mqtt.client as mqtt
-import ssl
-import os
 import asyncio
 import logging
 import json
+import heapq
+import random
+import secrets
+import time
+from .state_writer import StateWriteBuffer
+from .decoder import DecodeError, compile_value_path, decode_payload
+from .endpoints import BrokerEndpoint, lan_endpoint, vrm_endpoint  # noqa: F401 (réexportés)
+from .metrics import Histogram
+from .modbus import ModbusSiteClient
+from .topic_router import TopicRouter, pattern_covers
+from .tls import ResumableContext, ssl_context
+from .traffic_log import TrafficRecorder
+from .transport import RECONNECT_DELAY, RECONNECT_MAX_DELAY, TRANSPORT_MODBUS, TRANSPORT_MQTT, SiteTransport, reconnect_delay  # noqa: F401 (réexportés)
+from .workers import WorkerPool
 
 _LOGGER = logging.getLogger(__name__)
 
-class CerboMQTTClient:
-    def __init__(self, id_site, client_id=None, username=None, password=None):
-        self.id_site = id_site
-        self.client = mqtt.Client(client_id)
-        self.username = username
-        self.password = password
-        self.broker_url = self._get_vrm_broker_url()
-
-        if self.username and self.password:
-            self.client.username_pw_set(self.username, self.password)
-        
-        self.ca_cert_path = os.path.join(os.path.dirname(__file__), "venus-ca.crt")
-        if os.path.exists(self.ca_cert_path):
-            loop = asyncio.get_event_loop()
-            loop.run_in_executor(None, self._configure_tls)
-        else:
-            raise FileNotFoundError(f"Le certificat CA n'a pas été trouvé à l'emplacement : {self.ca_cert_path}")
-        
+# Marqueur « pas encore décodé » (None est un résultat valide)
+_UNDECODED = object()
+
+# Période du moteur d'E/S partagé (loop_misc : pings MQTT, reconnexions)
+IO_TICK_INTERVAL = 1
+# Connexions (DNS, TCP, TLS) menées en parallèle au plus, au démarrage comme après une panne
+MAX_CONCURRENT_CONNECTS = 8
+# Venus oublie un keep-alive au bout de 60 s : il faut le renouveler avant
+VENUS_KEEPALIVE_TIMEOUT = 60
+# Intervalle de keep-alive tant que la première publication complète n'est pas terminée
+KEEPALIVE_INTERVAL_SYNC = 30
+# Intervalle une fois synchronisé (republication supprimée) : marge sous le délai de Venus
+KEEPALIVE_INTERVAL_SYNCED = VENUS_KEEPALIVE_TIMEOUT * 0.75
+# Variation aléatoire (±) appliquée à chaque intervalle pour étaler les sites
+KEEPALIVE_JITTER = 0.1
+# Demande à Venus de ne pas republier tout l'arbre à chaque keep-alive
+KEEPALIVE_SUPPRESS_REPUBLISH = json.dumps({"keepalive-options": ["suppress-republish"]})
+# Callbacks écrits pour l'API 1.x de paho : paho 2.x doit la sélectionner explicitement
+_PAHO_CLIENT_OPTIONS = {"callback_api_version": mqtt.CallbackAPIVersion.VERSION1} if hasattr(mqtt, "CallbackAPIVersion") else {}
+
+
+class BrokerConnection:
+    """Connexion MQTT partagée par tous les sites d'un même broker et d'un même compte.
+
+    La connexion possède le client paho et ses E/S (socket surveillé par la boucle
+    asyncio), compte les abonnements de ses sites par topic et aiguille chaque
+    message reçu vers le site désigné par le deuxième niveau du topic.
+    """
+
+    def __init__(self, pool, key, endpoint, username=None, password=None, client_id=None):
+        self.pool = pool
+        self.key = key
+        self.endpoint = endpoint
+        self.client = mqtt.Client(client_id=f"{client_id or 'cerbo_gx'}-{secrets.token_hex(4)}", **_PAHO_CLIENT_OPTIONS)
+        if endpoint.auth and username and password:
+            self.client.username_pw_set(username, password)
+
         self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
         self.client.on_message = self._on_global_message
-        self.subscriptions = {}  # Dictionnaire pour gérer les abonnements par topic
-
-    def _configure_tls(self):
-        """Configure TLS pour la connexion MQTT."""
-        self.client.tls_set(ca_certs=self.ca_cert_path, certfile=None, keyfile=None, tls_version=ssl.PROTOCOL_TLSv1_2)
-
-    def _get_vrm_broker_url(self):
-        """Générer l'URL du courtier MQTT basé sur l'ID du site."""
-        sum = 0
-        for character in self.id_site.lower().strip():
-            sum += ord(character)
-        broker_index = sum % 128
-        return f"mqtt{broker_index}.victronenergy.com"
-
-    def connect(self):
-        """Connexion au broker MQTT avec démarrage de la boucle de gestion des événements."""
-        loop = asyncio.get_event_loop()
-        loop.run_in_executor(None, self._connect_sync)
-        loop.create_task(self._keep_alive())
+        # Les E/S réseau sont pilotées par la boucle asyncio (pas de loop_start())
+        self.client.on_socket_open = self._on_socket_open
+        self.client.on_socket_close = self._on_socket_close
+        self.client.on_socket_register_write = self._on_socket_register_write
+        self.client.on_socket_unregister_write = self._on_socket_unregister_write
 
-    def _connect_sync(self):
-        """Connexion synchronisée au broker MQTT."""
+        self.sites = {}  # id_site -> CerboMQTTClient
+        self._topics = {}  # topic -> nombre de sites abonnés
+        self._tls = None  # ResumableContext : contexte partagé + session TLS à reprendre
+        self.handshake_time = None  # Durée de la dernière connexion (TCP + TLS), en secondes
+        self.session_reused = False
+        self._loop = None
+        self._sock_fd = None
+        self._connect_task = None
+        self._running = False
+        self.connected = False
+        self._session_established = False
+        self._failures = 0  # Échecs consécutifs, pour le backoff
+        self._reconnect_handle = None
+
+    # Cycle de vie
+
+    def start(self, loop, failures=0):
+        """Démarre la connexion (la partie bloquante s'exécute dans l'exécuteur).
+
+        `failures` reprend les échecs déjà subis par le site sur un autre broker :
+        les tentatives suivantes prolongent le même backoff au lieu de repartir de zéro.
+        """
+        if self._running:
+            return
+        self._loop = loop
+        self._running = True
+        self._failures = failures
+        self._schedule_connect()
+
+    def stop(self):
+        """Ferme la connexion ; une connexion en cours se fermera d'elle-même."""
+        if not self._running:
+            return
+        self._running = False
+        self._cancel_reconnect()
+        self._disconnect()
+
+    def _schedule_connect(self):
+        """Lance une tentative de connexion si aucune n'est déjà en cours."""
+        self._reconnect_handle = None
+        if self._running and (self._connect_task is None or self._connect_task.done()):
+            self._connect_task = self._loop.create_task(self._async_connect())
+
+    def _schedule_reconnect(self):
+        """Planifie la prochaine tentative selon le backoff ; le client paho est réutilisé."""
+        self._cancel_reconnect()
+        delay = reconnect_delay(self._failures)
+        self._failures += 1
+        _LOGGER.info(f"Nouvelle tentative de connexion à {self.endpoint.host} dans {delay:.1f} s")
+        self._reconnect_handle = self._loop.call_later(delay, self._schedule_connect)
+
+    def _cancel_reconnect(self):
+        if self._reconnect_handle is not None:
+            self._reconnect_handle.cancel()
+            self._reconnect_handle = None
+
+    async def _async_connect(self):
+        """Connexion au broker ; seule la partie bloquante (DNS, TCP, TLS) passe par l'exécuteur.
+
+        Le nombre de connexions simultanées est borné par le pool.
+        """
+        endpoint = self.endpoint
+        self._session_established = False
         try:
-            self.client.connect(self.broker_url, 8883)
-            self.client.loop_start()  # Chaque client a sa propre boucle
+            async with self.pool.connect_slots:
+                if not self._running:
+                    return
+                await self._loop.run_in_executor(None, self._connect_sync)
         except Exception as e:
-            _LOGGER.error(f"Erreur lors de la connexion au serveur MQTT : {e}")
+            _LOGGER.error(f"Erreur lors de la connexion au serveur MQTT {endpoint.host}:{endpoint.port} : {e}")
+            if self._running:
+                self._schedule_reconnect()
+                self._notify_failure()
+            return
+        _LOGGER.debug(
+            f"Connexion TCP/TLS à {endpoint.host} en {self.handshake_time * 1000:.1f} ms (session TLS reprise : {self.session_reused})"
+        )
+        if not self._running:
+            self._disconnect()
 
-    def disconnect(self):
-        """Déconnexion du serveur MQTT."""
-        loop = asyncio.get_event_loop()
-        loop.run_in_executor(None, self._disconnect_sync)
+    def _connect_sync(self):
+        """Connexion synchronisée au broker MQTT (exécutée hors de la boucle)."""
+        endpoint = self.endpoint
+        if endpoint.tls and self._tls is None:
+            # Contexte construit une seule fois par processus, puis partagé
+            self._tls = ResumableContext(ssl_context(endpoint.verify), endpoint.host, endpoint.port)
+            self.client.tls_set_context(self._tls)
+        start = time.perf_counter()
+        self.client.connect(endpoint.host, endpoint.port)
+        self.handshake_time = time.perf_counter() - start
+        if self._tls is not None:
+            # Session mémorisée pour la prochaine connexion à ce broker
+            self.session_reused = self._tls.save_session(self.client.socket())
 
-    def _disconnect_sync(self):
-        """Déconnexion synchronisée du serveur MQTT."""
+    def _disconnect(self):
+        """Déconnexion du serveur MQTT (le socket est fermé après l'envoi du DISCONNECT)."""
         try:
-            self.client.loop_stop()
             self.client.disconnect()
         except Exception as e:
             _LOGGER.error(f"Erreur lors de la déconnexion : {e}")
 
+    def loop_misc(self):
+        """Appelé périodiquement par le moteur d'E/S du MQTTManager."""
+        if self._sock_fd is not None:
+            self.client.loop_misc()
+
+    # Sites et abonnements
+
+    def attach(self, site):
+        """Rattache un site à la connexion et souscrit ses topics."""
+        self.sites[site.id_site] = site
+        self.subscribe(site.subscribed_topics())
+
+    def detach(self, site):
+        """Détache un site ; retourne le nombre de sites restants."""
+        if self.sites.get(site.id_site) is site:
+            del self.sites[site.id_site]
+            self.unsubscribe(site.subscribed_topics())
+        return len(self.sites)
+
+    def subscribe(self, topics):
+        """Ajoute une référence à chaque topic ; les nouveaux partent en un seul SUBSCRIBE."""
+        new = []
+        for topic in topics:
+            count = self._topics.get(topic, 0)
+            self._topics[topic] = count + 1
+            if not count:
+                new.append(topic)
+        if new and self.connected:
+            self.client.subscribe([(topic, 0) for topic in new])
+            _LOGGER.debug(f"Souscription ajoutée aux topics : {new}")
+
+    def unsubscribe(self, topics):
+        """Retire une référence à chaque topic ; ceux qui ne sont plus utilisés sont désabonnés."""
+        removed = []
+        for topic in topics:
+            count = self._topics.get(topic, 0) - 1
+            if count > 0:
+                self._topics[topic] = count
+            elif topic in self._topics:
+                del self._topics[topic]
+                removed.append(topic)
+        if removed and self.connected:
+            self.client.unsubscribe(removed)
+            _LOGGER.debug(f"Souscription supprimée pour les topics : {removed}")
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        return self.client.publish(topic, payload, qos=qos, retain=retain)
+
+    # Callbacks paho
+
     def on_connect(self, client, userdata, flags, rc):
         """Gestion de l'événement de connexion au broker MQTT."""
         if rc == 0:
-            _LOGGER.info(f"Connexion réussie avec le code de retour {rc}")
-            keepalive_topic = f"R/{self.id_site}/keepalive"
-            self.client.publish(keepalive_topic, "", qos=0)
-            _LOGGER.info(f"Message envoyé au topic {keepalive_topic} : ''")
-
-            # Réabonner tous les topics
-            for topic in self.subscriptions.keys():
-                self.client.subscribe(topic)
-                _LOGGER.info(f"Réabonnement au topic : {topic}")
+            self.connected = True
+            self._session_established = True
+            self._failures = 0
+            _LOGGER.info(f"Connexion réussie à {self.endpoint.host} avec le code de retour {rc}")
+
+            # Réabonner tous les topics de tous les sites en un seul paquet SUBSCRIBE
+            if self._topics:
+                self.client.subscribe([(topic, 0) for topic in self._topics])
+                _LOGGER.info(f"Réabonnement à {len(self._topics)} topics sur {self.endpoint.host}")
+            for site in list(self.sites.values()):
+                site.on_connected()
         else:
             _LOGGER.error(f"Erreur de connexion avec le code de retour {rc}")
 
+    def on_disconnect(self, client, userdata, rc):
+        """Gestion de la perte de connexion : la reconnexion est planifiée avec backoff."""
+        self.connected = False
+        for site in list(self.sites.values()):
+            site.on_disconnected(self._session_established)
+        if self._running and rc != mqtt.MQTT_ERR_SUCCESS:
+            _LOGGER.warning(f"Connexion perdue avec {self.endpoint.host} (code {rc})")
+            self._schedule_reconnect()
+            if not self._session_established:
+                self._notify_failure()
+
+    def _notify_failure(self):
+        """Signale aux sites un échec de connexion (ils peuvent basculer vers un autre broker)."""
+        for site in list(self.sites.values()):
+            site.on_connection_failed(self)
+
     def _on_global_message(self, client, userdata, msg):
-        """Gestionnaire global pour tous les messages reçus."""
-        _LOGGER.debug("Message reçu sur le topic %s : %s", msg.topic, msg.payload)
-        if msg.topic in self.subscriptions:
-            for callback in self.subscriptions[msg.topic]:
-                callback(client, userdata, msg)
-
-    def add_subscription(self, topic, callback):
-        """Ajoute un abonnement MQTT avec un callback."""
-        if topic not in self.subscriptions:
-            self.subscriptions[topic] = []
-            self.client.subscribe(topic)  # Souscrire une seule fois par topic
-            _LOGGER.debug(f"Souscription ajoutée au topic : {topic}")
-
-        self.subscriptions[topic].append(callback)
-        self.client.message_callback_add(topic, self._on_global_message)
+        """Aiguille un message vers son site (`N/{id_site}/...`)."""
+        topic = msg.topic
+        start = topic.find("/") + 1
+        site = self.sites.get(topic[start:topic.find("/", start)])
+        if site is not None:
+            site.on_message(topic, msg.payload)
+        else:
+            # Topic hors de l'arborescence d'un site : diffusé aux sites qui l'écoutent
+            for site in list(self.sites.values()):
+                site.on_message(topic, msg.payload)
 
-    def remove_subscription(self, topic, callback):
-        """Supprime un abonnement MQTT et son callback."""
-        if topic in self.subscriptions:
+    # E/S pilotées par la boucle asyncio
+
+    def _call_in_loop(self, callback, *args):
+        """Exécute le callback dans la boucle ; paho peut nous appeler depuis l'exécuteur pendant connect()."""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            callback(*args)
+        else:
+            self._loop.call_soon_threadsafe(callback, *args)
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._call_in_loop(self._add_reader, sock.fileno())
+
+    def _add_reader(self, fd):
+        self._sock_fd = fd
+        self._loop.add_reader(fd, self._on_readable)
+
+    def _on_readable(self):
+        client = self.client
+        # loop_read() lit un paquet ; en TLS, les enregistrements déjà déchiffrés restent dans le
+        # tampon du SSLSocket sans que le descripteur redevienne lisible : on les lit tous ici
+        while client.loop_read() == mqtt.MQTT_ERR_SUCCESS:
+            sock = client.socket()
+            pending = getattr(sock, "pending", None)
+            if pending is None or not pending():
+                break
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._call_in_loop(self._remove_socket)
+
+    def _remove_socket(self):
+        if self._sock_fd is not None:
+            self._loop.remove_reader(self._sock_fd)
+            self._loop.remove_writer(self._sock_fd)
+            self._sock_fd = None
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._call_in_loop(self._add_writer)
+
+    def _add_writer(self):
+        if self._sock_fd is not None:
+            self._loop.add_writer(self._sock_fd, self._on_writable)
+
+    def _on_writable(self):
+        self.client.loop_write()
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._call_in_loop(self._remove_writer)
+
+    def _remove_writer(self):
+        if self._sock_fd is not None:
+            self._loop.remove_writer(self._sock_fd)
+
+
+class ConnectionPool:
+    """Connexions partagées, indexées par (broker, identifiants), avec comptage de références."""
+
+    def __init__(self):
+        self.connections = {}
+        self.connect_slots = asyncio.Semaphore(MAX_CONCURRENT_CONNECTS)
+
+    def acquire(self, site, endpoint, failures=0):
+        """Rattache un site à la connexion de son broker, en la créant au besoin.
+
+        `failures` : échecs consécutifs du site, repris par une connexion créée.
+        """
+        key = (endpoint, site.username if endpoint.auth else None, site.password if endpoint.auth else None)
+        connection = self.connections.get(key)
+        if connection is None:
+            connection = self.connections[key] = BrokerConnection(
+                self, key, endpoint, site.username, site.password, site.client_id
+            )
+            connection.start(asyncio.get_running_loop(), failures)
+        elif len(connection.sites):
+            _LOGGER.info(f"Site {site.id_site} : connexion partagée avec {endpoint.host} réutilisée")
+        connection.attach(site)
+        return connection
+
+    def release(self, site, connection):
+        """Détache un site ; la connexion est fermée quand plus aucun site ne l'utilise."""
+        if connection.detach(site) == 0:
+            self.connections.pop(connection.key, None)
+            connection.stop()
+
+    def loop_misc(self):
+        for connection in list(self.connections.values()):
             try:
-                self.subscriptions[topic].remove(callback)
-                _LOGGER.debug(f"Callback supprimé pour le topic : {topic}")
+                connection.loop_misc()
+            except Exception as e:
+                _LOGGER.error(f"Erreur dans la boucle MQTT de {connection.endpoint.host} : {e}")
 
-                if not self.subscriptions[topic]:  # Si plus aucun callback pour ce topic
-                    del self.subscriptions[topic]
-                    self.client.unsubscribe(topic)  # Désinscrire du topic
-                    _LOGGER.debug(f"Souscription supprimée pour le topic : {topic}")
 
-            except ValueError:
-                _LOGGER.error(f"Callback non trouvé pour le topic : {topic}")
+class CerboMQTTClient(SiteTransport):
+    """Client MQTT d'un site : abonnés, décodage, keep-alive et écritures d'état.
 
-    async def _keep_alive(self):
-        """Envoie régulièrement des messages de keep-alive."""
-        while True:
-            await asyncio.sleep(30)
-            keepalive_topic = f"R/{self.id_site}/keepalive"
-            self.client.publish(keepalive_topic, "", qos=0)
-            _LOGGER.info(f"Message de keep-alive envoyé au topic {keepalive_topic} : ''")
+    Le transport est une BrokerConnection éventuellement partagée avec d'autres
+    sites du même compte. Seuls les topics ayant au moins un abonné (entité
+    activée, découverte, commande) y sont souscrits : le broker ne transmet
+    rien pour les valeurs dont aucune entité n'a besoin. Un topic couvert par
+    un joker souscrit du site n'est pas souscrit en plus : chaque message
+    n'arrive qu'une fois. Les changements d'abonnement d'un même tour de
+    boucle partent en un seul SUBSCRIBE et un seul UNSUBSCRIBE.
+    """
+
+    def __init__(self, id_site, client_id=None, username=None, password=None, flush_interval=0, record_path=None, endpoints=None, pool=None):
+        super().__init__(id_site, flush_interval)
+        self.client_id = client_id
+        self.record_path = record_path
+        self.recorder = None
+        self.username = username
+        self.password = password
+        # Brokers par ordre de préférence ; les suivants servent de repli
+        self.endpoints = list(endpoints) if endpoints else [vrm_endpoint(id_site)]
+        self.endpoint = self.endpoints[0]
+        self.broker_url = self.endpoint.host
+        self._endpoint_index = 0
+        self._pool = pool if pool is not None else ConnectionPool()
+        self._connection = None
+
+        # Distribution via le routeur ; seuls les topics non couverts par un joker sont souscrits sur le broker
+        self.router = TopicRouter()
+        self._entries = {}  # (topic, callback) -> (callback, extracteur) enregistré dans le routeur
+        self._refs = {}  # topic -> nombre d'abonnés
+        self._subscribed = set()  # Topics transmis à la connexion
+        self._new_topics = []  # Topics ajoutés depuis le dernier envoi (lecture R/ après synchronisation)
+        self._subscription_handle = None
+
+        # Venus publie full_publish_completed à la fin d'une republication complète
+        self.keepalive_topic = f"R/{id_site}/keepalive"
+        full_publish_topic = f"N/{id_site}/full_publish_completed"
+        self.router.add(full_publish_topic, (self._on_full_publish_completed, compile_value_path()))
+        self._refs[full_publish_topic] = 1  # Toujours souscrit : mesure du keep-alive et fin de synchronisation
+
+        self._loop = None
+        self._running = False
+        self._waiting_since = None
+        self._keepalive_sent_at = None
+        self._was_connected = False
+        self._failures = 0  # Échecs de connexion consécutifs, tous brokers confondus
+        self._switch_handle = None
+
+    @property
+    def client(self):
+        """Client paho de la connexion courante (partagée)."""
+        return self._connection.client if self._connection is not None else None
+
+    async def async_start(self):
+        """Démarre le client : rattachement à la connexion de son broker."""
+        if self._running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._running = True
+        self._waiting_since = self._loop.time()
+        self.state_writer = StateWriteBuffer(self._loop, self.flush_interval)
+        if self.record_path:
+            recorder = TrafficRecorder(self.record_path, self._loop)
+            try:
+                await recorder.async_open()
+                self.recorder = recorder
+            except OSError as e:
+                _LOGGER.error(f"Impossible d'ouvrir le journal de trafic {self.record_path} : {e}")
+        self._attach()
+
+    def _attach(self):
+        """Rattache le site à la connexion (partagée) de son broker courant."""
+        self._flush_subscriptions()
+        self._connection = self._pool.acquire(self, self.endpoint, self._failures)
+        if self._connection.connected:
+            self.on_connected()
+
+    async def async_stop(self):
+        """Arrête le client : se détache de sa connexion (fermée si plus aucun site ne l'utilise)."""
+        if not self._running:
+            return
+        self._running = False
+        self.state_writer.cancel()
+        self.commands.close()
+        if self._subscription_handle is not None:
+            self._subscription_handle.cancel()
+            self._subscription_handle = None
+        if self._switch_handle is not None:
+            self._switch_handle.cancel()
+            self._switch_handle = None
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self._pool.release(self, connection)
+        self._connected = False
+        if self.recorder is not None:
+            recorder, self.recorder = self.recorder, None
+            await recorder.async_close()
+
+    def subscribed_topics(self):
+        """Topics souscrits sur le broker pour ce site."""
+        return sorted(self._subscribed)
+
+    def on_connected(self):
+        """Appelé par la connexion lorsque la session MQTT est établie."""
+        self._connected = True
+        self._failures = 0
+        if self._was_connected:
+            self.metrics.reconnects += 1
+        self._was_connected = True
+        _LOGGER.info(f"Site {self.id_site} connecté via {self.endpoint.name} ({self.endpoint.host})")
+        # Nouvelle session : le premier keep-alive demande une publication complète
+        self.full_sync_done = False
+        # Les abonnements demandés par ce changement (découverte) partent avant le keep-alive
+        self._flush_subscriptions()
+        self.send_keepalive()
+
+    def on_disconnected(self, established):
+        """Appelé par la connexion lorsque la session MQTT est perdue."""
+        self._connected = False
+        if self._waiting_since is None and self._running:
+            self._waiting_since = self._loop.time()
+        if established and self._endpoint_index and self._running:
+            # La session de repli est tombée : retenter d'abord le broker préféré
+            self._schedule_switch(self._connection, 0, reconnect_delay(self._failures))
+
+    def on_connection_failed(self, connection):
+        """Après un échec de connexion, passe au broker suivant (par exemple du GX local vers VRM).
+
+        La bascule attend le délai de backoff du site : les échecs étant comptés
+        sur l'ensemble des brokers, des brokers tous injoignables sont retentés
+        de plus en plus rarement au lieu de l'être en boucle.
+        """
+        delay = reconnect_delay(self._failures)
+        self._failures += 1
+        if len(self.endpoints) > 1:
+            self._schedule_switch(connection, (self._endpoint_index + 1) % len(self.endpoints), delay)
+
+    def _schedule_switch(self, connection, index, delay):
+        if self._switch_handle is not None:
+            self._switch_handle.cancel()
+        self._switch_handle = self._loop.call_later(delay, self._switch_endpoint, connection, index)
+
+    def _switch_endpoint(self, connection, index):
+        self._switch_handle = None
+        if connection is not self._connection or not self._running or index == self._endpoint_index or self._connected:
+            return
+        self._endpoint_index = index
+        self.endpoint = self.endpoints[index]
+        self.broker_url = self.endpoint.host
+        _LOGGER.warning(f"Site {self.id_site} : bascule vers le broker {self.endpoint.name}")
+        self._connected = False
+        self._pool.release(self, connection)
+        self._attach()
+
+    def on_message(self, topic, raw):
+        """Message reçu par la connexion pour ce site."""
+        if self._waiting_since is not None:
+            self._on_first_value()
+        if self.recorder is not None:
+            self.recorder.record(topic, raw)
+        metrics = self.metrics
+        metrics.messages += 1
+        metrics.bytes += len(raw)
+        if metrics.sampled(metrics.messages):
+            start = time.perf_counter()
+            self.dispatch(topic, raw, timed=True)
+            metrics.dispatch_time.observe(time.perf_counter() - start)
+        else:
+            self.dispatch(topic, raw)
+
+    def _on_first_value(self):
+        self.time_to_first_value = self._loop.time() - self._waiting_since
+        self._waiting_since = None
+        _LOGGER.info(f"Site {self.id_site} : première valeur reçue en {self.time_to_first_value:.2f} s")
+
+    def dispatch(self, topic, raw, timed=False):
+        """Décode un payload une seule fois et distribue la valeur aux abonnés du topic.
+
+        Avec `timed=True`, la durée du décodage est mesurée (échantillonnage des métriques).
+        """
+        entries = self.router.match(topic)
+        if not entries:
+            self.metrics.unrouted += 1
+            return
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug("Message reçu sur le topic %s : %s", topic, raw)
+
+        payload = _UNDECODED
+        values = {}
+        for callback, extract in entries:
+            if extract is None:
+                # Abonné « brut » (découverte, enregistrement) : aucun décodage
+                value = raw
+            else:
+                if payload is _UNDECODED:
+                    if timed:
+                        start = time.perf_counter()
+                        payload = self._decode(topic, raw)
+                        self.metrics.decode_time.observe(time.perf_counter() - start)
+                    else:
+                        payload = self._decode(topic, raw)
+                if payload is None:
+                    continue
+                value = values.get(extract, _UNDECODED)
+                if value is _UNDECODED:
+                    value = values[extract] = extract(payload)
+            try:
+                callback(topic, value)
+            except Exception as e:
+                _LOGGER.error("Erreur lors du traitement du message sur %s : %s", topic, e)
+
+    def _decode(self, topic, raw):
+        """Décode un payload ; retourne None s'il est vide ou invalide."""
+        try:
+            payload = decode_payload(raw)
+        except DecodeError as e:
+            self.metrics.decode_errors += 1
+            _LOGGER.error(f"Erreur de décodage du message JSON sur le topic {topic}: {e}")
+            return None
+        if payload is None:
+            _LOGGER.debug("Message vide reçu sur le topic %s", topic)
+        return payload
+
+    def add_subscription(self, topic, callback, value_key="", raw=False):
+        """Ajoute un callback pour un topic (les jokers `+` et `#` sont acceptés).
+
+        Le callback reçoit `(topic, valeur)`, la valeur étant extraite du payload
+        décodé selon `value_key` (voir decoder.compile_value_path). Avec `raw=True`,
+        il reçoit le payload brut (bytes) et ne déclenche aucun décodage.
+        """
+        entry = (callback, None if raw else compile_value_path(value_key))
+        self._entries[(topic, callback)] = entry
+        self.router.add(topic, entry)
+
+        count = self._refs.get(topic, 0)
+        self._refs[topic] = count + 1
+        if not count:
+            self._new_topics.append(topic)
+            self._schedule_subscriptions()
+
+    def remove_subscription(self, topic, callback):
+        """Supprime le callback d'un topic ; le topic est désabonné avec son dernier abonné."""
+        entry = self._entries.pop((topic, callback), None)
+        if entry is None:
+            _LOGGER.error(f"Callback non trouvé pour le topic : {topic}")
+            return
+        self.router.remove(topic, entry)
+        _LOGGER.debug(f"Callback supprimé pour le topic : {topic}")
+
+        count = self._refs[topic] - 1
+        if count:
+            self._refs[topic] = count
+        else:
+            del self._refs[topic]
+            self._schedule_subscriptions()
+
+    def _schedule_subscriptions(self):
+        """Regroupe les changements d'abonnement jusqu'au prochain tour de boucle."""
+        if self._subscription_handle is None and self._running:
+            self._subscription_handle = self._loop.call_soon(self._flush_subscriptions)
+
+    def _flush_subscriptions(self):
+        """Transmet à la connexion les topics ajoutés et retirés depuis le dernier envoi."""
+        if self._subscription_handle is not None:
+            self._subscription_handle.cancel()
+            self._subscription_handle = None
+        refs = self._refs
+        wildcards = [topic for topic in refs if "+" in topic or "#" in topic]
+        wanted = [
+            topic for topic in refs
+            if not any(wildcard != topic and pattern_covers(wildcard, topic) for wildcard in wildcards)
+        ]
+        added = [topic for topic in wanted if topic not in self._subscribed]
+        removed = list(self._subscribed.difference(wanted))
+        self._subscribed.difference_update(removed)
+        self._subscribed.update(added)
+        new_topics, self._new_topics = self._new_topics, []
+        if self._connection is not None:
+            # Sans connexion, le rattachement souscrira l'ensemble à jour
+            if added:
+                self._connection.subscribe(added)
+            if removed:
+                self._connection.unsubscribe(removed)
+            if self.full_sync_done and self._connected:
+                self._request_values(new_topics)
+
+    def _request_values(self, topics):
+        """Demande à Venus la valeur courante des topics souscrits après la publication complète.
+
+        Les keep-alive suppriment alors la republication : sans lecture `R/`, un
+        topic ajouté ensuite (entité réactivée, commande) resterait inconnu
+        jusqu'au prochain changement de sa valeur.
+        """
+        prefix = f"N/{self.id_site}/"
+        for topic in topics:
+            if topic in self._refs and topic.startswith(prefix) and "+" not in topic and "#" not in topic:
+                self._connection.publish(f"R/{topic[2:]}", "", qos=0)
+
+    def diagnostics(self):
+        """État du client, de sa connexion et de ses métriques, pour le téléchargement des diagnostics."""
+        data = {
+            "client": {
+                "endpoint": self.endpoint._asdict(),
+                "connected": self._connected,
+                "full_sync_done": self.full_sync_done,
+                "time_to_first_value": self.time_to_first_value,
+                "subscribed_topics": self.subscribed_topics(),
+                "subscriptions": len(self._entries),
+            },
+            "metrics": self.metrics.as_dict(),
+        }
+        connection = self._connection
+        if connection is not None:
+            data["connection"] = {
+                "sites": sorted(connection.sites),
+                "handshake_time": connection.handshake_time,
+                "session_reused": connection.session_reused,
+            }
+        return data
+
+    def keepalive_interval(self):
+        """Intervalle avant le prochain keep-alive, ou None s'il est inutile.
+
+        Sans abonné, rien ne justifie de maintenir la publication de Venus ;
+        une fois l'arbre complet reçu, les keep-alive ne servent plus qu'à ne
+        pas expirer et peuvent être espacés.
+        """
+        if not self._entries:
+            return None
+        return KEEPALIVE_INTERVAL_SYNCED if self.full_sync_done else KEEPALIVE_INTERVAL_SYNC
+
+    def send_keepalive(self):
+        """Envoie un keep-alive ; après la synchronisation initiale, sans republication complète."""
+        payload = KEEPALIVE_SUPPRESS_REPUBLISH if self.full_sync_done else ""
+        self._connection.publish(self.keepalive_topic, payload, qos=0)
+        self._keepalive_sent_at = self._loop.time()
+        _LOGGER.debug("Message de keep-alive envoyé au topic %s : %r", self.keepalive_topic, payload)
+
+    def _on_full_publish_completed(self, topic, value):
+        if self._keepalive_sent_at is not None:
+            # Aller-retour mesuré du dernier keep-alive envoyé à la fin de la publication qu'il a déclenchée
+            self.metrics.keepalive_rtt.observe(self._loop.time() - self._keepalive_sent_at)
+            self._keepalive_sent_at = None
+        if not self.full_sync_done:
+            _LOGGER.info(f"Publication complète reçue pour le site {self.id_site}")
+        self.full_sync_done = True
 
     def publish(self, topic, payload, qos=0, retain=False):
         """Publier un message sur un topic donné."""
+        if self._connection is None:
+            _LOGGER.error(f"Publication impossible sur le topic {topic} : client arrêté")
+            return
         try:
-            self.client.publish(topic, payload, qos=qos, retain=retain)
+            self._connection.publish(topic, payload, qos=qos, retain=retain)
             _LOGGER.info(f"Message publié sur le topic {topic} : {payload}")
         except Exception as e:
             _LOGGER.error(f"Erreur lors de la publication sur le topic {topic}: {e}")
 
 
 class MQTTManager:
-    def __init__(self):
+    """Gère les clients MQTT de tous les sites depuis la boucle asyncio de Home Assistant.
+
+    Les sockets de chaque connexion sont surveillés par la boucle (add_reader/add_writer) :
+    aucun thread réseau n'est créé, quel que soit le nombre de sites. Les sites d'un
+    même compte sur un même broker VRM partagent une seule connexion.
+
+    Avec `workers > 0`, les sites sont répartis entre autant de processus
+    d'ingestion (voir workers.py) : connexions, décodage et routage y sont
+    exécutés, hors du GIL de Home Assistant, qui ne reçoit que les valeurs modifiées.
+    Le constructeur lance alors les processus : il doit être appelé hors de la boucle.
+    """
+
+    def __init__(self, workers=0):
         self.clients = {}
+        self._settings = {}  # id_site -> paramètres du client, pour réutiliser un client identique
+        self.pool = ConnectionPool()
+        self.loop_lag = Histogram()  # Retard du moteur d'E/S sur son échéance, révélateur d'une boucle chargée
+        self._io_task = None
+        self.keepalive_scheduler = KeepaliveScheduler()
+        self.workers = WorkerPool(workers) if workers else None
 
-    def add_device(self, id_site, client_id=None, username=None, password=None):
-        """Ajoute un client MQTT pour un périphérique avec un ID unique."""
+    async def async_add_device(self, id_site, client_id=None, username=None, password=None, flush_interval=0, record_path=None, endpoints=None, transport=TRANSPORT_MQTT, factory=None):
+        """Ajoute et démarre le client d'un site ; retourne le client.
+
+        La connexion s'établit en arrière-plan (connexions simultanées bornées par
+        le pool). Un client existant avec les mêmes paramètres est conservé tel quel.
+        `transport` choisit la classe du client dans TRANSPORTS ; `factory` la
+        remplace pour un transport propre au processus de Home Assistant (client
+        jamais confié aux processus d'ingestion).
+        """
+        settings = {
+            "client_id": client_id,
+            "username": username,
+            "password": password,
+            "flush_interval": flush_interval,
+            "record_path": record_path,
+            "endpoints": list(endpoints) if endpoints else None,
+            "transport": transport,
+        }
         if id_site in self.clients:
+            if self._settings.get(id_site) == settings:
+                _LOGGER.info(f"Le client MQTT pour le site {id_site} existe déjà avec les mêmes paramètres : réutilisation.")
+                return self.clients[id_site]
             _LOGGER.warning(f"Le client MQTT pour le site {id_site} existe déjà. Suppression et recréation.")
-            self.remove_device(id_site)  # Supprimer l'ancien client avant de le recréer
-
-        # Créer un nouveau client
-        self.clients[id_site] = CerboMQTTClient(
-            id_site=id_site,
-            client_id=client_id,
-            username=username,
-            password=password,
-        )
-        self.clients[id_site].connect()
+            await self.async_remove_device(id_site)  # Paramètres modifiés : recréer le client
+
+        if self.workers is not None and factory is None:
+            # Keep-alive et entretien des connexions sont assurés par le processus d'ingestion
+            client = self.workers.client(id_site, settings)
+        else:
+            options = dict(settings)
+            transport_class = factory or TRANSPORTS[options["transport"]]
+            del options["transport"]
+            client = transport_class(id_site=id_site, pool=self.pool, **options)
+            client.metrics.loop_lag = self.loop_lag
+        self.clients[id_site] = client
+        self._settings[id_site] = settings
+        await client.async_start()
+        if self.workers is None or factory is not None:
+            self.keepalive_scheduler.add(client, asyncio.get_running_loop().time())
+            self._ensure_io_task()
         _LOGGER.info(f"Client MQTT ajouté pour le site {id_site}")
+        return client
 
     def get_client(self, id_site):
         """Récupère un client MQTT pour un site donné."""
         return self.clients.get(id_site)
 
-    def remove_device(self, id_site):
-        """Supprime un client MQTT pour un périphérique donné."""
-        if id_site in self.clients:
-            _LOGGER.info(f"Suppression du client MQTT pour le site {id_site}")
-            self.clients[id_site].disconnect()
-            del self.clients[id_site]
-        else:
+    async def async_remove_device(self, id_site):
+        """Arrête et supprime le client MQTT d'un périphérique donné."""
+        client = self.clients.pop(id_site, None)
+        self._settings.pop(id_site, None)
+        if client is None:
             _LOGGER.warning(f"Le client MQTT pour le site {id_site} n'existe pas.")
+            return
+        _LOGGER.info(f"Suppression du client MQTT pour le site {id_site}")
+        self.keepalive_scheduler.remove(client)
+        await client.async_stop()
+        if not self.clients and self._io_task is not None:
+            self._io_task.cancel()
+            self._io_task = None
+
+    async def async_shutdown(self):
+        """Arrête tous les clients, puis les processus d'ingestion éventuels."""
+        for id_site in list(self.clients):
+            await self.async_remove_device(id_site)
+        if self.workers is not None:
+            await self.workers.async_close()
+
+    def _ensure_io_task(self):
+        if self._io_task is None or self._io_task.done():
+            self._io_task = asyncio.get_running_loop().create_task(self._io_loop())
+
+    async def _io_loop(self):
+        """Moteur d'E/S partagé : une seule tâche entretient toutes les connexions."""
+        loop = asyncio.get_running_loop()
+        while True:
+            due = loop.time() + IO_TICK_INTERVAL
+            await asyncio.sleep(IO_TICK_INTERVAL)
+            now = loop.time()
+            self.loop_lag.observe(max(0.0, now - due))
+            self.pool.loop_misc()
+            self.keepalive_scheduler.run_due(now)
+            for client in self.clients.values():
+                client.metrics.update_rate(now)
+
+
+TRANSPORTS = {
+    TRANSPORT_MQTT: CerboMQTTClient,
+    TRANSPORT_MODBUS: ModbusSiteClient,
+}
+
+
+class KeepaliveScheduler:
+    """Planificateur unique des keep-alive Venus de tous les sites.
+
+    Les échéances sont rangées dans un tas ; chaque site reçoit un décalage
+    initial aléatoire puis un intervalle légèrement bruité, ce qui évite que
+    tous les sites ne sollicitent le broker au même instant.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._due = {}  # client -> échéance courante (les entrées obsolètes du tas sont ignorées)
+
+    def add(self, client, now):
+        """Planifie les keep-alive d'un client, avec un premier envoi étalé."""
+        self._push(client, now + random.uniform(0, KEEPALIVE_INTERVAL_SYNC))
+
+    def remove(self, client):
+        self._due.pop(client, None)
+
+    def run_due(self, now):
+        """Envoie les keep-alive arrivés à échéance et replanifie les suivants."""
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            due, _, client = heapq.heappop(heap)
+            if self._due.get(client) != due:
+                continue  # Client retiré ou replanifié
+            interval = client.keepalive_interval()
+            if interval is not None and client.connected:
+                try:
+                    client.send_keepalive()
+                except Exception as e:
+                    _LOGGER.error(f"Erreur lors de l'envoi du keep-alive du site {client.id_site} : {e}")
+            else:
+                interval = KEEPALIVE_INTERVAL_SYNC
+            self._push(client, now + interval * random.uniform(1 - KEEPALIVE_JITTER, 1 + KEEPALIVE_JITTER))
+
+    def _push(self, client, due):
+        self._due[client] = due
+        heapq.heappush(self._heap, (due, id(client), client))
@@ -0,0 +1,43 @@
+import logging
+from homeassistant.core import Event, HomeAssistant, callback
+from homeassistant.helpers import entity_registry as er
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class RegistryTracker:
+    """Suit l'activation des entités d'une entrée dans le registre des entités.
+
+    Une entité désactivée est retirée par Home Assistant, ce qui libère aussitôt
+    ses abonnements MQTT. Une entité réactivée, en revanche, n'est recréée qu'au
+    rechargement de l'entrée (différé d'une trentaine de secondes) : le suivi
+    la recrée immédiatement à l'aide de la fabrique enregistrée par sa
+    plateforme, et son topic est de nouveau souscrit.
+    """
+
+    def __init__(self, hass: HomeAssistant, entry_id: str):
+        self._hass = hass
+        self._entry_id = entry_id
+        self._factories = {}  # unique_id -> (fabrique de l'entité, async_add_entities de sa plateforme)
+
+    def register(self, unique_id, factory, async_add_entities):
+        """Enregistre la fabrique d'une entité, pour la recréer à sa réactivation."""
+        self._factories[unique_id] = (factory, async_add_entities)
+
+    @callback
+    def async_registry_updated(self, event: Event) -> None:
+        data = event.data
+        if data["action"] != "update" or "disabled_by" not in data.get("changes", {}):
+            return
+        registry_entry = er.async_get(self._hass).async_get(data["entity_id"])
+        if registry_entry is None or registry_entry.config_entry_id != self._entry_id:
+            return
+        if registry_entry.disabled:
+            _LOGGER.debug("Entité %s désactivée : ses topics sont désabonnés", registry_entry.entity_id)
+            return
+        spec = self._factories.get(registry_entry.unique_id)
+        if spec is None or self._hass.states.get(registry_entry.entity_id) is not None:
+            return
+        factory, async_add_entities = spec
+        _LOGGER.debug("Entité %s réactivée : recréation et abonnement", registry_entry.entity_id)
+        async_add_entities([factory()])
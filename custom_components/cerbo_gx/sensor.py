@@ -1,16 +1,64 @@
 import logging
-import json
-from homeassistant.components.sensor import SensorEntity
+import time
+from datetime import timedelta
+from functools import partial
+from typing import TYPE_CHECKING
+from homeassistant.components.sensor import RestoreSensor, SensorEntity
 from homeassistant.helpers.typing import HomeAssistantType
-from homeassistant.components.sensor import SensorDeviceClass
-from .mqtt_client import CerboMQTTClient  # Client MQTT importé (à définir dans mqtt_client.py)
+from homeassistant.components.sensor import SensorDeviceClass, SensorStateClass
+from homeassistant.const import EntityCategory, UnitOfEnergy
+from homeassistant.helpers.event import async_track_time_interval
 from homeassistant.core import HomeAssistant
 from . import DOMAIN
-from .switch import CerboRelaySwitch  # Ajouter l'import du switch
+from .filters import FilterTicker, filter_from_options
+from .history import history_from_options
+from .energy import ENERGY_PUBLISH_INTERVAL, EnergyIntegrator
+from .descriptors import SENSOR_DESCRIPTIONS, site_device_info
 
+if TYPE_CHECKING:
+    from .mqtt_client import CerboMQTTClient
 
 _LOGGER = logging.getLogger(__name__)
 
+# Période de relevé des capteurs de diagnostic (les autres capteurs sont poussés par MQTT)
+SCAN_INTERVAL = timedelta(seconds=30)
+
+
+def _histogram_ms(name, fraction):
+    """Lecture d'un percentile (en ms) d'un histogramme des métriques du site."""
+    def value(mqtt_client):
+        seconds = getattr(mqtt_client.metrics, name).percentile(fraction)
+        return None if seconds is None else round(seconds * 1000, 3)
+    return value
+
+
+def _loop_lag_ms(mqtt_client):
+    loop_lag = mqtt_client.metrics.loop_lag
+    return None if loop_lag is None or loop_lag.last is None else round(loop_lag.last * 1000, 1)
+
+
+# Énergies intégrées localement à partir des puissances brutes : (clé, nom, chemin de la puissance)
+ENERGY_SENSORS = (
+    ("pv_energy", "Energie solaire", "system/0/Dc/Pv/Power"),
+    ("system_energy", "Energie système", "system/0/Dc/System/Power"),
+)
+
+# Capteurs de diagnostic : (clé, nom, unité, classe d'état, lecture de la valeur sur le client MQTT)
+DIAGNOSTIC_SENSORS = (
+    ("message_rate", "Messages par seconde", "msg/s", SensorStateClass.MEASUREMENT,
+     lambda c: None if c.metrics.message_rate is None else round(c.metrics.message_rate, 1)),
+    ("messages", "Messages reçus", None, SensorStateClass.TOTAL_INCREASING, lambda c: c.metrics.messages),
+    ("bytes", "Octets reçus", "B", SensorStateClass.TOTAL_INCREASING, lambda c: c.metrics.bytes),
+    ("unrouted", "Messages non routés", None, SensorStateClass.TOTAL_INCREASING, lambda c: c.metrics.unrouted),
+    ("decode_errors", "Erreurs de décodage", None, SensorStateClass.TOTAL_INCREASING, lambda c: c.metrics.decode_errors),
+    ("reconnects", "Reconnexions", None, SensorStateClass.TOTAL_INCREASING, lambda c: c.metrics.reconnects),
+    ("decode_time_p99", "Temps de décodage p99", "ms", SensorStateClass.MEASUREMENT, _histogram_ms("decode_time", 0.99)),
+    ("dispatch_time_p99", "Temps de distribution p99", "ms", SensorStateClass.MEASUREMENT, _histogram_ms("dispatch_time", 0.99)),
+    ("keepalive_rtt", "Aller-retour keep-alive", "ms", SensorStateClass.MEASUREMENT, _histogram_ms("keepalive_rtt", 0.5)),
+    ("command_rtt", "Aller-retour commande", "ms", SensorStateClass.MEASUREMENT, _histogram_ms("command_rtt", 0.5)),
+    ("loop_lag", "Retard de la boucle", "ms", SensorStateClass.MEASUREMENT, _loop_lag_ms),
+)
+
 async def async_setup_entry(hass: HomeAssistantType, entry, async_add_entities) -> None:
     """Configurer les capteurs pour une entrée donnée."""
     device_name = entry.data["device_name"]
@@ -28,168 +76,264 @@ async def async_setup_entry(hass: HomeAssistantType, entry, async_add_entities)
         "Initialisation des capteurs pour le dispositif %s avec l'ID de site %s", device_name, id_site
     )
 
-    # Liste des capteurs à ajouter
-    sensors = [
-        CerboVoltageSensor(device_name, id_site, mqtt_client),
-        CerboWattSensor(device_name, id_site, mqtt_client),
-        CerboPowerSensor(device_name, id_site, mqtt_client),
-        CerboAmperageSensor(device_name, id_site, mqtt_client),
-        CerboRelaySensor(device_name, id_site, mqtt_client),
-        CerboRelaySensor2(device_name, id_site, mqtt_client),
-    ]
-
-    async_add_entities(sensors, update_before_add=True)
+    tracker = hass.data[DOMAIN][entry.entry_id]["registry_tracker"]
+    snapshot = hass.data[DOMAIN][entry.entry_id]["snapshot"]
+    # Une seule minuterie pour les échéances de tous les filtres du site
+    filter_ticker = FilterTicker(hass.loop)
+    entry.async_on_unload(filter_ticker.cancel)
+
+    def add_tracked(factories, **kwargs):
+        """Crée et ajoute les entités ; leurs fabriques servent à les recréer lorsqu'elles sont réactivées."""
+        entities = []
+        for factory in factories:
+            entity = factory()
+            tracker.register(entity.unique_id, factory, async_add_entities)
+            entities.append(entity)
+        async_add_entities(entities, **kwargs)
+
+    def configured(sensor):
+        # Filtres (bande morte, sous-échantillonnage) et historique configurés par type de capteur
+        sensor.set_filter(filter_from_options(entry.options, sensor.device_class), filter_ticker)
+        sensor.set_history(history_from_options(entry.options, sensor.device_class))
+        sensor.set_snapshot(snapshot)
+        return sensor
+
+    def fixed_sensor(description):
+        return configured(CerboSensor.for_site(device_name, id_site, mqtt_client, description))
+
+    # Capteurs fixes, une ligne de la table des descriptions chacun
+    add_tracked([partial(fixed_sensor, description) for description in SENSOR_DESCRIPTIONS], update_before_add=True)
+
+    # Énergies (kWh) intégrées à partir des puissances, avant tout filtrage
+    add_tracked([partial(CerboEnergySensor, device_name, id_site, mqtt_client, *spec) for spec in ENERGY_SENSORS])
+
+    # Métriques du client MQTT, désactivées par défaut dans le registre des entités
+    async_add_entities(
+        [CerboDiagnosticSensor(device_name, id_site, mqtt_client, *spec) for spec in DIAGNOSTIC_SENSORS],
+        update_before_add=True,
+    )
 
     _LOGGER.info("Capteurs ajoutés pour %s", device_name)
 
+    # Capteurs créés à la volée pour les chemins découverts dans l'arbre du site
+    discovery = hass.data[DOMAIN][entry.entry_id].get("discovery")
+    if discovery is not None:
+        def discovered_sensor(topic, description, value):
+            return configured(CerboSensor.discovered(
+                device_name, id_site, mqtt_client, description, topic, discovery.relative_topic(topic), value
+            ))
+
+        def add_discovered_sensor(topic, description, value):
+            add_tracked([partial(discovered_sensor, topic, description, value)])
+
+        discovery.set_listener(add_discovered_sensor)
+
+
+class CerboSensor(SensorEntity):
+    """Capteur d'une valeur Venus, entièrement défini par sa description (descriptors.py).
+
+    Unité, classe et précision sont lues dans la description partagée plutôt
+    que copiées dans chaque entité ; topic et informations d'appareil sont
+    calculés une fois par site.
+    """
 
-class CerboBaseSensor(SensorEntity):
-    def __init__(self, device_name: str, id_site: str, mqtt_client: CerboMQTTClient, state_topic: str, value_key: str):
-        self._device_name = device_name
-        self._id_site = id_site
-        self._state = None
+    # Statistiques de la fenêtre glissante : changent à chaque valeur, inutile de les enregistrer
+    _unrecorded_attributes = frozenset({"window_min", "window_max", "window_mean", "window_stddev", "window_samples"})
+
+    def __init__(self, mqtt_client: "CerboMQTTClient", description, state_topic: str, unique_id: str, name: str, device_info, initial_value=None):
+        self._description = description
         self._mqtt_client = mqtt_client
         self._state_topic = state_topic
-        self._value_key = value_key
-        self._attr_device_info = {
-            "identifiers": {(DOMAIN, id_site)},
-            "name": device_name,
-            "manufacturer": "Victron Energy",
-            "model": "Cerbo GX",
-        }
+        self._state = initial_value
+        self._filter = None
+        self._filter_ticker = None
+        self._history = None
+        self._snapshot = None
+        self._attr_name = name
+        self._attr_unique_id = unique_id
+        self._attr_device_info = device_info
+
+    @classmethod
+    def for_site(cls, device_name: str, id_site: str, mqtt_client: "CerboMQTTClient", description):
+        """Capteur fixe d'un site (topic sans joker)."""
+        return cls(
+            mqtt_client,
+            description,
+            f"N/{id_site}/{description.topic}",
+            f"{id_site}_{description.key}",
+            f"{device_name} {description.name}",
+            site_device_info(id_site, device_name),
+        )
+
+    @classmethod
+    def discovered(cls, device_name: str, id_site: str, mqtt_client: "CerboMQTTClient", description, state_topic: str, relative_topic: str, initial_value=None):
+        """Capteur créé par la découverte pour un chemin publié par le site."""
+        instance = description.instance(relative_topic)
+        return cls(
+            mqtt_client,
+            description,
+            state_topic,
+            f"{id_site}_{relative_topic.replace('/', '_').lower()}",
+            f"{device_name} {description.name.format(instance=instance)}",
+            site_device_info(id_site, device_name),
+            initial_value,
+        )
+
+    @property
+    def device_class(self):
+        return self._description.device_class
+
+    @property
+    def state_class(self):
+        return self._description.state_class
+
+    @property
+    def native_unit_of_measurement(self):
+        return self._description.unit
+
+    @property
+    def suggested_display_precision(self):
+        return self._description.precision
 
     async def async_added_to_hass(self):
         """Abonnez-vous aux messages MQTT lorsque l'entité est ajoutée."""
-        _LOGGER.info("Abonnement au topic MQTT pour %s", self._attr_name)
-        self._mqtt_client.add_subscription(self.get_state_topic(), self.on_mqtt_message)
+        if self._state is None and self._snapshot is not None:
+            # Dernière valeur connue, remplacée dès la réception d'une valeur du site
+            self._state = self._snapshot.get(self._state_topic)
+        _LOGGER.debug("Abonnement au topic MQTT pour %s", self._attr_name)
+        self._mqtt_client.add_subscription(self._state_topic, self.on_mqtt_message, self._description.value_key)
+        if self._filter is not None and self._filter_ticker is not None:
+            # Fin de fenêtre et heartbeat du filtre, même lorsque Venus ne republie rien
+            self._filter_ticker.add(self)
+            self.async_on_remove(partial(self._filter_ticker.discard, self))
 
     async def async_will_remove_from_hass(self):
         """Désabonnez-vous des messages MQTT lorsque l'entité est retirée."""
-        _LOGGER.info("Désabonnement du topic MQTT pour %s", self._attr_name)
-        self._mqtt_client.remove_subscription(self.get_state_topic(), self.on_mqtt_message)
-
-    def on_mqtt_message(self, client, userdata, msg):
-        try:
-            if not msg.payload:
-                _LOGGER.warning("Message vide reçu sur le topic %s", msg.topic)
-                return
-            
-            payload = json.loads(msg.payload)
-            value = self._extract_value(payload)
-            
-            if value is not None:
-                self._state = value
-                self.hass.loop.call_soon_threadsafe(self.async_write_ha_state)
-        
-        except json.JSONDecodeError as e:
-            _LOGGER.error(f"Erreur de décodage du message JSON sur le topic {msg.topic}: {e}")
-        except Exception as e:
-            _LOGGER.error("Erreur lors du traitement du message : %s", e)
-
-    def _extract_value(self, payload: dict):
-        # Vérifie si "value" est une liste avec des données
-        if "value" in payload:
-            if isinstance(payload["value"], list) and len(payload["value"]) > 0:
-                sensor_data = payload["value"][0]
-                if self._value_key in sensor_data:
-                    return sensor_data[self._value_key]
-            # Si "value" n'est pas une liste, mais une valeur directe
-            elif isinstance(payload["value"], (int, float, str, bool)):
-                return payload["value"]
-        return None
+        _LOGGER.debug("Désabonnement du topic MQTT pour %s", self._attr_name)
+        self._mqtt_client.remove_subscription(self._state_topic, self.on_mqtt_message)
+        self._mqtt_client.cancel_state_write(self)
+
+    def set_filter(self, sensor_filter, ticker=None):
+        """Définit le filtre appliqué aux valeurs reçues (None pour tout publier) et la minuterie de ses échéances."""
+        self._filter = sensor_filter
+        self._filter_ticker = ticker
+
+    def set_history(self, history):
+        """Définit l'historique glissant (history.RollingWindow) tenu sur les valeurs reçues."""
+        self._history = history
+
+    def set_snapshot(self, snapshot):
+        """Définit l'instantané (snapshot.SiteSnapshot) où la dernière valeur reçue est conservée."""
+        self._snapshot = snapshot
+
+    def on_mqtt_message(self, topic, value):
+        """Reçoit la valeur déjà décodée par le client MQTT."""
+        if self._snapshot is not None and value is not None:
+            self._snapshot.update(topic, value)
+        if self._history is not None and isinstance(value, (int, float)) and not isinstance(value, bool):
+            # Toutes les valeurs reçues alimentent l'historique, y compris celles absorbées par le filtre
+            self._history.add(time.monotonic(), value)
+        if value is not None and self._filter is not None:
+            value = self._filter.process(value, time.monotonic())
+        if value is not None:
+            self._state = value
+            self._mqtt_client.schedule_state_write(self)  # Écriture groupée par site
+
+    def flush_filter(self, now):
+        """Appelé par le FilterTicker du site : publie la valeur due par le filtre, s'il y en a une."""
+        value = self._filter.flush(now)
+        if value is not None:
+            self._state = value
+            self._mqtt_client.schedule_state_write(self)
 
     @property
     def state(self):
         return self._state
 
-    def get_state_topic(self):
-        return self._state_topic
-
-class CerboVoltageSensor(CerboBaseSensor):
-    """Capteur pour la tension du Cerbo GX."""
-
-    def __init__(self, device_name: str, id_site: str, mqtt_client: CerboMQTTClient):
-        state_topic = f"N/{id_site}/system/0/Dc/Battery/Voltage"
-        value_key = ""  # Nous voulons extraire la tension
-        super().__init__(device_name, id_site, mqtt_client, state_topic, value_key)
-        self._attr_name = f"{device_name} Voltage"
-        self._attr_unique_id = f"{id_site}_voltage"
-        self._attr_device_class = SensorDeviceClass.VOLTAGE
-        self._attr_native_unit_of_measurement = "V"
-        self._attr_suggested_display_precision = 2  # Précision à 2 décimales
-
-class CerboWattSensor(CerboBaseSensor):
-    """Capteur pour la puissance solaire du Cerbo GX."""
-
-    def __init__(self, device_name: str, id_site: str, mqtt_client: CerboMQTTClient):
-        state_topic = f"N/{id_site}/system/0/Dc/Pv/Power"
-        value_key = ""  # Nous voulons extraire la tension
-        super().__init__(device_name, id_site, mqtt_client, state_topic, value_key)
-        self._attr_name = f"{device_name} Power solaire"
-        self._attr_unique_id = f"{id_site}_solaire"
-        self._attr_device_class = SensorDeviceClass.POWER
-        self._attr_native_unit_of_measurement = "W"
-        self._attr_suggested_display_precision = 2  # Précision à 2 décimales
-
-class CerboPowerSensor(CerboBaseSensor):
-    """Capteur pour la puissance solaire du Cerbo GX."""
-
-    def __init__(self, device_name: str, id_site: str, mqtt_client: CerboMQTTClient):
-        state_topic = f"N/{id_site}/system/0/Dc/System/Power"
-        value_key = ""  # Nous voulons extraire la tension
-        super().__init__(device_name, id_site, mqtt_client, state_topic, value_key)
-        self._attr_name = f"{device_name} Power"
-        self._attr_unique_id = f"{id_site}_power"
-        self._attr_device_class = SensorDeviceClass.POWER
-        self._attr_native_unit_of_measurement = "W"
-        self._attr_suggested_display_precision = 2  # Précision à 2 décimales
-
-
-class CerboAmperageSensor(CerboBaseSensor):
-    """Capteur pour l'ampérage du Cerbo GX."""
-
-    def __init__(self, device_name: str, id_site: str, mqtt_client: CerboMQTTClient):
-        state_topic = f"N/{id_site}/system/0/Dc/Battery/Current"
-        value_key = ""  # Nous voulons extraire la tension
-        super().__init__(device_name, id_site, mqtt_client, state_topic, value_key)
-        self._attr_name = f"{device_name} Amperage"
-        self._attr_unique_id = f"{id_site}_amperage"
-        self._attr_device_class = SensorDeviceClass.CURRENT
-        self._attr_native_unit_of_measurement = "A"
-        self._attr_suggested_display_precision = 2  # Précision à 2 décimales
-
-class RelayDeviceClass:
-    RELAY = "relay"
-
-
-class CerboRelaySensor(CerboBaseSensor):
-    """Capteur pour l'état des relais du Cerbo GX."""
-    
-    def __init__(self, device_name: str, id_site: str, mqtt_client: CerboMQTTClient):
-        state_topic = f"N/{id_site}/system/0/Relay/0/State"
-        value_key = ""  # Définir la clé de valeur pour l'état du relais
-        
-        super().__init__(device_name, id_site, mqtt_client, state_topic, value_key)
-        
-        self._attr_name = f"{device_name} Relay State"
-        self._attr_unique_id = f"{id_site}_relay_state"
-        self._attr_device_class = RelayDeviceClass.RELAY
-        self._attr_native_unit_of_measurement = ""
-        self._attr_is_read_only = True  # Indique que l'état est en lecture seule
-
-
-
-class CerboRelaySensor2(CerboBaseSensor):
-    """Capteur pour l'état des relais du Cerbo GX."""
-    
-    def __init__(self, device_name: str, id_site: str, mqtt_client: CerboMQTTClient):
-        state_topic = f"N/{id_site}/system/0/Relay/1/State"
-        value_key = ""  # Définir la clé de valeur pour l'état du relais
-        
-        super().__init__(device_name, id_site, mqtt_client, state_topic, value_key)
-        
-        self._attr_name = f"{device_name} Relay State 2"
-        self._attr_unique_id = f"{id_site}_relay_state_2"
-        self._attr_device_class = RelayDeviceClass.RELAY
-        self._attr_native_unit_of_measurement = ""
-        self._attr_is_read_only = True  # Indique que l'état est en lecture seule
\ No newline at end of file
+    @property
+    def extra_state_attributes(self):
+        """Min, max, moyenne et écart type sur la fenêtre de l'historique, s'il est activé."""
+        if self._history is None:
+            return None
+        stats = self._history.stats(time.monotonic())
+        if stats is None:
+            return None
+        return {
+            "window_min": round(stats["min"], 4),
+            "window_max": round(stats["max"], 4),
+            "window_mean": round(stats["mean"], 4),
+            "window_stddev": round(stats["stddev"], 4),
+            "window_samples": stats["samples"],
+        }
+
+class CerboEnergySensor(RestoreSensor):
+    """Énergie (kWh) intégrée localement à partir des échantillons MQTT bruts d'une puissance.
+
+    Chaque échantillon est intégré dès sa réception (méthode des trapèzes, voir
+    energy.py), mais l'état n'est écrit que toutes les ENERGY_PUBLISH_INTERVAL
+    secondes. Le total est restauré au redémarrage.
+    """
+
+    _attr_should_poll = False
+    _attr_device_class = SensorDeviceClass.ENERGY
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+    _attr_native_unit_of_measurement = UnitOfEnergy.KILO_WATT_HOUR
+    _attr_suggested_display_precision = 3
+
+    def __init__(self, device_name: str, id_site: str, mqtt_client: "CerboMQTTClient", key, name, power_path):
+        self._mqtt_client = mqtt_client
+        self._power_topic = f"N/{id_site}/{power_path}"
+        self._integrator = EnergyIntegrator()
+        self._attr_name = f"{device_name} {name}"
+        self._attr_unique_id = f"{id_site}_{key}"
+        self._attr_device_info = site_device_info(id_site, device_name)
+
+    async def async_added_to_hass(self):
+        """Restaure le total puis s'abonne à la puissance."""
+        last = await self.async_get_last_sensor_data()
+        if last is not None and last.native_value is not None:
+            try:
+                self._integrator.total = float(last.native_value)
+            except (TypeError, ValueError):
+                _LOGGER.warning("Total d'énergie restauré invalide pour %s : %s", self._attr_name, last.native_value)
+        self._attr_native_value = round(self._integrator.total, 6)
+        self._mqtt_client.add_subscription(self._power_topic, self.on_mqtt_message)
+        self.async_on_remove(
+            async_track_time_interval(self.hass, self._async_publish, timedelta(seconds=ENERGY_PUBLISH_INTERVAL))
+        )
+
+    async def async_will_remove_from_hass(self):
+        self._mqtt_client.remove_subscription(self._power_topic, self.on_mqtt_message)
+
+    def on_mqtt_message(self, topic, value):
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            self._integrator.add(time.monotonic(), value)
+
+    async def _async_publish(self, now=None):
+        if self._mqtt_client.connected:
+            self._integrator.hold(time.monotonic())
+        else:
+            self._integrator.pause()  # Pas de données pendant la déconnexion : intervalle non intégré
+        total = round(self._integrator.total, 6)
+        if total != self._attr_native_value:
+            self._attr_native_value = total
+            self.async_write_ha_state()
+
+class CerboDiagnosticSensor(SensorEntity):
+    """Capteur de diagnostic relevant périodiquement une métrique du client MQTT du site."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+    _attr_should_poll = True
+
+    def __init__(self, device_name: str, id_site: str, mqtt_client: "CerboMQTTClient", key, name, unit, state_class, value_fn):
+        self._mqtt_client = mqtt_client
+        self._value_fn = value_fn
+        self._attr_name = f"{device_name} {name}"
+        self._attr_unique_id = f"{id_site}_diagnostic_{key}"
+        self._attr_native_unit_of_measurement = unit
+        self._attr_state_class = state_class
+        self._attr_device_info = site_device_info(id_site, device_name)
+
+    def update(self):
+        self._attr_native_value = self._value_fn(self._mqtt_client)
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import re
+import voluptuous as vol
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse
+from homeassistant.exceptions import HomeAssistantError, ServiceValidationError
+from homeassistant.helpers import config_validation as cv
+from .const import CONF_CERBO_ID, DOMAIN
+from .commands import COMMAND_TIMEOUT, relay_path
+from .traffic_log import async_replay
+
+_LOGGER = logging.getLogger(__name__)
+
+SERVICE_REPLAY_TRAFFIC = "replay_traffic"
+ATTR_PATH = "path"
+ATTR_SPEED = "speed"
+
+REPLAY_TRAFFIC_SCHEMA = vol.Schema({
+    vol.Required(CONF_CERBO_ID): cv.string,
+    vol.Required(ATTR_PATH): cv.string,
+    vol.Optional(ATTR_SPEED, default=1.0): vol.All(vol.Coerce(float), vol.Range(min=0)),
+})
+
+SERVICE_SET_RELAYS = "set_relays"
+ATTR_WRITES = "writes"
+ATTR_RELAY = "relay"
+ATTR_STATE = "state"
+ATTR_TIMEOUT = "timeout"
+
+SET_RELAYS_SCHEMA = vol.Schema({
+    vol.Required(ATTR_WRITES): vol.All(cv.ensure_list, [vol.Schema({
+        vol.Required(CONF_CERBO_ID): cv.string,
+        vol.Required(ATTR_RELAY): vol.All(vol.Coerce(int), vol.Range(min=0)),
+        vol.Required(ATTR_STATE): cv.boolean,
+    })]),
+    vol.Optional(ATTR_TIMEOUT, default=COMMAND_TIMEOUT): vol.All(vol.Coerce(float), vol.Range(min=0.1, max=60)),
+})
+
+_SITE_PREFIX = re.compile(r"^(N/)[^/]+/")
+
+
+def async_register_services(hass: HomeAssistant, mqtt_manager) -> None:
+    """Enregistrer les services de l'intégration."""
+
+    async def async_replay_traffic(call: ServiceCall) -> None:
+        """Rejouer un journal de trafic enregistré dans le chemin de distribution d'un site."""
+        id_site = call.data[CONF_CERBO_ID]
+        client = mqtt_manager.get_client(id_site)
+        if client is None:
+            raise HomeAssistantError(f"Aucun client MQTT pour le site {id_site}")
+        path = hass.config.path(call.data[ATTR_PATH])
+        if not hass.config.is_allowed_path(path):
+            # Chemin hors de la configuration et des allowlist_external_dirs
+            raise ServiceValidationError(f"Accès au fichier {path} non autorisé")
+        prefix = f"N/{id_site}/"
+        try:
+            count = await async_replay(
+                path,
+                client.dispatch,
+                speed=call.data[ATTR_SPEED],
+                topic_rewrite=lambda topic: _SITE_PREFIX.sub(prefix, topic, count=1),
+            )
+        except (OSError, ValueError) as e:
+            raise HomeAssistantError(f"Impossible de rejouer {path} : {e}") from e
+        _LOGGER.info("%d messages rejoués depuis %s pour le site %s", count, path, id_site)
+
+    async def async_set_relays(call: ServiceCall) -> ServiceResponse:
+        """Envoyer en parallèle des écritures de relais sur un ou plusieurs sites."""
+        writes = call.data[ATTR_WRITES]
+        clients = []
+        for write in writes:
+            client = mqtt_manager.get_client(write[CONF_CERBO_ID])
+            if client is None:
+                raise HomeAssistantError(f"Aucun client MQTT pour le site {write[CONF_CERBO_ID]}")
+            clients.append(client)
+
+        results = await asyncio.gather(
+            *(
+                client.commands.async_write(relay_path(write[ATTR_RELAY]), int(write[ATTR_STATE]), call.data[ATTR_TIMEOUT])
+                for client, write in zip(clients, writes)
+            ),
+            return_exceptions=True,
+        )
+        report = []
+        for write, result in zip(writes, results):
+            confirmed = not isinstance(result, BaseException)
+            report.append({
+                CONF_CERBO_ID: write[CONF_CERBO_ID],
+                ATTR_RELAY: write[ATTR_RELAY],
+                ATTR_STATE: write[ATTR_STATE],
+                "confirmed": confirmed,
+                "latency_ms": round(result * 1000, 1) if confirmed else None,
+            })
+        failed = sum(not item["confirmed"] for item in report)
+        if failed:
+            _LOGGER.warning("%d écriture(s) de relais sur %d non confirmée(s)", failed, len(report))
+        return {"results": report}
+
+    if not hass.services.has_service(DOMAIN, SERVICE_SET_RELAYS):
+        hass.services.async_register(
+            DOMAIN,
+            SERVICE_SET_RELAYS,
+            async_set_relays,
+            schema=SET_RELAYS_SCHEMA,
+            supports_response=SupportsResponse.OPTIONAL,
+        )
+
+    if not hass.services.has_service(DOMAIN, SERVICE_REPLAY_TRAFFIC):
+        hass.services.async_register(DOMAIN, SERVICE_REPLAY_TRAFFIC, async_replay_traffic, schema=REPLAY_TRAFFIC_SCHEMA)
@@ -0,0 +1,75 @@
+import logging
+import time
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+# Écriture de l'instantané au plus une fois par intervalle (s), quelle que soit la fréquence des valeurs
+SNAPSHOT_SAVE_DELAY = 30
+# Un instantané plus ancien (s) n'est pas restauré : ses valeurs ne sont plus crédibles
+SNAPSHOT_MAX_AGE = 24 * 3600
+
+
+class SiteSnapshot:
+    """Dernière valeur reçue pour chaque topic suivi d'un site, conservée d'un démarrage à l'autre.
+
+    Les valeurs sont tenues en mémoire par chemin relatif au site et écrites
+    par le Store de Home Assistant hors de la boucle, au plus une fois toutes
+    les SNAPSHOT_SAVE_DELAY secondes, ainsi qu'à l'arrêt. Au démarrage, les
+    entités reprennent aussitôt ces valeurs ; les données reçues du site les
+    remplacent ensuite.
+    """
+
+    def __init__(self, hass: HomeAssistant, id_site: str):
+        self._store = Store(hass, SNAPSHOT_VERSION, f"{DOMAIN}.snapshot.{id_site}")
+        self._prefix = f"N/{id_site}/"
+        self._values = {}  # chemin relatif -> dernière valeur
+        self._save_pending = False
+        self.restored = 0
+
+    async def async_load(self):
+        """Charge l'instantané enregistré, s'il est assez récent."""
+        data = await self._store.async_load()
+        if not data:
+            return
+        age = time.time() - data.get("saved_at", 0)
+        if age > SNAPSHOT_MAX_AGE:
+            _LOGGER.debug("Instantané de %s ignoré : enregistré il y a %.0f s", self._prefix, age)
+            return
+        self._values = data.get("values", {})
+        self.restored = len(self._values)
+
+    def get(self, topic):
+        """Valeur enregistrée pour un topic du site, ou None."""
+        return self._values.get(topic[len(self._prefix):])
+
+    def items(self):
+        """Couples `(topic, valeur)` de l'instantané."""
+        prefix = self._prefix
+        return [(prefix + path, value) for path, value in self._values.items()]
+
+    @callback
+    def update(self, topic, value):
+        """Mémorise la dernière valeur d'un topic ; l'écriture est différée et groupée."""
+        path = topic[len(self._prefix):]
+        if self._values.get(path) == value:
+            return
+        self._values[path] = value
+        if not self._save_pending:
+            # async_delay_save repousse l'écriture à chaque appel : un seul appel par intervalle
+            self._save_pending = True
+            self._store.async_delay_save(self._data, SNAPSHOT_SAVE_DELAY)
+
+    async def async_save(self):
+        """Écrit l'instantané immédiatement (déchargement de l'entrée)."""
+        await self._store.async_save(self._data())
+
+    def _data(self):
+        self._save_pending = False
+        return {"saved_at": time.time(), "values": self._values}
+
+    def diagnostics(self):
+        return {"values": len(self._values), "restored": self.restored}
@@ -0,0 +1,58 @@
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+# Nombre maximal d'entités en attente avant un vidage immédiat (contre-pression)
+DEFAULT_MAX_PENDING = 1000
+
+
+class StateWriteBuffer:
+    """Tampon d'écritures d'état pour les entités d'un site.
+
+    Chaque entité n'y figure qu'une fois : elle met à jour sa propre valeur puis
+    demande une écriture, si bien que seule la dernière valeur est publiée.
+    Le tampon est vidé en un seul lot, au prochain tour de boucle (intervalle 0)
+    ou après `flush_interval` secondes. Au-delà de `max_pending` entités en
+    attente, le vidage est immédiat afin de borner la mémoire lors d'une rafale.
+    """
+
+    def __init__(self, loop, flush_interval=0, max_pending=DEFAULT_MAX_PENDING):
+        self._loop = loop
+        self._flush_interval = flush_interval
+        self._max_pending = max_pending
+        self._pending = {}
+        self._handle = None
+
+    def schedule(self, entity):
+        """Demande l'écriture de l'état d'une entité lors du prochain vidage."""
+        self._pending[entity] = None
+        if len(self._pending) >= self._max_pending:
+            self.flush()
+        elif self._handle is None:
+            if self._flush_interval:
+                self._handle = self._loop.call_later(self._flush_interval, self.flush)
+            else:
+                self._handle = self._loop.call_soon(self.flush)
+
+    def discard(self, entity):
+        """Retire une entité du tampon (par exemple lors de sa suppression)."""
+        self._pending.pop(entity, None)
+
+    def flush(self):
+        """Écrit en un lot l'état de toutes les entités en attente."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        pending, self._pending = self._pending, {}
+        for entity in pending:
+            try:
+                entity.async_write_ha_state()
+            except Exception as e:
+                _LOGGER.error("Erreur lors de l'écriture de l'état de %s : %s", entity.entity_id, e)
+
+    def cancel(self):
+        """Abandonne les écritures en attente."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._pending.clear()
@@ -1,10 +1,16 @@
+import asyncio
 import logging
-import json
+from functools import partial
+from typing import TYPE_CHECKING
 from homeassistant.components.switch import SwitchEntity
+from homeassistant.exceptions import HomeAssistantError
 from homeassistant.helpers.typing import HomeAssistantType
 from homeassistant.core import HomeAssistant
-from .mqtt_client import CerboMQTTClient  # Votre client MQTT
 from . import DOMAIN
+from .commands import relay_path
+
+if TYPE_CHECKING:
+    from .mqtt_client import CerboMQTTClient
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -24,10 +30,15 @@ async def async_setup_entry(hass: HomeAssistantType, entry, async_add_entities)
         "Initialisation des switches pour le dispositif %s avec l'ID de site %s", device_name, id_site
     )
 
-    switches = [
-        CerboRelaySwitch(device_name, id_site, mqtt_client, 0),
-        CerboRelaySwitch(device_name, id_site, mqtt_client, 1),
-    ]
+    # Fabriques conservées par le suivi du registre pour recréer un relais réactivé
+    tracker = hass.data[DOMAIN][entry.entry_id]["registry_tracker"]
+    snapshot = hass.data[DOMAIN][entry.entry_id]["snapshot"]
+    switches = []
+    for relay_index in (0, 1):
+        factory = partial(CerboRelaySwitch, device_name, id_site, mqtt_client, relay_index, snapshot)
+        switch = factory()
+        tracker.register(switch.unique_id, factory, async_add_entities)
+        switches.append(switch)
 
     async_add_entities(switches, update_before_add=True)
 
@@ -36,11 +47,14 @@ async def async_setup_entry(hass: HomeAssistantType, entry, async_add_entities)
 class CerboRelaySwitch(SwitchEntity):
     """Classe représentant un switch pour le contrôle des relais."""
 
-    def __init__(self, device_name: str, id_site: str, mqtt_client: CerboMQTTClient, relay_index: int):
+    def __init__(self, device_name: str, id_site: str, mqtt_client: "CerboMQTTClient", relay_index: int, snapshot=None):
         self._device_name = device_name
         self._id_site = id_site
         self._mqtt_client = mqtt_client
+        self._snapshot = snapshot
         self._relay_index = relay_index
+        self._path = relay_path(relay_index)
+        self._state_topic = f"N/{id_site}/{self._path}"
         self._state = False  # Par défaut, l'état du relais est éteint
 
         self._attr_name = f"{device_name} Relay {relay_index + 1}"
@@ -49,33 +63,30 @@ class CerboRelaySwitch(SwitchEntity):
 
     async def async_added_to_hass(self):
         """S'abonner au topic MQTT pour le relais à l'initialisation."""
+        if self._snapshot is not None:
+            # Dernier état connu, corrigé par la première valeur reçue du site
+            self._state = self._snapshot.get(self._state_topic) == 1
         _LOGGER.info(f"Abonnement au topic MQTT pour le relais {self._relay_index + 1}")
-        state_topic = f"N/{self._id_site}/system/0/Relay/{self._relay_index}/State"
-        self._mqtt_client.add_subscription(state_topic, self.on_mqtt_message)
+        # Le suivi des commandes reçoit la valeur courante en même temps que l'entité
+        self._mqtt_client.commands.watch(self._path)
+        self._mqtt_client.add_subscription(self._state_topic, self.on_mqtt_message)
 
     async def async_will_remove_from_hass(self):
         """Désabonnement lors de la suppression de l'entité."""
         _LOGGER.info(f"Désabonnement du topic MQTT pour le relais {self._relay_index + 1}")
-        state_topic = f"N/{self._id_site}/system/0/Relay/{self._relay_index}/State"
-        self._mqtt_client.remove_subscription(state_topic, self.on_mqtt_message)
-
-    def on_mqtt_message(self, client, userdata, msg):
-        """Gestion des messages MQTT pour l'état du relais."""
-        try:
-            if not msg.payload:
-                _LOGGER.warning("Message vide reçu sur le topic %s", msg.topic)
-                return
-
-            payload = json.loads(msg.payload)
-            value = payload.get("value", None)
-            if value is not None:
-                self._state = (value == 1)
-                self.hass.loop.call_soon_threadsafe(self.async_write_ha_state)
-        
-        except json.JSONDecodeError as e:
-            _LOGGER.error(f"Erreur de décodage du message JSON sur le topic {msg.topic}: {e}")
-        except Exception as e:
-            _LOGGER.error(f"Erreur lors du traitement du message : {e}")
+        self._mqtt_client.remove_subscription(self._state_topic, self.on_mqtt_message)
+        self._mqtt_client.cancel_state_write(self)
+
+    def on_mqtt_message(self, topic, value):
+        """Gestion des messages MQTT pour l'état du relais (valeur déjà décodée)."""
+        if value is not None:
+            if self._snapshot is not None:
+                self._snapshot.update(topic, value)
+            pending = self._mqtt_client.commands.pending_value(self._path)
+            if pending is not None and pending != value:
+                return  # Ancienne valeur republiée avant l'application de la commande : garder l'état demandé
+            self._state = (value == 1)
+            self._mqtt_client.schedule_state_write(self)  # Écriture groupée par site
 
     @property
     def is_on(self) -> bool:
@@ -83,19 +94,25 @@ class CerboRelaySwitch(SwitchEntity):
         return self._state
 
     async def async_turn_on(self, **kwargs):
-        """Active le relais (envoie la trame MQTT avec value=1)."""
+        """Active le relais (value=1) et attend la confirmation de Venus."""
         _LOGGER.info(f"Activation du relais {self._relay_index + 1} pour {self._device_name}")
-        payload = json.dumps({"value": 1})
-        state_topic = f"W/{self._id_site}/system/0/Relay/{self._relay_index}/State"
-        self._mqtt_client.publish(state_topic, payload)
-        self._state = True
-        self.async_write_ha_state()
+        await self._async_set(True)
 
     async def async_turn_off(self, **kwargs):
-        """Désactive le relais (envoie la trame MQTT avec value=0)."""
+        """Désactive le relais (value=0) et attend la confirmation de Venus."""
         _LOGGER.info(f"Désactivation du relais {self._relay_index + 1} pour {self._device_name}")
-        payload = json.dumps({"value": 0})
-        state_topic = f"W/{self._id_site}/system/0/Relay/{self._relay_index}/State"
-        self._mqtt_client.publish(state_topic, payload)
-        self._state = False
-        self.async_write_ha_state()
\ No newline at end of file
+        await self._async_set(False)
+
+    async def _async_set(self, on):
+        """État affiché immédiatement, puis annulé si l'écho de Venus n'arrive pas à temps."""
+        previous = self._state
+        self._state = on
+        self.async_write_ha_state()
+        try:
+            latency = await self._mqtt_client.commands.async_write(self._path, 1 if on else 0)
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            confirmed = self._mqtt_client.commands.last_value(self._path)
+            self._state = (confirmed == 1) if confirmed is not None else previous
+            self.async_write_ha_state()
+            raise HomeAssistantError(f"Le relais {self._relay_index + 1} de {self._device_name} n'a pas confirmé la commande") from e
+        _LOGGER.debug(f"Relais {self._relay_index + 1} de {self._device_name} confirmé en {latency * 1000:.0f} ms")
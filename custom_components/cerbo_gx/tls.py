@@ -0,0 +1,77 @@
+import logging
+import os
+import ssl
+import threading
+
+_LOGGER = logging.getLogger(__name__)
+
+# Certificat de l'autorité Victron utilisé pour le broker VRM
+CA_CERT_PATH = os.path.join(os.path.dirname(__file__), "venus-ca.crt")
+
+_contexts = {}
+_sessions = {}  # (hôte, port) -> dernière session TLS négociée avec ce broker
+_lock = threading.Lock()
+
+
+def ssl_context(verify):
+    """Contexte TLS partagé par toutes les connexions du processus.
+
+    Un contexte par mode (`verify` : certificat vérifié avec la CA Victron, ou
+    non vérifié pour le broker local du GX), construit au premier appel. Ce
+    premier appel lit le certificat CA : il doit être fait hors de la boucle.
+    """
+    with _lock:
+        context = _contexts.get(verify)
+        if context is None:
+            context = _contexts[verify] = _create_context(verify)
+        return context
+
+
+def _create_context(verify):
+    # Même protocole qu'auparavant avec tls_set(tls_version=PROTOCOL_TLSv1_2)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.maximum_version = ssl.TLSVersion.TLSv1_2
+    if verify:
+        if not os.path.exists(CA_CERT_PATH):
+            raise FileNotFoundError(f"Le certificat CA n'a pas été trouvé à l'emplacement : {CA_CERT_PATH}")
+        context.load_verify_locations(cafile=CA_CERT_PATH)
+    else:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    _LOGGER.debug("Contexte TLS créé (vérification du certificat : %s)", verify)
+    return context
+
+
+class ResumableContext:
+    """Contexte TLS d'une connexion vers un broker : le contexte partagé plus la reprise de session.
+
+    paho appelle `wrap_socket()` à chaque (re)connexion ; la dernière session
+    négociée avec le même broker (par cette connexion ou une précédente) y est
+    passée, ce qui permet de la reprendre (handshake abrégé, sans échange de
+    certificats). Si le broker refuse la reprise, un handshake complet a lieu.
+    """
+
+    __slots__ = ("context", "key")
+
+    def __init__(self, context, host, port):
+        self.context = context
+        self.key = (host, port)
+
+    @property
+    def check_hostname(self):
+        return self.context.check_hostname
+
+    def wrap_socket(self, sock, **kwargs):
+        session = _sessions.get(self.key)
+        if session is not None:
+            kwargs["session"] = session
+        return self.context.wrap_socket(sock, **kwargs)
+
+    def save_session(self, sock):
+        """Mémorise la session du socket TLS connecté ; retourne True si elle a été reprise."""
+        session = getattr(sock, "session", None)
+        if session is None:
+            return False
+        _sessions[self.key] = session
+        return sock.session_reused
@@ -0,0 +1,121 @@
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+SINGLE_LEVEL = "+"
+MULTI_LEVEL = "#"
+
+
+def pattern_covers(pattern, topic):
+    """Indique si `pattern` reçoit tous les messages de `topic` (topic concret ou autre motif)."""
+    pattern_levels = pattern.split("/")
+    levels = topic.split("/")
+    for index, level in enumerate(pattern_levels):
+        if level == MULTI_LEVEL:
+            return True
+        if index >= len(levels) or levels[index] == MULTI_LEVEL:
+            return False
+        if level != SINGLE_LEVEL and level != levels[index]:
+            return False
+    return len(levels) == len(pattern_levels)
+
+
+class _Node:
+    __slots__ = ("children", "callbacks")
+
+    def __init__(self):
+        self.children = {}
+        self.callbacks = []
+
+
+class TopicRouter:
+    """Routeur de topics MQTT basé sur un trie, avec support des jokers `+` et `#`.
+
+    La recherche d'un topic est en O(profondeur) ; le résultat est ensuite mis en
+    cache par topic concret, ce qui ramène la distribution à une simple lecture de
+    dictionnaire pour les topics republiés en boucle par Venus.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+        self._cache = {}
+
+    def add(self, pattern, callback):
+        """Enregistre un callback pour un topic (éventuellement avec jokers)."""
+        node = self._root
+        for level in pattern.split("/"):
+            node = node.children.setdefault(level, _Node())
+        node.callbacks.append(callback)
+        self._cache.clear()
+
+    def remove(self, pattern, callback):
+        """Retire un callback ; lève ValueError s'il n'était pas enregistré."""
+        path = [self._root]
+        levels = pattern.split("/")
+        for level in levels:
+            node = path[-1].children.get(level)
+            if node is None:
+                raise ValueError(pattern)
+            path.append(node)
+        path[-1].callbacks.remove(callback)
+        self._cache.clear()
+
+        # Élaguer les branches devenues vides
+        for level, parent, node in zip(reversed(levels), reversed(path[:-1]), reversed(path[1:])):
+            if node.callbacks or node.children:
+                break
+            del parent.children[level]
+
+    def has_pattern(self, pattern):
+        """Indique si au moins un callback est enregistré pour ce motif exact."""
+        node = self._root
+        for level in pattern.split("/"):
+            node = node.children.get(level)
+            if node is None:
+                return False
+        return bool(node.callbacks)
+
+    def patterns(self):
+        """Liste les motifs possédant au moins un callback."""
+        result = []
+        stack = [(self._root, [])]
+        while stack:
+            node, levels = stack.pop()
+            if node.callbacks:
+                result.append("/".join(levels))
+            for level, child in node.children.items():
+                stack.append((child, levels + [level]))
+        return result
+
+    def match(self, topic):
+        """Retourne le tuple des callbacks correspondant à un topic concret."""
+        callbacks = self._cache.get(topic)
+        if callbacks is None:
+            callbacks = self._cache[topic] = tuple(self._lookup(topic.split("/")))
+        return callbacks
+
+    def _lookup(self, levels):
+        found = []
+        nodes = [self._root]
+        for level in levels:
+            next_nodes = []
+            for node in nodes:
+                multi = node.children.get(MULTI_LEVEL)
+                if multi is not None:
+                    found.extend(multi.callbacks)
+                child = node.children.get(level)
+                if child is not None:
+                    next_nodes.append(child)
+                single = node.children.get(SINGLE_LEVEL)
+                if single is not None:
+                    next_nodes.append(single)
+            nodes = next_nodes
+            if not nodes:
+                return found
+        for node in nodes:
+            found.extend(node.callbacks)
+            # `a/#` correspond aussi au topic parent `a`
+            multi = node.children.get(MULTI_LEVEL)
+            if multi is not None:
+                found.extend(multi.callbacks)
+        return found
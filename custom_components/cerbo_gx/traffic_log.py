@@ -0,0 +1,265 @@
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+# Format du journal (ajout seul, little-endian) :
+#   en-tête   : MAGIC
+#   TOPIC     : type (B), id du topic (H), longueur (H), topic UTF-8
+#   MESSAGE   : type (B), horodatage epoch (d), id du topic (H), longueur (I), payload brut
+#   RESET     : type (B) ; la table des topics repart de zéro (nouvelle session, table pleine)
+MAGIC = b"CGXTRF01"
+RECORD_TOPIC = 1
+RECORD_MESSAGE = 2
+RECORD_RESET = 3
+_TOPIC = struct.Struct("<BHH")
+_MESSAGE = struct.Struct("<BdHI")
+_RESET = struct.Struct("<B")
+MAX_TOPIC_ID = 0xFFFF
+
+# Écriture sur disque : au plus tard après FLUSH_INTERVAL s, ou dès que le tampon atteint MAX_BUFFER
+FLUSH_INTERVAL = 1.0
+MAX_BUFFER = 1 << 20
+# Taille maximale du journal : au-delà, il est renommé en `<chemin>.1` (remplaçant le
+# précédent) et un nouveau journal est commencé
+MAX_LOG_SIZE = 64 << 20
+
+# Opération d'écriture : rotation du journal
+_ROTATE = object()
+
+
+class TrafficRecorder:
+    """Enregistre le trafic MQTT brut d'un site dans un journal binaire.
+
+    `record()` ne fait qu'ajouter quelques octets à un tampon mémoire (topics
+    internés sous forme d'identifiants) ; l'écriture disque a lieu dans
+    l'exécuteur, par blocs, sans jamais bloquer la boucle. Le journal est
+    limité à `max_size` octets (rotation vers `<chemin>.1`), et le tampon à
+    `max_buffer` octets : si le disque ne suit pas, les messages suivants sont
+    ignorés (et comptés dans `dropped`) jusqu'à la fin de l'écriture en cours.
+    """
+
+    def __init__(self, path, loop, flush_interval=FLUSH_INTERVAL, max_buffer=MAX_BUFFER, max_size=MAX_LOG_SIZE):
+        self.path = path
+        self._loop = loop
+        self._flush_interval = flush_interval
+        self._max_buffer = max_buffer
+        self._max_size = max_size
+        self._file = None
+        self._topics = {}
+        self._buffer = bytearray()
+        self._pending = []  # Opérations en attente de l'écriture en cours : blocs (bytes) ou _ROTATE
+        self._size = 0  # Taille du journal courant, tampon compris
+        self._handle = None
+        self._writing = None
+        self.dropped = 0  # Messages ignorés depuis l'ouverture
+        self._dropping = 0  # Messages ignorés depuis la dernière écriture
+        self.rotations = 0
+
+    async def async_open(self):
+        """Ouvre le journal (en ajout) hors de la boucle."""
+        self._file = await self._loop.run_in_executor(None, self._open)
+        self._size = self._file.tell()
+        _LOGGER.info("Enregistrement du trafic MQTT dans %s", self.path)
+
+    def _open(self):
+        file = open(self.path, "ab")
+        file.write(MAGIC if file.tell() == 0 else _RESET.pack(RECORD_RESET))
+        return file
+
+    def record(self, topic, payload):
+        """Ajoute un message au journal."""
+        buffer = self._buffer
+        if self._writing is not None and len(buffer) >= self._max_buffer:
+            if not self._dropping:
+                _LOGGER.warning("Journal %s : le disque ne suit pas, messages ignorés jusqu'à la fin de l'écriture", self.path)
+            self._dropping += 1
+            self.dropped += 1
+            return
+        if self._size >= self._max_size:
+            self._rotate()
+        start = len(buffer)
+        topic_id = self._topics.get(topic)
+        if topic_id is None:
+            if len(self._topics) > MAX_TOPIC_ID:
+                self._topics.clear()
+                buffer += _RESET.pack(RECORD_RESET)
+            topic_id = self._topics[topic] = len(self._topics)
+            encoded = topic.encode()
+            buffer += _TOPIC.pack(RECORD_TOPIC, topic_id, len(encoded))
+            buffer += encoded
+        buffer += _MESSAGE.pack(RECORD_MESSAGE, time.time(), topic_id, len(payload))
+        buffer += payload
+        self._size += len(buffer) - start
+
+        if len(buffer) >= self._max_buffer:
+            self._write()
+        elif self._handle is None:
+            self._handle = self._loop.call_later(self._flush_interval, self._write)
+
+    def _rotate(self):
+        """Termine le journal courant ; le suivant repart d'une table des topics vide."""
+        self._take_buffer()
+        self._pending.append(_ROTATE)
+        self._topics.clear()
+        self._size = len(MAGIC)
+        self.rotations += 1
+        self._write()
+
+    def _take_buffer(self):
+        if self._buffer:
+            self._pending.append(bytes(self._buffer))
+            self._buffer.clear()
+
+    def _write(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._writing is not None or self._file is None:
+            return  # Une écriture est en cours : le reste partira à sa fin
+        self._take_buffer()
+        if not self._pending:
+            return
+        operations, self._pending = self._pending, []
+        self._writing = self._loop.run_in_executor(None, self._apply, operations)
+        self._writing.add_done_callback(self._on_written)
+
+    def _apply(self, operations):
+        """Écrit les blocs et effectue les rotations, dans l'ordre (exécuteur)."""
+        for operation in operations:
+            if operation is _ROTATE:
+                self._file.close()
+                os.replace(self.path, f"{self.path}.1")
+                self._file = open(self.path, "wb")
+                self._file.write(MAGIC)
+            else:
+                self._file.write(operation)
+
+    def _on_written(self, future):
+        self._writing = None
+        if future.exception() is not None:
+            _LOGGER.error("Erreur lors de l'écriture du journal %s : %s", self.path, future.exception())
+        if self._dropping:
+            _LOGGER.warning("Journal %s : %d messages ignorés", self.path, self._dropping)
+            self._dropping = 0
+        if self._pending or len(self._buffer) >= self._max_buffer:
+            self._write()
+        elif self._buffer and self._handle is None:
+            self._handle = self._loop.call_later(self._flush_interval, self._write)
+
+    async def async_close(self):
+        """Écrit le reste du tampon et ferme le journal."""
+        while self._writing is not None:
+            await self._writing
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._file is None:
+            return
+        self._take_buffer()
+        operations, self._pending = self._pending, []
+        await self._loop.run_in_executor(None, self._close, operations)
+
+    def _close(self, operations):
+        self._apply(operations)
+        file, self._file = self._file, None
+        file.close()
+
+
+class TrafficLogReader:
+    """Lecture d'un journal de trafic par projection mémoire (mmap)."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __iter__(self):
+        """Itère sur les messages `(horodatage, topic, payload)` du journal."""
+        for batch in self.batches():
+            yield from batch
+
+    def batches(self, size=10000):
+        """Itère sur le journal par lots de `size` messages."""
+        with open(self.path, "rb") as file:
+            if os.fstat(file.fileno()).st_size <= len(MAGIC):
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if data[: len(MAGIC)] != MAGIC:
+                    raise ValueError(f"{self.path} n'est pas un journal de trafic Cerbo GX")
+                yield from self._parse(data, size)
+
+    @staticmethod
+    def _parse(data, size):
+        end = len(data)
+        pos = len(MAGIC)
+        topics = []
+        batch = []
+        unpack_message = _MESSAGE.unpack_from
+        unpack_topic = _TOPIC.unpack_from
+        while pos < end:
+            kind = data[pos]
+            if kind == RECORD_MESSAGE:
+                if pos + _MESSAGE.size > end:
+                    break  # Enregistrement tronqué (écriture interrompue)
+                _, timestamp, topic_id, length = unpack_message(data, pos)
+                pos += _MESSAGE.size
+                if pos + length > end:
+                    break
+                batch.append((timestamp, topics[topic_id], data[pos:pos + length]))
+                pos += length
+                if len(batch) >= size:
+                    yield batch
+                    batch = []
+            elif kind == RECORD_TOPIC:
+                if pos + _TOPIC.size > end:
+                    break
+                _, topic_id, length = unpack_topic(data, pos)
+                pos += _TOPIC.size
+                topic = data[pos:pos + length].decode()
+                pos += length
+                if topic_id == len(topics):
+                    topics.append(topic)
+                else:
+                    topics[topic_id] = topic
+            elif kind == RECORD_RESET:
+                topics = []
+                pos += _RESET.size
+            else:
+                raise ValueError(f"Enregistrement inconnu ({kind}) à la position {pos} de la trace")
+        if batch:
+            yield batch
+
+
+async def async_replay(path, dispatch, speed=1.0, topic_rewrite=None, batch_size=10000):
+    """Rejoue un journal dans `dispatch(topic, payload)` depuis la boucle courante.
+
+    `speed` est le facteur d'accélération (1 = temps réel, 0 = aussi vite que
+    possible) ; `topic_rewrite` permet par exemple de rejouer la trace d'un
+    site sur un autre. La lecture du fichier se fait dans l'exécuteur, par lots.
+    Retourne le nombre de messages rejoués.
+    """
+    loop = asyncio.get_running_loop()
+    batches = TrafficLogReader(path).batches(batch_size)
+    count = 0
+    first = None
+    start = loop.time()
+    while True:
+        batch = await loop.run_in_executor(None, next, batches, None)
+        if batch is None:
+            break
+        for timestamp, topic, payload in batch:
+            if speed:
+                if first is None:
+                    first = timestamp
+                delay = (timestamp - first) / speed - (loop.time() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if topic_rewrite is not None:
+                topic = topic_rewrite(topic)
+            dispatch(topic, payload)
+        count += len(batch)
+        await asyncio.sleep(0)
+    return count
@@ -0,0 +1,108 @@
+import random
+from .commands import CommandTracker
+from .metrics import SiteMetrics
+
+# Reconnexion : attente tirée au hasard dans [0, min(RECONNECT_MAX_DELAY, RECONNECT_DELAY * 2^échecs)]
+RECONNECT_DELAY = 5
+RECONNECT_MAX_DELAY = 300
+
+# Transports de site disponibles (réglage `transport` de MQTTManager.async_add_device)
+TRANSPORT_MQTT = "mqtt"
+TRANSPORT_MODBUS = "modbus"
+# Client créé par l'intégration elle-même (ha_mqtt.py), qui dépend de Home Assistant
+TRANSPORT_HA_MQTT = "ha_mqtt"
+
+
+def reconnect_delay(failures):
+    """Délai avant la prochaine tentative : backoff exponentiel à gigue complète.
+
+    La gigue étale les reconnexions de toutes les connexions après une panne du
+    broker, au lieu de les faire revenir en même temps.
+    """
+    return random.uniform(0, min(RECONNECT_MAX_DELAY, RECONNECT_DELAY * 2 ** failures))
+
+
+class SiteTransport:
+    """Interface commune des clients de site utilisée par les entités, les services et la découverte.
+
+    Un transport reçoit les valeurs d'un site et les distribue aux abonnés de
+    chaque topic Venus (`N/{id_site}/...`) ; `publish()` accepte les écritures
+    `W/{id_site}/...`. Les écritures d'état groupées, les métriques et le suivi
+    des commandes sont communs à tous les transports.
+    """
+
+    def __init__(self, id_site, flush_interval=0):
+        self.id_site = id_site
+        self.flush_interval = flush_interval
+        self.state_writer = None
+        self._full_sync_done = False
+        self._sync_listeners = []  # Callbacks `(full_sync_done)` appelés à chaque changement
+        # Délai entre le démarrage (ou la perte de connexion) et la première valeur reçue
+        self.time_to_first_value = None
+        self._connected = False
+        self.metrics = SiteMetrics()
+        self.commands = CommandTracker(self)  # Écritures W/ suivies jusqu'à leur confirmation
+
+    async def async_start(self):
+        raise NotImplementedError
+
+    async def async_stop(self):
+        raise NotImplementedError
+
+    def add_subscription(self, topic, callback, value_key="", raw=False):
+        """Ajoute un callback `(topic, valeur)` pour un topic ; avec `raw=True`, il reçoit le payload brut."""
+        raise NotImplementedError
+
+    def remove_subscription(self, topic, callback):
+        raise NotImplementedError
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        raise NotImplementedError
+
+    def dispatch(self, topic, raw, timed=False):
+        """Distribue un message brut comme s'il venait du site (rejeu du trafic)."""
+        raise NotImplementedError
+
+    def subscribed_topics(self):
+        raise NotImplementedError
+
+    def diagnostics(self):
+        raise NotImplementedError
+
+    def keepalive_interval(self):
+        """Intervalle avant le prochain keep-alive Venus, ou None si le transport n'en a pas besoin."""
+        return None
+
+    def schedule_state_write(self, entity):
+        """Demande une écriture d'état groupée pour une entité du site."""
+        self.state_writer.schedule(entity)
+
+    def cancel_state_write(self, entity):
+        """Annule l'écriture d'état en attente d'une entité."""
+        if self.state_writer is not None:
+            self.state_writer.discard(entity)
+
+    @property
+    def full_sync_done(self):
+        """Indique si l'arbre complet du site a été reçu depuis la dernière (re)connexion."""
+        return self._full_sync_done
+
+    @full_sync_done.setter
+    def full_sync_done(self, done):
+        if done == self._full_sync_done:
+            return
+        self._full_sync_done = done
+        for listener in list(self._sync_listeners):
+            listener(done)
+
+    def add_sync_listener(self, listener):
+        """Appelle `listener(full_sync_done)` à chaque début et fin de publication complète."""
+        self._sync_listeners.append(listener)
+
+    def remove_sync_listener(self, listener):
+        self._sync_listeners.remove(listener)
+
+    @property
+    def connected(self):
+        """Indique si le site est joignable par ce transport."""
+        return self._connected
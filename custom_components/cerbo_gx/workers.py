@@ -0,0 +1,468 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import signal
+from .state_writer import StateWriteBuffer
+from .transport import SiteTransport
+
+_LOGGER = logging.getLogger(__name__)
+
+# Intervalle (s) d'envoi de l'état des sites (connexion, métriques) par chaque processus d'ingestion
+STATUS_INTERVAL = 2.0
+# Nombre de valeurs au-delà duquel un lot est envoyé sans attendre le tour de boucle suivant
+MAX_BATCH = 5000
+# Délai (s) avant de relancer un processus d'ingestion arrêté de façon inattendue
+WORKER_RESTART_DELAY = 5.0
+# Délai (s) laissé aux processus pour s'arrêter proprement avant d'être tués
+WORKER_STOP_TIMEOUT = 5.0
+
+# Marqueur « aucune valeur transmise » (None est une valeur valide)
+_MISSING = object()
+
+
+class _Forwarder:
+    """Abonné côté processus d'ingestion : transmet une valeur au processus principal si elle a changé.
+
+    Un abonnement à un motif (`+`, `#`) reçoit plusieurs topics concrets : la
+    dernière valeur transmise est tenue par topic. Le topic n'est pas transmis
+    lorsqu'il est identique au motif (cas de toutes les entités fixes).
+    """
+
+    __slots__ = ("_worker", "sub_id", "topic", "_last")
+
+    def __init__(self, worker, sub_id, topic):
+        self._worker = worker
+        self.sub_id = sub_id
+        self.topic = topic
+        self._last = {}
+
+    def __call__(self, topic, value):
+        last = self._last.get(topic, _MISSING)
+        if last is not _MISSING and last == value and type(last) is type(value):
+            return
+        self._last[topic] = value
+        self._worker.forward((self.sub_id, None if topic == self.topic else topic, value))
+
+
+class IngestWorker:
+    """Processus d'ingestion : possède les connexions de ses sites, décode et filtre les messages.
+
+    Les sites confiés au processus sont servis par un MQTTManager ordinaire
+    (connexions partagées, routeur, décodage) ; seuls les abonnements demandés
+    par le processus principal y sont enregistrés, et seules les valeurs qui
+    ont changé lui sont renvoyées, par lots, sous forme de triplets compacts
+    `(identifiant d'abonnement, topic ou None, valeur)`.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._loop = None
+        self._manager = None
+        self._queue = None
+        self._forwarders = {}  # sub_id -> (client, _Forwarder)
+        self._batch = []
+        self._flush_handle = None
+
+    async def run(self):
+        from .mqtt_client import MQTTManager
+
+        self._loop = asyncio.get_running_loop()
+        self._manager = MQTTManager()
+        self._queue = asyncio.Queue()
+        self._loop.add_reader(self._conn.fileno(), self._on_readable)
+        status_task = self._loop.create_task(self._status_loop())
+        try:
+            # Les commandes sont traitées une à une, dans l'ordre d'envoi
+            while True:
+                message = await self._queue.get()
+                if message is None:
+                    break
+                try:
+                    await self._handle(message)
+                except Exception as e:
+                    _LOGGER.error(f"Erreur lors du traitement de la commande {message[0]} : {e}")
+        finally:
+            status_task.cancel()
+            self._loop.remove_reader(self._conn.fileno())
+            for id_site in list(self._manager.clients):
+                await self._manager.async_remove_device(id_site)
+
+    def _on_readable(self):
+        try:
+            while self._conn.poll():
+                self._queue.put_nowait(self._conn.recv())
+        except (EOFError, OSError):
+            # Processus principal arrêté : fin du processus
+            self._loop.remove_reader(self._conn.fileno())
+            self._queue.put_nowait(None)
+
+    async def _handle(self, message):
+        op, id_site = message[0], message[1] if len(message) > 1 else None
+        if op == "stop":
+            self._queue.put_nowait(None)
+        elif op == "add":
+            await self._manager.async_add_device(id_site, **message[2])
+        elif op == "remove":
+            client = self._manager.get_client(id_site)
+            for sub_id, (owner, _) in list(self._forwarders.items()):
+                if owner is client:
+                    del self._forwarders[sub_id]
+            await self._manager.async_remove_device(id_site)
+        elif op == "sub":
+            _, _, sub_id, topic, value_key, raw = message
+            client = self._manager.get_client(id_site)
+            if client is not None:
+                forwarder = _Forwarder(self, sub_id, topic)
+                self._forwarders[sub_id] = (client, forwarder)
+                client.add_subscription(topic, forwarder, value_key, raw=raw)
+        elif op == "unsub":
+            entry = self._forwarders.pop(message[2], None)
+            if entry is not None:
+                client, forwarder = entry
+                client.remove_subscription(forwarder.topic, forwarder)
+        elif op == "publish":
+            client = self._manager.get_client(id_site)
+            if client is not None:
+                _, _, topic, payload, qos, retain = message
+                client.publish(topic, payload, qos=qos, retain=retain)
+        elif op == "inject":
+            client = self._manager.get_client(id_site)
+            if client is not None:
+                client.dispatch(message[2], message[3])
+        else:
+            _LOGGER.error(f"Commande inconnue : {op}")
+
+    def forward(self, item):
+        """Ajoute une valeur au lot envoyé au prochain tour de boucle."""
+        batch = self._batch
+        batch.append(item)
+        if len(batch) >= MAX_BATCH:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = self._loop.call_soon(self._flush)
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._batch = self._batch, []
+        if batch:
+            self._send(("values", batch))
+
+    async def _status_loop(self):
+        while True:
+            await asyncio.sleep(STATUS_INTERVAL)
+            status = {}
+            for id_site, client in self._manager.clients.items():
+                info = client.diagnostics()
+                info.pop("metrics")
+                status[id_site] = (client.connected, client.full_sync_done, client.time_to_first_value, client.metrics, info)
+            self._send(("status", status))
+
+    def _send(self, message):
+        try:
+            self._conn.send(message)
+        except (OSError, ValueError) as e:
+            _LOGGER.error(f"Envoi impossible vers le processus principal : {e}")
+
+
+def worker_main(conn, log_level=logging.WARNING):
+    """Point d'entrée d'un processus d'ingestion."""
+    # L'arrêt est décidé par le processus principal (commande "stop" ou fermeture du tube)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=log_level, format="%(asctime)s %(levelname)s (%(processName)s) [%(name)s] %(message)s")
+    asyncio.run(IngestWorker(conn).run())
+
+
+class WorkerHandle:
+    """Côté processus principal : un processus d'ingestion, son tube et les sites qui lui sont confiés."""
+
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.index = index
+        self.sites = {}  # id_site -> RemoteSiteClient
+        self.routes = {}  # sub_id -> (client, motif, callbacks, dernières valeurs par topic)
+        self.process = None
+        self.restarts = 0
+        self.batches = 0
+        self.values = 0
+        self._conn = None
+        self._loop = None
+        self._restart_task = None
+
+    def start(self):
+        """Lance le processus (bloquant : à appeler hors de la boucle)."""
+        parent_conn, child_conn = self.pool.context.Pipe()
+        self.process = self.pool.context.Process(
+            target=self.pool.target,
+            args=(child_conn, logging.getLogger(__package__).getEffectiveLevel()),
+            name=f"cerbo_gx-ingest-{self.index}",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self._conn = parent_conn
+
+    def attach(self, loop):
+        """Surveille le tube depuis la boucle asyncio."""
+        if self._loop is None and self._conn is not None:
+            self._loop = loop
+            loop.add_reader(self._conn.fileno(), self._on_readable)
+
+    def detach(self):
+        if self._loop is not None and self._conn is not None:
+            self._loop.remove_reader(self._conn.fileno())
+        self._loop = None
+        if self._restart_task is not None:
+            self._restart_task.cancel()
+            self._restart_task = None
+
+    def send(self, message):
+        if self._conn is None:
+            return
+        try:
+            self._conn.send(message)
+        except (OSError, ValueError) as e:
+            _LOGGER.error(f"Envoi impossible vers le processus d'ingestion {self.index} : {e}")
+
+    def add_site(self, client):
+        self.sites[client.id_site] = client
+        for message in client.setup_messages():
+            self.send(message)
+
+    def remove_site(self, client):
+        if self.sites.get(client.id_site) is client:
+            del self.sites[client.id_site]
+            for sub_id in client.subscription_ids():
+                self.routes.pop(sub_id, None)
+            self.send(("remove", client.id_site))
+
+    def _on_readable(self):
+        try:
+            while self._conn.poll():
+                message = self._conn.recv()
+                if message[0] == "values":
+                    self._deliver(message[1])
+                elif message[0] == "status":
+                    for id_site, status in message[1].items():
+                        client = self.sites.get(id_site)
+                        if client is not None:
+                            client.update_status(*status)
+        except (EOFError, OSError):
+            self._on_exit()
+
+    def _deliver(self, batch):
+        self.batches += 1
+        self.values += len(batch)
+        routes = self.routes
+        for sub_id, topic, value in batch:
+            route = routes.get(sub_id)
+            if route is None:
+                continue  # Désabonné entre-temps
+            client, pattern, callbacks, values = route
+            client.deliver(pattern if topic is None else topic, value, callbacks, values)
+
+    def _on_exit(self):
+        """Le processus s'est arrêté : ses sites sont déconnectés, puis il est relancé."""
+        self.detach()
+        self._conn.close()
+        self._conn = None
+        _LOGGER.error(f"Processus d'ingestion {self.index} arrêté : {len(self.sites)} site(s) déconnecté(s)")
+        for client in self.sites.values():
+            client.on_worker_lost()
+        if not self.pool.closed:
+            self._restart_task = asyncio.get_running_loop().create_task(self._async_restart())
+
+    async def _async_restart(self):
+        loop = asyncio.get_running_loop()
+        await asyncio.sleep(WORKER_RESTART_DELAY)
+        exitcode = self.process.exitcode
+        await loop.run_in_executor(None, self.start)
+        self._restart_task = None
+        self.restarts += 1
+        self.attach(loop)
+        _LOGGER.warning(f"Processus d'ingestion {self.index} relancé après une sortie avec le code {exitcode} ({len(self.sites)} site(s))")
+        for client in self.sites.values():
+            for message in client.setup_messages():
+                self.send(message)
+
+    def stop(self):
+        """Demande l'arrêt du processus et l'attend (bloquant : à appeler hors de la boucle)."""
+        if self.process is None:
+            return
+        self.send(("stop",))
+        self.process.join(WORKER_STOP_TIMEOUT)
+        if self.process.is_alive():
+            _LOGGER.warning(f"Processus d'ingestion {self.index} arrêté de force")
+            self.process.terminate()
+            self.process.join()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def diagnostics(self):
+        return {
+            "index": self.index,
+            "pid": self.process.pid if self.process is not None else None,
+            "alive": self.process is not None and self.process.is_alive(),
+            "sites": len(self.sites),
+            "restarts": self.restarts,
+            "batches": self.batches,
+            "values": self.values,
+        }
+
+
+class WorkerPool:
+    """Processus d'ingestion entre lesquels les sites sont répartis.
+
+    Chaque site est confié au processus qui en sert le moins ; les connexions
+    restent partagées entre les sites d'un même processus. Les processus sont
+    lancés avec la méthode « spawn » (un fork du processus de Home Assistant,
+    multithreadé, n'est pas sûr).
+    """
+
+    def __init__(self, size, target=worker_main):
+        self.context = multiprocessing.get_context("spawn")
+        self.target = target
+        self.closed = False
+        self._sub_ids = itertools.count(1)
+        self.workers = [WorkerHandle(self, index) for index in range(size)]
+        for worker in self.workers:
+            worker.start()
+
+    def client(self, id_site, settings):
+        """Crée le client d'un site sur le processus le moins chargé."""
+        worker = min(self.workers, key=lambda w: len(w.sites))
+        return RemoteSiteClient(worker, id_site, settings)
+
+    def next_sub_id(self):
+        return next(self._sub_ids)
+
+    async def async_close(self):
+        """Arrête tous les processus."""
+        self.closed = True
+        for worker in self.workers:
+            worker.detach()
+        await asyncio.get_running_loop().run_in_executor(None, self._stop_all)
+
+    def _stop_all(self):
+        for worker in self.workers:
+            worker.stop()
+
+
+class RemoteSiteClient(SiteTransport):
+    """Client d'un site servi par un processus d'ingestion ; même interface que CerboMQTTClient pour les entités.
+
+    Les abonnements identiques (topic, clé de valeur) sont regroupés en un seul
+    abonnement distant. Les valeurs reçues sont déjà décodées et ne sont
+    transmises que lorsqu'elles changent : un abonné ne reçoit pas les
+    republications d'une valeur inchangée. Le processus d'ingestion ne
+    renvoyant rien à un abonné tardif, celui-ci reçoit les dernières valeurs
+    de l'abonnement partagé. Écritures d'état groupées et suivi
+    des commandes restent dans le processus principal.
+    """
+
+    def __init__(self, worker, id_site, settings):
+        super().__init__(id_site, settings["flush_interval"])
+        self._worker = worker
+        self._settings = settings
+        self._subs = {}  # (topic, clé de valeur ou None si brut) -> (sub_id, callbacks, dernières valeurs par topic)
+        self._entries = {}  # (topic, callback) -> clé de self._subs
+        self._info = {}  # Diagnostics du client dans le processus d'ingestion
+        self._loop = None
+
+    async def async_start(self):
+        loop = self._loop = asyncio.get_running_loop()
+        self.state_writer = StateWriteBuffer(loop, self.flush_interval)
+        self._worker.attach(loop)
+        self._worker.add_site(self)
+
+    async def async_stop(self):
+        self.state_writer.cancel()
+        self.commands.close()
+        self._worker.remove_site(self)
+        self._connected = False
+
+    def setup_messages(self):
+        """Commandes recréant le site et ses abonnements dans un processus d'ingestion."""
+        yield ("add", self.id_site, self._settings)
+        for (topic, value_key), (sub_id, _, _) in self._subs.items():
+            yield ("sub", self.id_site, sub_id, topic, value_key or "", value_key is None)
+
+    def subscription_ids(self):
+        return [sub_id for sub_id, _, _ in self._subs.values()]
+
+    def add_subscription(self, topic, callback, value_key="", raw=False):
+        """Ajoute un callback pour un topic ; voir CerboMQTTClient.add_subscription."""
+        key = (topic, None if raw else value_key)
+        sub = self._subs.get(key)
+        if sub is None:
+            sub = self._subs[key] = (self._worker.pool.next_sub_id(), [], {})
+            self._worker.routes[sub[0]] = (self, topic, sub[1], sub[2])
+            self._worker.send(("sub", self.id_site, sub[0], topic, value_key, raw))
+        elif sub[2] and self._loop is not None:
+            self._loop.call_soon(self._replay, callback, sub[2])
+        sub[1].append(callback)
+        self._entries[(topic, callback)] = key
+
+    def remove_subscription(self, topic, callback):
+        """Supprime le callback d'un topic ; l'abonnement distant est retiré avec le dernier callback."""
+        key = self._entries.pop((topic, callback), None)
+        if key is None:
+            _LOGGER.error(f"Callback non trouvé pour le topic : {topic}")
+            return
+        sub_id, callbacks, _ = self._subs[key]
+        callbacks.remove(callback)
+        if not callbacks:
+            del self._subs[key]
+            self._worker.routes.pop(sub_id, None)
+            self._worker.send(("unsub", self.id_site, sub_id))
+
+    def deliver(self, topic, value, callbacks, values):
+        """Valeur reçue du processus d'ingestion pour un abonnement du site."""
+        values[topic] = value
+        for callback in tuple(callbacks):
+            try:
+                callback(topic, value)
+            except Exception as e:
+                _LOGGER.error("Erreur lors du traitement du message sur %s : %s", topic, e)
+
+    def _replay(self, callback, values):
+        """Transmet à un abonné tardif les dernières valeurs de l'abonnement partagé."""
+        for topic, value in list(values.items()):
+            try:
+                callback(topic, value)
+            except Exception as e:
+                _LOGGER.error("Erreur lors du traitement du message sur %s : %s", topic, e)
+
+    def dispatch(self, topic, raw, timed=False):
+        """Injecte un message brut dans le chemin de distribution du processus d'ingestion (rejeu)."""
+        self._worker.send(("inject", self.id_site, topic, raw))
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """Publier un message sur un topic donné (par la connexion du processus d'ingestion)."""
+        self._worker.send(("publish", self.id_site, topic, payload, qos, retain))
+
+    def update_status(self, connected, full_sync_done, time_to_first_value, metrics, info):
+        """État périodique du site envoyé par le processus d'ingestion."""
+        self._connected = connected
+        self.full_sync_done = full_sync_done
+        self.time_to_first_value = time_to_first_value
+        self._info = info
+        # Les commandes sont suivies dans ce processus : leurs métriques sont conservées
+        metrics.command_timeouts = self.metrics.command_timeouts
+        metrics.command_rtt = self.metrics.command_rtt
+        self.metrics = metrics
+
+    def on_worker_lost(self):
+        self._connected = False
+
+    def subscribed_topics(self):
+        return self._info.get("client", {}).get("subscribed_topics", [])
+
+    def diagnostics(self):
+        data = dict(self._info)
+        data["metrics"] = self.metrics.as_dict()
+        data["worker"] = self._worker.diagnostics()
+        return data
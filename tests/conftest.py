@@ -0,0 +1,57 @@
+"""Configuration commune des tests de l'intégration Cerbo GX.
+
+Comme le banc d'essai (benchmarks/bench_mqtt.py), les tests chargent les modules
+de l'intégration sans exécuter son __init__, qui dépend de Home Assistant : les
+modules testés ici n'en ont pas besoin.
+
+Sans Home Assistant installé, les modules qu'importe ha_mqtt sont remplacés par
+des substituts minimaux ; les tests y installent leur propre intégration MQTT.
+"""
+
+import os
+import sys
+import types
+
+_PACKAGE_DIR = os.path.join(os.path.dirname(__file__), os.pardir, "custom_components", "cerbo_gx")
+_package = types.ModuleType("cerbo_gx")
+_package.__path__ = [os.path.abspath(_PACKAGE_DIR)]
+sys.modules.setdefault("cerbo_gx", _package)
+
+
+def _unavailable(*args, **kwargs):
+    raise NotImplementedError("intégration MQTT de Home Assistant absente des tests")
+
+
+def _callback(func):
+    func._hass_callback = True
+    return func
+
+
+def _install_homeassistant_stubs():
+    """Substituts des seuls noms de Home Assistant utilisés par ha_mqtt."""
+    stubs = {
+        "homeassistant": {},
+        "homeassistant.core": {"HomeAssistant": type("HomeAssistant", (), {}), "callback": _callback},
+        "homeassistant.exceptions": {"HomeAssistantError": type("HomeAssistantError", (Exception,), {})},
+        "homeassistant.components": {},
+        "homeassistant.components.mqtt": {
+            "async_subscribe": _unavailable,
+            "async_publish": _unavailable,
+            "is_connected": _unavailable,
+            "async_subscribe_connection_status": _unavailable,
+        },
+    }
+    for name, attributes in stubs.items():
+        module = types.ModuleType(name)
+        module.__dict__.update(attributes)
+        if name.count(".") == 0 or name.endswith(".components"):
+            module.__path__ = []
+        sys.modules.setdefault(name, module)
+    sys.modules["homeassistant"].components = sys.modules["homeassistant.components"]
+    sys.modules["homeassistant.components"].mqtt = sys.modules["homeassistant.components.mqtt"]
+
+
+try:
+    import homeassistant.components.mqtt  # noqa: F401
+except ImportError:
+    _install_homeassistant_stubs()
@@ -0,0 +1,108 @@
+"""Broker MQTT 3.1.1 minimal pour les tests d'E/S du client (connexions réelles, TCP ou TLS).
+
+Il acquitte CONNECT, SUBSCRIBE, UNSUBSCRIBE et PINGREQ, journalise les paquets
+reçus et peut publier vers tous les clients connectés (QoS 0 uniquement).
+"""
+
+import asyncio
+import ssl
+import struct
+
+
+def publish_packet(topic, payload):
+    """Paquet PUBLISH QoS 0."""
+    topic = topic.encode()
+    return _packet(0x30, struct.pack(">H", len(topic)) + topic + payload)
+
+
+def _packet(header, body):
+    length, encoded = len(body), bytearray()
+    while True:
+        byte, length = length & 0x7F, length >> 7
+        encoded.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes([header]) + bytes(encoded) + body
+
+
+def _topics(data, qos):
+    """Topics d'un SUBSCRIBE (chacun suivi de sa QoS) ou d'un UNSUBSCRIBE."""
+    topics = []
+    while data:
+        (length,) = struct.unpack(">H", data[:2])
+        topics.append(data[2:2 + length].decode())
+        data = data[2 + length + (1 if qos else 0):]
+    return topics
+
+
+class FakeBroker:
+    """Broker de test : `burst` est envoyé avec le CONNACK, en une seule écriture."""
+
+    def __init__(self, ssl_context=None, burst=b""):
+        self.ssl_context = ssl_context
+        self.burst = burst
+        self.port = None
+        self.connects = 0
+        self.log = []  # ("subscribe" | "unsubscribe", [topics]), ("publish", topic, payload), ("disconnect",)
+        self._server = None
+        self._writers = []
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0, ssl=self.ssl_context)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        for writer in self._writers:
+            writer.close()
+        await self._server.wait_closed()
+
+    def publish(self, topic, payload):
+        """Publie un message vers tous les clients connectés."""
+        for writer in self._writers:
+            writer.write(publish_packet(topic, payload))
+
+    def entries(self, kind):
+        return [entry for entry in self.log if entry[0] == kind]
+
+    async def _read_packet(self, reader):
+        header = (await reader.readexactly(1))[0]
+        length, shift = 0, 0
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        return header, await reader.readexactly(length)
+
+    async def _handle(self, reader, writer):
+        try:
+            header, _ = await self._read_packet(reader)
+            assert header >> 4 == 1  # CONNECT
+            self.connects += 1
+            self._writers.append(writer)
+            writer.write(b"\x20\x02\x00\x00" + self.burst)
+            while True:
+                header, body = await self._read_packet(reader)
+                kind = header >> 4
+                if kind == 3:  # PUBLISH (QoS 0)
+                    (length,) = struct.unpack(">H", body[:2])
+                    self.log.append(("publish", body[2:2 + length].decode(), body[2 + length:]))
+                elif kind == 8:  # SUBSCRIBE
+                    topics = _topics(body[2:], qos=True)
+                    self.log.append(("subscribe", sorted(topics)))
+                    writer.write(_packet(0x90, body[:2] + bytes(len(topics))))
+                elif kind == 10:  # UNSUBSCRIBE
+                    self.log.append(("unsubscribe", sorted(_topics(body[2:], qos=False))))
+                    writer.write(_packet(0xB0, body[:2]))
+                elif kind == 12:  # PINGREQ
+                    writer.write(b"\xd0\x00")
+                elif kind == 14:  # DISCONNECT
+                    self.log.append(("disconnect",))
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            if writer in self._writers:
+                self._writers.remove(writer)
+            writer.close()
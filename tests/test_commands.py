@@ -0,0 +1,90 @@
+import asyncio
+import itertools
+import types
+
+import pytest
+
+from cerbo_gx.commands import relay_path, serialize_value
+from cerbo_gx.workers import RemoteSiteClient, WorkerHandle
+
+_PATH = relay_path(0)
+_TOPIC = f"N/s1/{_PATH}"
+
+
+def _client():
+    """Client de site du processus principal, sans processus d'ingestion : les lots sont injectés à la main."""
+    pool = types.SimpleNamespace(next_sub_id=itertools.count(1).__next__)
+    worker = WorkerHandle(pool, 0)
+    sent = []
+    worker.send = sent.append
+    return RemoteSiteClient(worker, "s1", {"flush_interval": 0}), worker, sent
+
+
+def _receive(worker, topic, value):
+    """Valeur transmise par le processus d'ingestion pour tous les abonnements du topic."""
+    worker._deliver([(sub_id, None, value) for sub_id, route in worker.routes.items() if route[1] == topic])
+
+
+def test_write_of_current_value_confirmed_without_echo():
+    async def scenario():
+        client, worker, sent = _client()
+        await client.async_start()
+        received = []
+        client.commands.watch(_PATH)
+        client.add_subscription(_TOPIC, lambda topic, value: received.append(value))
+        _receive(worker, _TOPIC, 1)
+        # Venus ne republie pas une valeur inchangée : aucun écho n'arrivera
+        await client.commands.async_write(_PATH, 1, timeout=0.5)
+        assert ("publish", "s1", f"W/s1/{_PATH}", serialize_value(1), 0, False) in sent
+        assert received == [1]
+        await client.async_stop()
+
+    asyncio.run(scenario())
+
+
+def test_late_subscriber_receives_current_value():
+    async def scenario():
+        client, worker, sent = _client()
+        await client.async_start()
+        client.add_subscription(_TOPIC, lambda topic, value: None)
+        _receive(worker, _TOPIC, 1)
+        # Le suivi s'abonne après la valeur : le processus d'ingestion ne la renverra pas
+        await client.commands.async_write(_PATH, 1, timeout=0.5)
+        assert client.commands.last_value(_PATH) == 1
+        assert sum(message[0] == "sub" for message in sent) == 1  # Abonnement distant partagé
+        await client.async_stop()
+
+    asyncio.run(scenario())
+
+
+def test_write_confirmed_by_echo():
+    async def scenario():
+        client, worker, _ = _client()
+        await client.async_start()
+        client.commands.watch(_PATH)
+        _receive(worker, _TOPIC, 0)
+        write = asyncio.ensure_future(client.commands.async_write(_PATH, 1, timeout=0.5))
+        await asyncio.sleep(0)
+        assert client.commands.pending_value(_PATH) == 1
+        _receive(worker, _TOPIC, 1)
+        assert await write >= 0
+        assert client.commands.pending_value(_PATH) is None
+        assert client.metrics.command_timeouts == 0
+        await client.async_stop()
+
+    asyncio.run(scenario())
+
+
+def test_write_without_echo_times_out():
+    async def scenario():
+        client, worker, _ = _client()
+        await client.async_start()
+        client.commands.watch(_PATH)
+        _receive(worker, _TOPIC, 0)
+        with pytest.raises(asyncio.TimeoutError):
+            await client.commands.async_write(_PATH, 1, timeout=0.05)
+        assert client.metrics.command_timeouts == 1
+        assert client.commands.last_value(_PATH) == 0
+        await client.async_stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,118 @@
+import asyncio
+import json
+
+from cerbo_gx.endpoints import BrokerEndpoint, lan_endpoint
+from cerbo_gx.mqtt_client import CerboMQTTClient, ConnectionPool
+from mqtt_broker import FakeBroker
+
+
+def _value(value):
+    return json.dumps({"value": value}).encode()
+
+
+async def _wait_for(predicate, timeout=2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        assert loop.time() < deadline, "délai dépassé"
+        await asyncio.sleep(0.01)
+
+
+async def _start_site(pool, id_site, endpoint, received=None, username=None, password=None):
+    client = CerboMQTTClient(id_site, username=username, password=password, endpoints=[endpoint], pool=pool)
+    await client.async_start()
+    if received is not None:
+        client.add_subscription(f"N/{id_site}/battery/0/Soc", lambda topic, value: received.append((topic, value)))
+    await _wait_for(lambda: client.connected)
+    return client
+
+
+def test_sites_of_one_broker_share_a_connection():
+    async def scenario():
+        broker = FakeBroker()
+        await broker.start()
+        pool = ConnectionPool()
+        endpoint = lan_endpoint("127.0.0.1", broker.port)
+        received = []
+        try:
+            s1 = await _start_site(pool, "s1", endpoint, received)
+            s2 = await _start_site(pool, "s2", endpoint, received)
+            assert broker.connects == 1
+            assert list(pool.connections.values()) == [s1._connection]
+            assert s1._connection is s2._connection
+
+            # Chaque message est aiguillé vers son site
+            await _wait_for(lambda: ["N/s2/battery/0/Soc"] in [entry[1] for entry in broker.entries("subscribe")])
+            broker.publish("N/s1/battery/0/Soc", _value(80))
+            broker.publish("N/s2/battery/0/Soc", _value(60))
+            await _wait_for(lambda: len(received) == 2)
+            assert received == [("N/s1/battery/0/Soc", 80), ("N/s2/battery/0/Soc", 60)]
+
+            # Le départ d'un site ne désabonne que ses topics ; la connexion reste ouverte
+            await s1.async_stop()
+            await _wait_for(lambda: broker.entries("unsubscribe"))
+            assert broker.entries("unsubscribe") == [("unsubscribe", ["N/s1/battery/0/Soc", "N/s1/full_publish_completed"])]
+            assert len(pool.connections) == 1 and s2.connected
+
+            # Le dernier site parti, la connexion est fermée et retirée du pool
+            await s2.async_stop()
+            await _wait_for(lambda: broker.entries("disconnect"))
+            assert pool.connections == {}
+            assert broker.connects == 1
+        finally:
+            await broker.stop()
+
+    asyncio.run(scenario())
+
+
+def test_connections_are_keyed_by_credentials():
+    async def scenario():
+        broker = FakeBroker()
+        await broker.start()
+        pool = ConnectionPool()
+        endpoint = BrokerEndpoint("vrm", "127.0.0.1", broker.port, False, False, True)
+        try:
+            s1 = await _start_site(pool, "s1", endpoint, username="alice", password="secret")
+            s2 = await _start_site(pool, "s2", endpoint, username="alice", password="secret")
+            s3 = await _start_site(pool, "s3", endpoint, username="bob", password="secret")
+            assert s1._connection is s2._connection
+            assert s3._connection is not s1._connection
+            assert len(pool.connections) == 2 and broker.connects == 2
+            for client in (s1, s2, s3):
+                await client.async_stop()
+            assert pool.connections == {}
+        finally:
+            await broker.stop()
+
+    asyncio.run(scenario())
+
+
+def test_subscriptions_are_reference_counted():
+    async def scenario():
+        broker = FakeBroker()
+        await broker.start()
+        pool = ConnectionPool()
+        try:
+            site = await _start_site(pool, "s1", lan_endpoint("127.0.0.1", broker.port))
+            connection = site._connection
+            await _wait_for(lambda: broker.entries("subscribe"))
+            broker.log.clear()
+
+            # Deux références au même topic : il n'est souscrit qu'une fois
+            connection.subscribe(["N/+/system/0/Serial"])
+            connection.subscribe(["N/+/system/0/Serial", "N/+/heartbeat"])
+            connection.unsubscribe(["N/+/system/0/Serial"])
+            await _wait_for(lambda: len(broker.entries("subscribe")) == 2)
+            await asyncio.sleep(0.05)
+            assert broker.entries("subscribe") == [("subscribe", ["N/+/system/0/Serial"]), ("subscribe", ["N/+/heartbeat"])]
+            assert broker.entries("unsubscribe") == []
+
+            # UNSUBSCRIBE à la dernière référence seulement, en un seul paquet
+            connection.unsubscribe(["N/+/system/0/Serial", "N/+/heartbeat"])
+            await _wait_for(lambda: broker.entries("unsubscribe"))
+            assert broker.entries("unsubscribe") == [("unsubscribe", ["N/+/heartbeat", "N/+/system/0/Serial"])]
+        finally:
+            await site.async_stop()
+            await broker.stop()
+
+    asyncio.run(scenario())
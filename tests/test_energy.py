@@ -0,0 +1,68 @@
+import pytest
+
+from cerbo_gx.energy import EnergyIntegrator
+
+# 1 kW pendant une heure
+_KW = 1000.0
+_HOUR = 3600.0
+
+
+def test_trapezoid():
+    integrator = EnergyIntegrator(max_gap=_HOUR)
+    integrator.add(0.0, 0.0)
+    integrator.add(_HOUR, 2 * _KW)
+    assert integrator.total == pytest.approx(1.0)
+
+
+def test_first_sample_starts_segment():
+    integrator = EnergyIntegrator(total=5.0)
+    integrator.add(0.0, _KW)
+    assert integrator.total == 5.0
+
+
+def test_negative_power_counts_as_zero():
+    integrator = EnergyIntegrator(max_gap=_HOUR)
+    integrator.add(0.0, -_KW)
+    integrator.add(_HOUR, -_KW)
+    assert integrator.total == 0.0
+
+
+def test_hold_extends_last_power():
+    integrator = EnergyIntegrator(max_gap=_HOUR)
+    integrator.add(0.0, _KW)
+    integrator.hold(_HOUR / 2)
+    integrator.hold(_HOUR / 2)  # Sans effet : rien à intégrer
+    integrator.hold(_HOUR)
+    assert integrator.total == pytest.approx(1.0)
+    # Le point suivant n'intègre que depuis le dernier hold()
+    integrator.add(_HOUR + 60, _KW)
+    assert integrator.total == pytest.approx(1.0 + 60 / _HOUR)
+
+
+def test_gap_not_integrated():
+    integrator = EnergyIntegrator(max_gap=300)
+    integrator.add(0.0, _KW)
+    integrator.add(400.0, _KW)
+    assert integrator.total == 0.0
+    integrator.add(460.0, _KW)
+    assert integrator.total == pytest.approx(60 / _HOUR)
+
+
+def test_hold_past_gap_pauses():
+    integrator = EnergyIntegrator(max_gap=300)
+    integrator.add(0.0, _KW)
+    integrator.hold(400.0)
+    assert integrator.total == 0.0
+    integrator.add(410.0, _KW)
+    assert integrator.total == 0.0
+
+
+def test_pause():
+    integrator = EnergyIntegrator(max_gap=_HOUR)
+    integrator.add(0.0, _KW)
+    integrator.pause()
+    integrator.hold(60.0)
+    integrator.add(120.0, _KW)
+    assert integrator.total == 0.0
+    integrator.add(180.0, _KW)
+    assert integrator.total == pytest.approx(60 / _HOUR)
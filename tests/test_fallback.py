@@ -0,0 +1,39 @@
+import asyncio
+import socket
+
+from cerbo_gx import mqtt_client, transport
+from cerbo_gx.endpoints import lan_endpoint
+
+
+def refused_port():
+    """Port local sur lequel rien n'écoute : les connexions sont refusées aussitôt."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_unreachable_endpoints_are_retried_with_backoff(monkeypatch):
+    monkeypatch.setattr(transport, "RECONNECT_DELAY", 0.05)
+    attempts = []
+    connect_sync = mqtt_client.BrokerConnection._connect_sync
+
+    def counting_connect(connection):
+        attempts.append(connection.endpoint.port)
+        return connect_sync(connection)
+
+    monkeypatch.setattr(mqtt_client.BrokerConnection, "_connect_sync", counting_connect)
+    ports = [refused_port(), refused_port()]
+
+    async def run():
+        manager = mqtt_client.MQTTManager()
+        client = await manager.async_add_device("site", endpoints=[lan_endpoint("127.0.0.1", port) for port in ports])
+        await asyncio.sleep(1.5)
+        connected = client.connected
+        await manager.async_shutdown()
+        return connected
+
+    assert not asyncio.run(run())
+    # Les deux brokers sont essayés (repli), mais sans boucle : le backoff croît
+    # d'un broker à l'autre (0.05 s, 0.1 s, 0.2 s... au plus) au lieu de repartir de zéro
+    assert set(attempts) == set(ports)
+    assert len(attempts) < 40
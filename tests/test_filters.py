@@ -0,0 +1,174 @@
+import asyncio
+
+import pytest
+
+from cerbo_gx.filters import (
+    FILTER_ABSOLUTE,
+    FILTER_AVERAGE,
+    FILTER_INTERVAL,
+    FILTER_NONE,
+    FILTER_PERCENT,
+    FilterTicker,
+    SensorFilter,
+    filter_from_options,
+)
+
+
+def test_first_sample_always_published():
+    for mode in (FILTER_ABSOLUTE, FILTER_PERCENT, FILTER_INTERVAL, FILTER_AVERAGE):
+        assert SensorFilter(mode, threshold=1, interval=10).process(12.5, 0.0) == 12.5
+
+
+def test_absolute_deadband():
+    sensor_filter = SensorFilter(FILTER_ABSOLUTE, threshold=0.5, heartbeat=0)
+    assert sensor_filter.process(12.0, 0.0) == 12.0
+    assert sensor_filter.process(12.3, 1.0) is None
+    assert sensor_filter.process(12.4, 2.0) is None
+    # L'écart est mesuré par rapport à la dernière valeur publiée
+    assert sensor_filter.process(12.6, 3.0) == 12.6
+
+
+def test_zero_threshold_publishes_changes_only():
+    sensor_filter = SensorFilter(FILTER_ABSOLUTE, threshold=0, heartbeat=0)
+    sensor_filter.process(5, 0.0)
+    assert sensor_filter.process(5, 1.0) is None
+    assert sensor_filter.process(6, 2.0) == 6
+
+
+def test_percent_deadband():
+    sensor_filter = SensorFilter(FILTER_PERCENT, threshold=10, heartbeat=0)
+    sensor_filter.process(100.0, 0.0)
+    assert sensor_filter.process(109.0, 1.0) is None
+    assert sensor_filter.process(111.0, 2.0) == 111.0
+
+
+def test_interval():
+    sensor_filter = SensorFilter(FILTER_INTERVAL, interval=10, heartbeat=0)
+    sensor_filter.process(1, 0.0)
+    assert sensor_filter.process(2, 5.0) is None
+    assert sensor_filter.process(3, 10.0) == 3
+
+
+def test_average_window_closed_by_sample():
+    sensor_filter = SensorFilter(FILTER_AVERAGE, interval=10, heartbeat=0)
+    sensor_filter.process(0, 0.0)
+    assert sensor_filter.process(10, 1.0) is None
+    assert sensor_filter.process(20, 5.0) is None
+    assert sensor_filter.process(30, 11.0) == pytest.approx(20.0)
+
+
+def test_average_heartbeat_publishes_window_mean():
+    sensor_filter = SensorFilter(FILTER_AVERAGE, interval=1000, heartbeat=60)
+    sensor_filter.process(0, 0.0)
+    assert sensor_filter.process(10, 10.0) is None
+    assert sensor_filter.process(20, 20.0) is None
+    # Le heartbeat publie la moyenne de la fenêtre, échantillon courant compris
+    assert sensor_filter.process(30, 60.0) == pytest.approx(20.0)
+
+
+def test_non_numeric_published_on_change_only():
+    sensor_filter = SensorFilter(FILTER_ABSOLUTE, threshold=100)
+    sensor_filter.process("Bulk", 0.0)
+    assert sensor_filter.process("Bulk", 1.0) is None
+    assert sensor_filter.process("Float", 2.0) == "Float"
+
+
+def test_heartbeat_on_sample():
+    sensor_filter = SensorFilter(FILTER_ABSOLUTE, threshold=10, heartbeat=60)
+    sensor_filter.process(1.0, 0.0)
+    assert sensor_filter.process(1.5, 30.0) is None
+    assert sensor_filter.process(1.6, 60.0) == 1.6
+
+
+def test_flush_publishes_absorbed_value_at_heartbeat():
+    # Venus ne republie pas une valeur inchangée : la dernière valeur absorbée
+    # doit sortir au heartbeat sans nouvel échantillon
+    sensor_filter = SensorFilter(FILTER_ABSOLUTE, threshold=10, heartbeat=60)
+    sensor_filter.process(1.0, 0.0)
+    assert sensor_filter.process(1.5, 5.0) is None
+    assert sensor_filter.flush(59.0) is None
+    assert sensor_filter.flush(60.0) == 1.5
+    # Le heartbeat repart de cette publication
+    assert sensor_filter.flush(61.0) is None
+    assert sensor_filter.flush(120.0) == 1.5
+
+
+def test_flush_closes_average_window():
+    sensor_filter = SensorFilter(FILTER_AVERAGE, interval=10, heartbeat=0)
+    sensor_filter.process(0, 0.0)
+    sensor_filter.process(10, 1.0)
+    sensor_filter.process(20, 2.0)
+    assert sensor_filter.flush(5.0) is None
+    assert sensor_filter.flush(11.0) == pytest.approx(15.0)
+    # Fenêtre vide : rien à publier
+    assert sensor_filter.flush(30.0) is None
+
+
+def test_flush_heartbeat_uses_open_window_mean():
+    sensor_filter = SensorFilter(FILTER_AVERAGE, interval=100, heartbeat=60)
+    sensor_filter.process(0, 0.0)
+    sensor_filter.process(4, 50.0)
+    sensor_filter.process(8, 55.0)
+    assert sensor_filter.flush(60.0) == pytest.approx(6.0)
+
+
+def test_flush_publishes_absorbed_sample_at_interval_end():
+    sensor_filter = SensorFilter(FILTER_INTERVAL, interval=10, heartbeat=0)
+    sensor_filter.process(1, 0.0)
+    assert sensor_filter.process(2, 1.0) is None
+    assert sensor_filter.flush(9.0) is None
+    assert sensor_filter.flush(10.0) == 2
+    # Échantillon déjà publié : rien de plus jusqu'au suivant
+    assert sensor_filter.flush(30.0) is None
+
+
+def test_flush_before_first_sample():
+    assert SensorFilter(FILTER_ABSOLUTE, heartbeat=1).flush(1000.0) is None
+
+
+def test_heartbeat_disabled():
+    sensor_filter = SensorFilter(FILTER_ABSOLUTE, threshold=10, heartbeat=0)
+    sensor_filter.process(1.0, 0.0)
+    sensor_filter.process(2.0, 1.0)
+    assert sensor_filter.flush(10_000.0) is None
+
+
+def test_filter_from_options():
+    assert filter_from_options({}, "power") is None
+    assert filter_from_options({"power_filter_mode": FILTER_NONE}, "power") is None
+    assert filter_from_options({"power_filter_mode": FILTER_ABSOLUTE}, "temperature") is None
+    sensor_filter = filter_from_options(
+        {"power_filter_mode": FILTER_ABSOLUTE, "power_filter_threshold": 5, "filter_heartbeat": 120}, "power"
+    )
+    assert (sensor_filter.mode, sensor_filter.threshold, sensor_filter.heartbeat) == (FILTER_ABSOLUTE, 5, 120)
+
+
+class _FilteredSensor:
+    entity_id = "sensor.test"
+
+    def __init__(self):
+        self.ticks = []
+
+    def flush_filter(self, now):
+        self.ticks.append(now)
+
+
+def test_ticker_drives_all_sensors_from_one_timer():
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        ticker = FilterTicker(loop, interval=0.01)
+        first, second = _FilteredSensor(), _FilteredSensor()
+        ticker.add(first)
+        handle = ticker._handle
+        ticker.add(second)
+        assert ticker._handle is handle  # Une seule minuterie pour tous les capteurs
+        await asyncio.sleep(0.05)
+        assert first.ticks and len(first.ticks) == len(second.ticks)
+        ticker.discard(first)
+        ticker.discard(second)
+        assert ticker._handle is None
+        count = len(second.ticks)
+        await asyncio.sleep(0.03)
+        assert len(second.ticks) == count
+
+    asyncio.run(scenario())
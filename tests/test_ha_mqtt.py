@@ -0,0 +1,159 @@
+import asyncio
+import json
+from functools import partial
+from types import SimpleNamespace
+
+import pytest
+from homeassistant.components import mqtt
+from paho.mqtt.client import topic_matches_sub
+
+from cerbo_gx.commands import relay_path
+from cerbo_gx.ha_mqtt import HAMQTTSiteClient
+from cerbo_gx.mqtt_client import MQTTManager
+from cerbo_gx.transport import TRANSPORT_HA_MQTT
+
+
+class FakeHAMQTT:
+    """Intégration MQTT de Home Assistant réduite à ses fonctions publiques, avec un GX en écho.
+
+    Comme Home Assistant, chaque abonnement correspondant à un message est
+    rappelé avec son propre `subscribed_topic`. Une écriture `W/...` publiée
+    est renvoyée sur `N/...`, comme le fait Venus.
+    """
+
+    def __init__(self):
+        self.connected = False
+        self.subscriptions = {}  # topic -> [callbacks]
+        self.published = []
+        self.status_callbacks = []
+        self.subscribe_gate = None  # Si défini, les souscriptions attendent cet événement
+
+    def install(self, monkeypatch):
+        monkeypatch.setattr(mqtt, "async_subscribe", self.async_subscribe)
+        monkeypatch.setattr(mqtt, "async_publish", self.async_publish)
+        monkeypatch.setattr(mqtt, "is_connected", lambda hass: self.connected)
+        monkeypatch.setattr(mqtt, "async_subscribe_connection_status", self.async_subscribe_connection_status)
+
+    async def async_subscribe(self, hass, topic, msg_callback, qos=0, encoding="utf-8"):
+        if self.subscribe_gate is not None:
+            await self.subscribe_gate.wait()
+        callbacks = self.subscriptions.setdefault(topic, [])
+        callbacks.append(msg_callback)
+        return partial(callbacks.remove, msg_callback)
+
+    async def async_publish(self, hass, topic, payload, qos=0, retain=False, encoding="utf-8"):
+        self.published.append((topic, payload))
+        if topic.startswith("W/"):
+            self.receive("N/" + topic[2:], payload)
+
+    def async_subscribe_connection_status(self, hass, connection_status_callback):
+        self.status_callbacks.append(connection_status_callback)
+        return partial(self.status_callbacks.remove, connection_status_callback)
+
+    def receive(self, topic, payload):
+        for subscribed, callbacks in list(self.subscriptions.items()):
+            if topic_matches_sub(subscribed, topic):
+                message = SimpleNamespace(topic=topic, payload=payload, subscribed_topic=subscribed, qos=0, retain=False)
+                for msg_callback in list(callbacks):
+                    msg_callback(message)
+
+    def set_connected(self, connected):
+        self.connected = connected
+        for connection_status_callback in list(self.status_callbacks):
+            connection_status_callback(connected)
+
+    def active_topics(self):
+        return sorted(topic for topic, callbacks in self.subscriptions.items() if callbacks)
+
+
+class FakeHass:
+    def async_create_task(self, target, name=None, eager_start=True):
+        return asyncio.get_running_loop().create_task(target)
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    fake = FakeHAMQTT()
+    fake.install(monkeypatch)
+    return fake
+
+
+def _value(value):
+    return json.dumps({"value": value}).encode()
+
+
+async def _add_site(manager, id_site):
+    return await manager.async_add_device(id_site, transport=TRANSPORT_HA_MQTT, factory=partial(HAMQTTSiteClient, FakeHass()))
+
+
+def test_overlapping_subscriptions_from_two_sites(broker):
+    async def scenario():
+        manager = MQTTManager()
+        received = {"s1": [], "s2": []}
+        clients = {}
+        for id_site in ("s1", "s2"):
+            client = clients[id_site] = await _add_site(manager, id_site)
+            callback = partial(lambda site, topic, value: received[site].append((topic, value)), id_site)
+            # Trois abonnements du même site couvrent N/{id}/battery/0/Soc
+            client.add_subscription(f"N/{id_site}/battery/0/Soc", callback)
+            client.add_subscription(f"N/{id_site}/battery/+/Soc", callback)
+            client.add_subscription(f"N/{id_site}/battery/#", callback, raw=True)
+        await asyncio.sleep(0.05)
+        # Seul le joker qui couvre les deux autres est souscrit
+        assert broker.active_topics() == [
+            "N/s1/battery/#", "N/s1/full_publish_completed", "N/s2/battery/#", "N/s2/full_publish_completed",
+        ]
+
+        broker.set_connected(True)
+        await asyncio.sleep(0.01)
+        assert any(topic == "R/s1/keepalive" for topic, _ in broker.published)
+
+        # Chaque callback du site reçoit le message une fois, quel que soit le nombre d'abonnements HA qui le couvrent
+        broker.receive("N/s1/battery/0/Soc", _value(80))
+        assert sorted(received["s1"], key=repr) == sorted([
+            ("N/s1/battery/0/Soc", 80),
+            ("N/s1/battery/0/Soc", 80),
+            ("N/s1/battery/0/Soc", _value(80)),
+        ], key=repr)
+        assert received["s2"] == []
+        assert clients["s1"].metrics.messages == 1
+
+        # Message couvert seulement par les jokers
+        received["s1"].clear()
+        broker.receive("N/s1/battery/1/Soc", _value(70))
+        assert sorted(received["s1"], key=repr) == sorted([
+            ("N/s1/battery/1/Soc", 70),
+            ("N/s1/battery/1/Soc", _value(70)),
+        ], key=repr)
+
+        # Le départ d'un site ne retire pas les abonnements de l'autre
+        await manager.async_remove_device("s1")
+        await asyncio.sleep(0.01)
+        assert not any(topic.startswith("N/s1/") for topic in broker.active_topics())
+        broker.receive("N/s2/battery/0/Soc", _value(60))
+        assert ("N/s2/battery/0/Soc", 60) in received["s2"]
+
+        await manager.async_shutdown()
+        assert broker.active_topics() == []
+        assert broker.status_callbacks == []
+
+    asyncio.run(scenario())
+
+
+def test_publish_waits_for_pending_subscription(broker):
+    async def scenario():
+        broker.connected = True
+        broker.subscribe_gate = asyncio.Event()
+        manager = MQTTManager()
+        client = await _add_site(manager, "s1")
+        write = asyncio.ensure_future(client.commands.async_write(relay_path(0), 1, timeout=1.0))
+        await asyncio.sleep(0.05)
+        # L'écho N/ n'est pas encore souscrit : l'écriture W/ est retenue
+        assert not any(topic.startswith("W/") for topic, _ in broker.published)
+        broker.subscribe_gate.set()
+        assert await write >= 0
+        assert (f"W/s1/{relay_path(0)}", _value(1)) in broker.published
+        assert client.commands.last_value(relay_path(0)) == 1
+        await manager.async_shutdown()
+
+    asyncio.run(scenario())
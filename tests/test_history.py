@@ -0,0 +1,63 @@
+import math
+
+import pytest
+
+from cerbo_gx.history import RollingWindow, history_from_options
+
+
+def test_empty_window():
+    window = RollingWindow(60, capacity=10)
+    assert len(window) == 0
+    assert window.stats(0.0) is None
+    assert list(window.values()) == []
+
+
+def test_stats():
+    window = RollingWindow(60, capacity=10)
+    for now, value in ((0.0, 2.0), (10.0, 4.0), (20.0, 6.0)):
+        assert window.add(now, value)
+    stats = window.stats(20.0)
+    assert stats["min"] == 2.0
+    assert stats["max"] == 6.0
+    assert stats["mean"] == pytest.approx(4.0)
+    assert stats["stddev"] == pytest.approx(math.sqrt(8 / 3))
+    assert stats["samples"] == 3
+
+
+def test_samples_closer_than_resolution_ignored():
+    window = RollingWindow(60, capacity=10)  # Un échantillon toutes les 6 s au plus
+    assert window.add(0.0, 1.0)
+    assert not window.add(5.0, 2.0)
+    assert window.add(6.0, 3.0)
+    assert list(window.values()) == [1.0, 3.0]
+
+
+def test_expiry_rescans_extremes():
+    window = RollingWindow(60, capacity=10)
+    window.add(0.0, 10.0)
+    window.add(30.0, 5.0)
+    window.add(50.0, 7.0)
+    # Le maximum (10) expire : min et max sont recalculés sur la fenêtre restante
+    stats = window.stats(70.0)
+    assert stats["samples"] == 2
+    assert stats["min"] == 5.0
+    assert stats["max"] == 7.0
+    assert stats["mean"] == pytest.approx(6.0)
+    assert window.stats(200.0) is None
+    assert len(window) == 0
+
+
+def test_full_buffer_evicts_oldest():
+    window = RollingWindow(100, capacity=4)
+    for index in range(6):
+        window.add(index * 25.0, float(index))
+    # Tampon plein : l'échantillon le plus ancien cède sa place, même s'il n'a pas expiré
+    assert list(window.values()) == [2.0, 3.0, 4.0, 5.0]
+    assert window.stats(125.0)["min"] == 2.0
+
+
+def test_history_from_options():
+    assert history_from_options({}, "power") is None
+    assert history_from_options({"history_window": 10}, "temperature") is None
+    window = history_from_options({"history_window": 10}, "power")
+    assert window.window == 600
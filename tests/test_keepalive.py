@@ -0,0 +1,84 @@
+from cerbo_gx.mqtt_client import KEEPALIVE_INTERVAL_SYNC, KEEPALIVE_JITTER, KeepaliveScheduler
+
+
+class FakeSite:
+    """Site réduit à l'interface du planificateur ; journalise les instants d'envoi."""
+
+    def __init__(self, id_site, interval=KEEPALIVE_INTERVAL_SYNC, connected=True):
+        self.id_site = id_site
+        self.interval = interval
+        self.connected = connected
+        self.sent = []
+        self.clock = None
+
+    def keepalive_interval(self):
+        return self.interval
+
+    def send_keepalive(self):
+        self.sent.append(self.clock())
+
+
+def _run(scheduler, sites, start, end, step=0.1):
+    """Fait avancer l'horloge de `start` à `end` par pas de `step`, comme le moteur d'E/S."""
+    now = start
+    clock = lambda: now  # noqa: E731
+    for site in sites:
+        site.clock = clock
+    while now <= end:
+        scheduler.run_due(now)
+        now = round(now + step, 6)
+
+
+def test_first_keepalives_are_spread_then_jittered():
+    scheduler = KeepaliveScheduler()
+    sites = [FakeSite(f"s{index}", interval=45) for index in range(20)]
+    for site in sites:
+        scheduler.add(site, 0)
+    _run(scheduler, sites, 0, 400)
+
+    first = [site.sent[0] for site in sites]
+    assert all(0 <= sent <= KEEPALIVE_INTERVAL_SYNC + 0.1 for sent in first)
+    assert len(set(first)) > 1  # Premiers envois étalés, pas tous au même instant
+    for site in sites:
+        gaps = [later - earlier for earlier, later in zip(site.sent, site.sent[1:])]
+        assert gaps and all(45 * (1 - KEEPALIVE_JITTER) <= gap <= 45 * (1 + KEEPALIVE_JITTER) + 0.1 for gap in gaps)
+    assert len({round(site.sent[-1], 1) for site in sites}) > 1
+
+
+def test_due_keepalives_are_sent_in_order():
+    scheduler = KeepaliveScheduler()
+    sites = [FakeSite(f"s{index}") for index in range(10)]
+    for site in sites:
+        scheduler.add(site, 0)
+    order = []
+    for site in sites:
+        site.send_keepalive = lambda site=site: order.append(site)
+    due = dict(scheduler._due)
+    # Une seule échéance dépassée pour tous : chaque site reçoit un keep-alive, le plus en retard d'abord
+    scheduler.run_due(KEEPALIVE_INTERVAL_SYNC)
+    assert order == sorted(sites, key=due.get)
+    assert all(scheduler._due[site] > KEEPALIVE_INTERVAL_SYNC for site in sites)
+
+
+def test_keepalives_skip_idle_and_removed_sites():
+    scheduler = KeepaliveScheduler()
+    active = FakeSite("active")
+    offline = FakeSite("offline", connected=False)
+    idle = FakeSite("idle", interval=None)
+    removed = FakeSite("removed")
+    sites = [active, offline, idle, removed]
+    for site in sites:
+        scheduler.add(site, 0)
+    scheduler.remove(removed)
+    _run(scheduler, sites, 0, 200, step=1)
+
+    assert len(active.sent) >= 5
+    assert offline.sent == idle.sent == removed.sent == []
+    assert removed not in scheduler._due
+
+    # Les sites ignorés restent planifiés : ils repartent dès qu'ils redeviennent actifs
+    offline.connected = True
+    idle.interval = KEEPALIVE_INTERVAL_SYNC
+    _run(scheduler, sites, 201, 201 + KEEPALIVE_INTERVAL_SYNC * (1 + KEEPALIVE_JITTER) + 1, step=1)
+    assert offline.sent and idle.sent
+    assert removed.sent == []
@@ -0,0 +1,239 @@
+import asyncio
+import struct
+
+import pytest
+
+from cerbo_gx import modbus
+from cerbo_gx.commands import relay_path
+from cerbo_gx.endpoints import modbus_endpoint
+from cerbo_gx.modbus import (
+    ILLEGAL_DATA_ADDRESS,
+    MODBUS_REGISTERS,
+    SYSTEM_UNIT,
+    ModbusError,
+    ModbusSiteClient,
+    ModbusTCPConnection,
+    decode_register,
+    encode_register,
+    plan_reads,
+)
+
+
+class FakeGX:
+    """Serveur Modbus-TCP minimal (fonctions 3 et 6) tenant une table de registres.
+
+    Une lecture couvrant un registre absent de la table reçoit l'exception
+    ILLEGAL_DATA_ADDRESS, comme sur un GX dont la liste de registres a des trous.
+    """
+
+    def __init__(self, registers):
+        self.registers = dict(registers)
+        self.requests = []
+        self.stale_response = False  # Réponse d'une transaction précédente envoyée avant la bonne
+        self.silent = False  # Requêtes lues mais laissées sans réponse
+        self.port = None
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                transaction, _, length, unit = struct.unpack(">HHHB", await reader.readexactly(7))
+                pdu = await reader.readexactly(length - 1)
+                function, address, operand = struct.unpack(">BHH", pdu)
+                self.requests.append((function, unit, address, operand))
+                if self.silent:
+                    continue
+                if function == 3:
+                    addresses = range(address, address + operand)
+                    if all(a in self.registers for a in addresses):
+                        body = bytes([3, 2 * operand]) + b"".join(struct.pack(">H", self.registers[a]) for a in addresses)
+                    else:
+                        body = bytes([0x83, ILLEGAL_DATA_ADDRESS])
+                else:
+                    self.registers[address] = operand
+                    body = pdu
+                if self.stale_response:
+                    writer.write(struct.pack(">HHHB", transaction - 1, 0, 3, unit) + bytes([0x83, 4]))
+                writer.write(struct.pack(">HHHB", transaction, 0, len(body) + 1, unit) + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+_GX_REGISTERS = {806: 0, 807: 0, 840: 532, 841: -35 & 0xFFFF, 842: -186 & 0xFFFF, 843: 87, 850: 1200, 860: 300}
+
+
+@pytest.fixture
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(modbus, "POLL_INTERVAL_MIN", 0.02)
+    monkeypatch.setattr(modbus, "POLL_INTERVAL_MAX", 0.1)
+
+
+def test_plan_reads_merges_close_registers():
+    assert plan_reads([(100, 843), (100, 840), (100, 850), (100, 840)]) == [(100, 840, 11)]
+    assert plan_reads([(100, 840), (100, 850)], max_gap=0) == [(100, 840, 1), (100, 850, 1)]
+    assert plan_reads([]) == []
+
+
+def test_plan_reads_splits():
+    # Trou trop grand, changement d'unité, bloc plafonné à max_count registres
+    assert plan_reads([(100, 806), (100, 840)]) == [(100, 806, 1), (100, 840, 1)]
+    assert plan_reads([(100, 840), (225, 841)]) == [(100, 840, 1), (225, 841, 1)]
+    assert plan_reads([(1, address) for address in range(0, 10, 2)], max_count=5) == [(1, 0, 5), (1, 6, 3)]
+
+
+def test_register_codec():
+    current = MODBUS_REGISTERS["system/0/Dc/Battery/Current"]
+    assert decode_register(current, -35 & 0xFFFF) == -3.5
+    assert encode_register(current, -3.5) == -35 & 0xFFFF
+    relay = MODBUS_REGISTERS[relay_path(0)]
+    assert decode_register(relay, 1) == 1
+    assert isinstance(decode_register(relay, 1), int)
+
+
+def test_request_response_framing():
+    async def scenario():
+        gx = FakeGX(_GX_REGISTERS)
+        await gx.start()
+        connection = ModbusTCPConnection("127.0.0.1", gx.port, timeout=1.0)
+        await connection.async_connect()
+        try:
+            assert await connection.read_registers(SYSTEM_UNIT, 840, 4) == (532, -35 & 0xFFFF, -186 & 0xFFFF, 87)
+            await connection.write_register(SYSTEM_UNIT, 806, 1)
+            assert gx.registers[806] == 1
+            assert gx.requests == [(3, SYSTEM_UNIT, 840, 4), (6, SYSTEM_UNIT, 806, 1)]
+            with pytest.raises(ModbusError) as error:
+                await connection.read_registers(SYSTEM_UNIT, 900, 2)
+            assert (error.value.function, error.value.code) == (3, ILLEGAL_DATA_ADDRESS)
+            # La réponse d'une transaction précédente est ignorée
+            gx.stale_response = True
+            assert await connection.read_registers(SYSTEM_UNIT, 843, 1) == (87,)
+        finally:
+            connection.close()
+            await gx.stop()
+        with pytest.raises(ConnectionError):
+            await connection.read_registers(SYSTEM_UNIT, 840, 1)
+
+    asyncio.run(scenario())
+
+
+def test_request_timeout_closes_connection():
+    async def scenario():
+        gx = FakeGX(_GX_REGISTERS)
+        gx.silent = True
+        await gx.start()
+        connection = ModbusTCPConnection("127.0.0.1", gx.port, timeout=0.1)
+        await connection.async_connect()
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await connection.read_registers(SYSTEM_UNIT, 840, 4)
+            # Une réponse tardive désalignerait le flux : la connexion n'est pas réutilisée
+            assert not connection.connected
+            with pytest.raises(ConnectionError):
+                await connection.read_registers(SYSTEM_UNIT, 840, 4)
+        finally:
+            connection.close()
+            await gx.stop()
+
+    asyncio.run(scenario())
+
+
+async def _wait_for(predicate, timeout=2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        assert loop.time() < deadline, "délai dépassé"
+        await asyncio.sleep(0.01)
+
+
+def test_polling_and_relay_write(fast_polling):
+    async def scenario():
+        gx = FakeGX(_GX_REGISTERS)
+        await gx.start()
+        client = ModbusSiteClient("s1", endpoints=[modbus_endpoint("127.0.0.1", gx.port)])
+        received = []
+        for path in ("system/0/Dc/Battery/Voltage", "system/0/Dc/Battery/Current", "system/0/Dc/Battery/Soc"):
+            client.add_subscription(f"N/s1/{path}", lambda topic, value: received.append((topic[5:], value)))
+        client.add_subscription("N/s1/system/0/Dc/+/Power", lambda topic, value: None)
+        await client.async_start()
+        try:
+            await _wait_for(lambda: len(received) == 3)
+            assert sorted(received) == [
+                ("system/0/Dc/Battery/Current", -3.5),
+                ("system/0/Dc/Battery/Soc", 87),
+                ("system/0/Dc/Battery/Voltage", 53.2),
+            ]
+            diagnostics = client.diagnostics()["client"]
+            assert diagnostics["reads"] == [[SYSTEM_UNIT, 840, 4]]
+            assert diagnostics["unmapped_topics"] == ["N/s1/system/0/Dc/+/Power"]
+            assert client.connected and client.full_sync_done
+
+            # Seules les valeurs modifiées sont distribuées
+            gx.registers[843] = 88
+            await _wait_for(lambda: len(received) == 4)
+            assert received[-1] == ("system/0/Dc/Battery/Soc", 88)
+
+            # Écriture d'un relais confirmée par la lecture qui la suit
+            client.commands.watch(relay_path(0))
+            await _wait_for(lambda: client.commands.last_value(relay_path(0)) == 0)
+            assert await client.commands.async_write(relay_path(0), 1, timeout=1.0) >= 0
+            assert gx.registers[806] == 1
+            assert (6, SYSTEM_UNIT, 806, 1) in gx.requests
+        finally:
+            await client.async_stop()
+            await gx.stop()
+
+    asyncio.run(scenario())
+
+
+def test_pending_writes_are_tracked_until_stop(fast_polling):
+    async def scenario():
+        gx = FakeGX(_GX_REGISTERS)
+        await gx.start()
+        client = ModbusSiteClient("s1", endpoints=[modbus_endpoint("127.0.0.1", gx.port)])
+        await client.async_start()
+        try:
+            await _wait_for(lambda: client.connected)
+            gx.silent = True
+            client.publish(f"W/s1/{relay_path(0)}", '{"value": 1}')
+            assert len(client._writes) == 1
+            await _wait_for(lambda: (6, SYSTEM_UNIT, 806, 1) in gx.requests)
+        finally:
+            await client.async_stop()
+            await gx.stop()
+        # L'écriture sans réponse est annulée à l'arrêt, puis oubliée
+        assert not client._writes
+
+    asyncio.run(scenario())
+
+
+def test_illegal_address_limits_reads_to_subscribed_registers(fast_polling):
+    async def scenario():
+        registers = {address: value for address, value in _GX_REGISTERS.items() if address not in (841, 842)}
+        gx = FakeGX(registers)
+        await gx.start()
+        client = ModbusSiteClient("s1", endpoints=[modbus_endpoint("127.0.0.1", gx.port)])
+        received = {}
+        for path in ("system/0/Dc/Battery/Voltage", "system/0/Dc/Battery/Soc"):
+            client.add_subscription(f"N/s1/{path}", lambda topic, value: received.__setitem__(topic[5:], value))
+        await client.async_start()
+        try:
+            await _wait_for(lambda: len(received) == 2)
+            assert received == {"system/0/Dc/Battery/Voltage": 53.2, "system/0/Dc/Battery/Soc": 87}
+            assert client.diagnostics()["client"]["reads"] == [[SYSTEM_UNIT, 840, 1], [SYSTEM_UNIT, 843, 1]]
+            assert (3, SYSTEM_UNIT, 840, 4) in gx.requests
+        finally:
+            await client.async_stop()
+            await gx.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,63 @@
+import asyncio
+import json
+import shutil
+import ssl
+import subprocess
+
+import pytest
+
+from cerbo_gx.endpoints import lan_endpoint
+from cerbo_gx.mqtt_client import MQTTManager
+from mqtt_broker import FakeBroker, publish_packet
+
+_MESSAGES = 50
+
+
+def _broker(ssl_context=None):
+    """Broker qui envoie `_MESSAGES` PUBLISH avec le CONNACK, en une seule écriture."""
+    burst = b"".join(publish_packet(f"N/s1/battery/{index}/Soc", json.dumps({"value": index}).encode()) for index in range(_MESSAGES))
+    return FakeBroker(ssl_context, burst=burst)
+
+
+@pytest.fixture
+def server_ssl_context(tmp_path):
+    """Contexte TLS serveur avec un certificat auto-signé, comme le broker local du GX."""
+    if shutil.which("openssl") is None:
+        pytest.skip("openssl est requis pour générer le certificat de test")
+    cert, key = tmp_path / "broker.crt", tmp_path / "broker.key"
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=127.0.0.1",
+         "-keyout", str(key), "-out", str(cert)],
+        check=True, capture_output=True,
+    )
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    return context
+
+
+async def _receive_burst(broker, tls):
+    await broker.start()
+    manager = MQTTManager()
+    received = []
+    try:
+        client = await manager.async_add_device("s1", endpoints=[lan_endpoint("127.0.0.1", broker.port, tls=tls)])
+        client.add_subscription("N/s1/battery/+/Soc", lambda topic, value: received.append(value))
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + 5
+        while len(received) < _MESSAGES and loop.time() < deadline:
+            await asyncio.sleep(0.02)
+    finally:
+        await manager.async_shutdown()
+        await broker.stop()
+    return received
+
+
+def test_burst_received_over_tcp():
+    received = asyncio.run(_receive_burst(_broker(), tls=False))
+    assert received == list(range(_MESSAGES))
+
+
+def test_burst_received_over_tls(server_ssl_context):
+    # Les paquets déjà déchiffrés restent dans le SSLSocket : ils doivent être lus sans nouvel événement du descripteur
+    received = asyncio.run(_receive_burst(_broker(server_ssl_context), tls=True))
+    assert received == list(range(_MESSAGES))
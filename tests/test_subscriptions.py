@@ -0,0 +1,187 @@
+import asyncio
+import json
+from collections import namedtuple
+
+from cerbo_gx.discovery import SiteDiscovery
+from cerbo_gx.endpoints import lan_endpoint
+from cerbo_gx.mqtt_client import CerboMQTTClient
+
+Description = namedtuple("Description", ["key", "topic"])
+
+_DESCRIPTIONS = (
+    Description("battery_soc", "battery/+/Soc"),
+    Description("battery_voltage", "battery/+/Dc/0/Voltage"),
+)
+
+
+class RecordingConnection:
+    """Connexion partagée réduite à son interface vis-à-vis d'un site ; journalise les paquets envoyés."""
+
+    def __init__(self):
+        self.connected = True
+        self.sites = {}
+        self.handshake_time = None
+        self.session_reused = False
+        self.log = []  # ("subscribe" | "unsubscribe", topics triés) ou ("publish", topic, payload)
+        self.topics = set()
+
+    def subscribe(self, topics):
+        self.topics.update(topics)
+        self.log.append(("subscribe", sorted(topics)))
+
+    def unsubscribe(self, topics):
+        self.topics.difference_update(topics)
+        self.log.append(("unsubscribe", sorted(topics)))
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.log.append(("publish", topic, payload))
+
+
+class RecordingPool:
+    def __init__(self):
+        self.connection = RecordingConnection()
+
+    def acquire(self, site, endpoint, failures=0):
+        self.connection.sites[site.id_site] = site
+        self.connection.subscribe(site.subscribed_topics())
+        return self.connection
+
+    def release(self, site, connection):
+        connection.sites.pop(site.id_site, None)
+        connection.unsubscribe(site.subscribed_topics())
+
+
+def _value(value):
+    return json.dumps({"value": value}).encode()
+
+
+async def _started_client():
+    pool = RecordingPool()
+    client = CerboMQTTClient("s1", endpoints=[lan_endpoint("gx.local")], pool=pool)
+    await client.async_start()
+    return client, pool.connection
+
+
+def test_topics_covered_by_a_wildcard_are_not_subscribed():
+    async def scenario():
+        client, connection = await _started_client()
+        received = []
+        callback = lambda topic, value: received.append(value)  # noqa: E731
+        client.add_subscription("N/s1/battery/0/Soc", callback)
+        client.add_subscription("N/s1/battery/+/Soc", callback)
+        client.add_subscription("N/s1/battery/#", callback)
+        await asyncio.sleep(0)
+        assert connection.topics == {"N/s1/battery/#", "N/s1/full_publish_completed"}
+
+        # Un seul exemplaire reçu du broker ; chaque abonné est appelé une fois
+        client.on_message("N/s1/battery/0/Soc", _value(80))
+        assert received == [80, 80, 80]
+
+        # Le joker retiré, les topics qu'il couvrait sont souscrits dans le même tour de boucle
+        client.remove_subscription("N/s1/battery/#", callback)
+        await asyncio.sleep(0)
+        assert connection.topics == {"N/s1/battery/+/Soc", "N/s1/full_publish_completed"}
+        client.remove_subscription("N/s1/battery/+/Soc", callback)
+        await asyncio.sleep(0)
+        assert connection.topics == {"N/s1/battery/0/Soc", "N/s1/full_publish_completed"}
+        await client.async_stop()
+
+    asyncio.run(scenario())
+
+
+def test_discovery_wildcards_only_during_full_publish():
+    async def scenario():
+        client, connection = await _started_client()
+        discovery = SiteDiscovery(client, _DESCRIPTIONS)
+        discovered = []
+        discovery.set_listener(lambda topic, description, value: discovered.append((topic, value)))
+        discovery.start()
+        sensor = lambda topic, value: None  # noqa: E731
+        client.add_subscription("N/s1/battery/0/Soc", sensor)  # Entité restaurée d'un instantané
+        await asyncio.sleep(0)
+        assert connection.topics == {"N/s1/battery/+/Soc", "N/s1/battery/+/Dc/0/Voltage", "N/s1/full_publish_completed"}
+
+        client.on_connected()
+        client.on_message("N/s1/battery/0/Soc", _value(80))
+        client.on_message("N/s1/battery/1/Soc", _value(60))
+        assert discovered == [("N/s1/battery/0/Soc", 80), ("N/s1/battery/1/Soc", 60)]
+
+        # Publication complète terminée : seuls les topics des entités restent souscrits
+        client.on_message("N/s1/full_publish_completed", _value(1))
+        assert client.full_sync_done
+        await asyncio.sleep(0)
+        assert connection.topics == {"N/s1/battery/0/Soc", "N/s1/full_publish_completed"}
+
+        # Entité désactivée : son topic n'est plus transmis par le broker
+        client.remove_subscription("N/s1/battery/0/Soc", sensor)
+        await asyncio.sleep(0)
+        assert connection.topics == {"N/s1/full_publish_completed"}
+
+        # Nouvelle session : les motifs sont souscrits avant le keep-alive qui demande la publication complète
+        connection.log.clear()
+        client.on_connected()
+        subscribe = connection.log.index(("subscribe", ["N/s1/battery/+/Dc/0/Voltage", "N/s1/battery/+/Soc"]))
+        keepalive = connection.log.index(("publish", "R/s1/keepalive", ""))
+        assert subscribe < keepalive
+
+        discovery.stop()
+        await asyncio.sleep(0)
+        assert connection.topics == {"N/s1/full_publish_completed"}
+        await client.async_stop()
+
+    asyncio.run(scenario())
+
+
+def test_topics_added_after_full_sync_are_read():
+    async def scenario():
+        client, connection = await _started_client()
+        client.add_subscription("N/s1/system/0/Dc/Battery/Soc", lambda topic, value: None)
+        await asyncio.sleep(0)
+        client.on_connected()
+        assert ("publish", "R/s1/keepalive", "") in connection.log
+        assert not any(entry[1].startswith("R/s1/system") for entry in connection.log if entry[0] == "publish")
+        client.on_message("N/s1/full_publish_completed", _value(1))
+
+        # Entité réactivée après la synchronisation : Venus ne republiera pas sa valeur d'elle-même
+        connection.log.clear()
+        client.add_subscription("N/s1/system/0/Relay/0/State", lambda topic, value: None)
+        client.add_subscription("N/s1/battery/+/Soc", lambda topic, value: None)
+        await asyncio.sleep(0)
+        assert connection.log == [
+            ("subscribe", ["N/s1/battery/+/Soc", "N/s1/system/0/Relay/0/State"]),
+            ("publish", "R/s1/system/0/Relay/0/State", ""),
+        ]
+        await client.async_stop()
+
+    asyncio.run(scenario())
+
+
+def test_subscription_changes_of_one_loop_iteration_are_batched():
+    async def scenario():
+        client, connection = await _started_client()
+        callback = lambda topic, value: None  # noqa: E731
+        connection.log.clear()
+        for index in range(3):
+            client.add_subscription(f"N/s1/battery/{index}/Soc", callback)
+        assert connection.log == []  # Rien n'est envoyé avant le prochain tour de boucle
+        await asyncio.sleep(0)
+        assert connection.log == [("subscribe", ["N/s1/battery/0/Soc", "N/s1/battery/1/Soc", "N/s1/battery/2/Soc"])]
+
+        # Retraits groupés en un seul UNSUBSCRIBE ; un topic ajouté puis retiré dans le même tour n'est jamais envoyé
+        connection.log.clear()
+        client.remove_subscription("N/s1/battery/0/Soc", callback)
+        client.remove_subscription("N/s1/battery/1/Soc", callback)
+        client.add_subscription("N/s1/battery/3/Soc", callback)
+        client.remove_subscription("N/s1/battery/3/Soc", callback)
+        await asyncio.sleep(0)
+        assert connection.log == [("unsubscribe", ["N/s1/battery/0/Soc", "N/s1/battery/1/Soc"])]
+
+        # Un retrait suivi d'un nouvel ajout du même topic ne produit aucun paquet
+        connection.log.clear()
+        client.remove_subscription("N/s1/battery/2/Soc", callback)
+        client.add_subscription("N/s1/battery/2/Soc", callback)
+        await asyncio.sleep(0)
+        assert connection.log == []
+        await client.async_stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,89 @@
+import pytest
+
+from cerbo_gx.topic_router import TopicRouter
+
+
+def test_exact_match():
+    router = TopicRouter()
+    router.add("N/site/system/0/Dc/Battery/Voltage", "voltage")
+    assert router.match("N/site/system/0/Dc/Battery/Voltage") == ("voltage",)
+    assert router.match("N/site/system/0/Dc/Battery/Current") == ()
+
+
+def test_single_level_wildcard():
+    router = TopicRouter()
+    router.add("N/site/battery/+/Soc", "soc")
+    assert router.match("N/site/battery/512/Soc") == ("soc",)
+    assert router.match("N/site/battery/512/Dc/0/Voltage") == ()
+    # `+` couvre exactement un niveau
+    assert router.match("N/site/battery/Soc") == ()
+    assert router.match("N/site/battery/1/2/Soc") == ()
+
+
+def test_multi_level_wildcard():
+    router = TopicRouter()
+    router.add("N/site/battery/#", "all")
+    assert router.match("N/site/battery/512/Soc") == ("all",)
+    assert router.match("N/site/battery/512/Dc/0/Voltage") == ("all",)
+    # `a/#` correspond aussi au topic parent `a`
+    assert router.match("N/site/battery") == ("all",)
+    assert router.match("N/site/solarcharger/1/Yield") == ()
+
+
+def test_overlapping_patterns_all_match():
+    router = TopicRouter()
+    router.add("N/site/battery/512/Soc", "exact")
+    router.add("N/site/battery/+/Soc", "single")
+    router.add("N/site/#", "multi")
+    assert sorted(router.match("N/site/battery/512/Soc")) == ["exact", "multi", "single"]
+    assert sorted(router.match("N/site/battery/513/Soc")) == ["multi", "single"]
+
+
+def test_cache_invalidated_on_add_and_remove():
+    router = TopicRouter()
+    topic = "N/site/system/0/Relay/0/State"
+    assert router.match(topic) == ()
+    router.add("N/site/system/0/Relay/+/State", "relay")
+    assert router.match(topic) == ("relay",)
+    router.add(topic, "exact")
+    assert sorted(router.match(topic)) == ["exact", "relay"]
+    router.remove("N/site/system/0/Relay/+/State", "relay")
+    assert router.match(topic) == ("exact",)
+    router.remove(topic, "exact")
+    assert router.match(topic) == ()
+
+
+def test_same_pattern_several_callbacks():
+    router = TopicRouter()
+    router.add("N/site/a", "first")
+    router.add("N/site/a", "second")
+    router.remove("N/site/a", "first")
+    assert router.match("N/site/a") == ("second",)
+    assert router.has_pattern("N/site/a")
+
+
+def test_remove_prunes_empty_branches():
+    router = TopicRouter()
+    router.add("N/site/a/b/c", "deep")
+    router.add("N/site/a", "shallow")
+    router.remove("N/site/a/b/c", "deep")
+    assert not router.has_pattern("N/site/a/b/c")
+    assert router.patterns() == ["N/site/a"]
+    router.remove("N/site/a", "shallow")
+    assert router.patterns() == []
+
+
+def test_remove_unknown_raises():
+    router = TopicRouter()
+    router.add("N/site/a", "cb")
+    with pytest.raises(ValueError):
+        router.remove("N/site/b", "cb")
+    with pytest.raises(ValueError):
+        router.remove("N/site/a", "other")
+
+
+def test_patterns_lists_registered_patterns():
+    router = TopicRouter()
+    for pattern in ("N/site/battery/+/Soc", "N/site/#", "N/site/system/0/Dc/Pv/Power"):
+        router.add(pattern, pattern)
+    assert sorted(router.patterns()) == sorted(["N/site/battery/+/Soc", "N/site/#", "N/site/system/0/Dc/Pv/Power"])
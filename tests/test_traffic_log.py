@@ -0,0 +1,102 @@
+import asyncio
+import os
+
+import pytest
+
+from cerbo_gx.traffic_log import MAGIC, TrafficLogReader, TrafficRecorder, async_replay
+
+
+def record_messages(path, messages, **kwargs):
+    async def run():
+        recorder = TrafficRecorder(str(path), asyncio.get_running_loop(), **kwargs)
+        await recorder.async_open()
+        for topic, payload in messages:
+            recorder.record(topic, payload)
+        await recorder.async_close()
+        return recorder
+
+    return asyncio.run(run())
+
+
+def read(path):
+    return [(topic, bytes(payload)) for _, topic, payload in TrafficLogReader(str(path))]
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "site.traffic"
+    messages = [
+        ("N/site/system/0/Dc/Battery/Voltage", b'{"value": 52.1}'),
+        ("N/site/system/0/Dc/Battery/Current", b'{"value": -3.2}'),
+        ("N/site/system/0/Dc/Battery/Voltage", b'{"value": 52.2}'),
+        ("N/site/system/0/Relay/0/State", b""),
+    ]
+    record_messages(path, messages)
+    assert read(path) == messages
+
+
+def test_reopen_appends_session(tmp_path):
+    path = tmp_path / "site.traffic"
+    record_messages(path, [("N/site/a", b"1"), ("N/site/b", b"2")])
+    # Nouvelle session : la table des topics repart de zéro (enregistrement RESET)
+    record_messages(path, [("N/site/b", b"3")])
+    assert read(path) == [("N/site/a", b"1"), ("N/site/b", b"2"), ("N/site/b", b"3")]
+
+
+def test_truncated_tail_is_ignored(tmp_path):
+    path = tmp_path / "site.traffic"
+    record_messages(path, [("N/site/a", b"first"), ("N/site/a", b"second")])
+    size = os.path.getsize(path)
+    with open(path, "r+b") as file:
+        file.truncate(size - 3)
+    assert read(path) == [("N/site/a", b"first")]
+
+
+def test_not_a_traffic_log(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"not a traffic log at all")
+    with pytest.raises(ValueError):
+        read(path)
+
+
+def test_replay_rewrites_topics(tmp_path):
+    path = tmp_path / "site.traffic"
+    record_messages(path, [("N/old/a", b"1"), ("N/old/b", b"2")])
+    received = []
+
+    async def run():
+        return await async_replay(
+            str(path), lambda topic, payload: received.append((topic, bytes(payload))), speed=0,
+            topic_rewrite=lambda topic: topic.replace("N/old/", "N/new/"),
+        )
+
+    assert asyncio.run(run()) == 2
+    assert received == [("N/new/a", b"1"), ("N/new/b", b"2")]
+
+
+def test_rotation_keeps_each_file_readable(tmp_path):
+    path = tmp_path / "site.traffic"
+    messages = [(f"N/site/path/{i % 5}", b"x" * 100) for i in range(50)]
+    recorder = record_messages(path, messages, max_size=1000)
+    assert recorder.rotations >= 1
+    rotated = tmp_path / "site.traffic.1"
+    assert rotated.exists()
+    assert os.path.getsize(path) <= 1000 + 200
+    # Chaque journal commence par l'en-tête et déclare ses propres topics
+    assert path.read_bytes().startswith(MAGIC)
+    assert rotated.read_bytes().startswith(MAGIC)
+    current = read(path)
+    assert current and current == messages[-len(current):]
+    previous = read(rotated)
+    assert previous and previous == messages[-len(current) - len(previous):-len(current)]
+
+
+def test_buffer_bounded_while_write_in_flight(tmp_path):
+    path = tmp_path / "site.traffic"
+    messages = [("N/site/a", b"y" * 100) for _ in range(100)]
+    # Le premier bloc part dans l'exécuteur ; pendant le même tour de boucle, le
+    # tampon plein ne grossit plus et les messages suivants sont ignorés
+    recorder = record_messages(path, messages, max_buffer=1000)
+    written = read(path)
+    assert len(written) < len(messages)
+    assert written == messages[:len(written)]
+    assert recorder.dropped == len(messages) - len(written)